@@ -0,0 +1,72 @@
+"""
+Бенчмарк разбора страницы username Fragment: быстрый поиск span статуса (regex, чтение до статуса)
+против прежнего пути (всё тело + BeautifulSoup). Сравнивает время и пик памяти (tracemalloc).
+
+Запуск:
+    python bench_fragment_parse.py --bids 2000 --rounds 20
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+for path in (ROOT, ROOT / "bot", ROOT / "tests"):
+    sys.path.insert(0, str(path))
+
+# Обязательные переменные config.py (значения для бенчмарка не важны)
+os.environ.setdefault("GENERATED_USERNAME_COUNT", "10")
+os.environ.setdefault("GEN_ATTEMPTS", "3")
+os.environ.setdefault("GEN_TIMEOUT", "30")
+
+from services import name_check  # noqa: E402
+from fragment_pages import FakeResponse, fragment_page  # noqa: E402  Та же синтетическая страница, что в тестах
+
+
+async def regex_path(body: bytes) -> str:
+    return await name_check.analyze_username_response(FakeResponse(body), "zenmind")
+
+
+async def soup_path(body: bytes) -> str:
+    html = b"".join([chunk async for chunk in FakeResponse(body).content.iter_chunked(8192)]).decode()
+    return await name_check.analyze_username_page(html, "zenmind")
+
+
+def measure(parse, body: bytes, rounds: int) -> tuple[str, float, int]:
+    """(статус, среднее время в мс, пик памяти одного разбора в байтах)."""
+    status = asyncio.run(parse(body))
+
+    started_at = time.perf_counter()
+    for _ in range(rounds):
+        asyncio.run(parse(body))
+    elapsed = (time.perf_counter() - started_at) / rounds * 1000
+
+    tracemalloc.start()
+    asyncio.run(parse(body))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return status, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк разбора страницы Fragment")
+    parser.add_argument("--bids", type=int, default=2000, help="Строк таблицы ставок после шапки (размер страницы)")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    body = fragment_page("zenmind", "sold", "Sold", bids=args.bids)
+    print(f"Страница: {len(body) / 1024:.0f} КБ, повторов: {args.rounds}")
+
+    results = {name: measure(parse, body, args.rounds) for name, parse in (("regex", regex_path), ("BeautifulSoup", soup_path))}
+    for name, (status, elapsed, peak) in results.items():
+        print(f"{name:>13}: {status}, {elapsed:.2f} мс, пик памяти {peak / 1024:.0f} КБ")
+
+    (_, regex_time, regex_peak), (_, soup_time, soup_peak) = results.values()
+    print(f"Ускорение ×{soup_time / regex_time:.0f}, память ×{soup_peak / regex_peak:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,42 @@ MODEL_BRAND= os.getenv("MODEL_BRAND")
 MAX_TOKENS_BRAND = int(os.getenv("MAX_TOKENS_BRAND", 400))
 TEMPERATURE_BRAND = float(os.getenv("TEMPERATURE_BRAND", "0.7"))
 
+# Потоковый вывод этапов проекта: сообщение "⏳ ..." редактируется по мере генерации ответа
+BRAND_STREAMING = os.getenv("BRAND_STREAMING", "false").lower() == "true"
+BRAND_STREAM_EDIT_INTERVAL = float(os.getenv("BRAND_STREAM_EDIT_INTERVAL", 1.5))  # Не чаще одной правки за N сек (лимиты Telegram)
+
+# Предзагрузка следующего этапа проекта для каждого показанного варианта, пока пользователь выбирает
+BRAND_PREFETCH = os.getenv("BRAND_PREFETCH", "false").lower() == "true"
+BRAND_PREFETCH_PER_USER = int(os.getenv("BRAND_PREFETCH_PER_USER", 3))  # Предзагрузок на пользователя
+BRAND_PREFETCH_GLOBAL = int(os.getenv("BRAND_PREFETCH_GLOBAL", 30))  # Одновременных предзагрузок на процесс
+BRAND_PREFETCH_TTL = float(os.getenv("BRAND_PREFETCH_TTL", 600))  # Через сколько секунд забывать невыбранные
+
+# Запас вариантов этапа: за один запрос генерируется BRAND_OPTIONS_BATCH вариантов, показываются по 3,
+# остальные отдаются по "🔄 Еще 3 варианта" без обращения к AI
+BRAND_OPTIONS_BUFFER = os.getenv("BRAND_OPTIONS_BUFFER", "false").lower() == "true"
+BRAND_OPTIONS_BATCH = int(os.getenv("BRAND_OPTIONS_BATCH", 9))
+BRAND_OPTIONS_REFILL_AT = int(os.getenv("BRAND_OPTIONS_REFILL_AT", 3))  # Дозапрос в фоне, когда в запасе осталось столько или меньше
+BRAND_OPTIONS_MAX_TOKENS = int(os.getenv("BRAND_OPTIONS_MAX_TOKENS", 1000))  # Вместо MAX_TOKENS_BRAND для запроса с запасом
+
+# Структурированный ответ этапов в JSON вместо разбора текста регулярными выражениями
+BRAND_JSON_OUTPUT = os.getenv("BRAND_JSON_OUTPUT", "false").lower() == "true"
+BRAND_JSON_MODE = os.getenv("BRAND_JSON_MODE", "json_object")  # json_schema / json_object / prompt (только инструкция в промпте)
+BRAND_JSON_REPAIR = os.getenv("BRAND_JSON_REPAIR", "true").lower() == "true"  # Переспросить, если ответ не разобрался
+
+# Компактные промпты этапов: выборы прошлых этапов — текстом без HTML и repr словаря, длинный ввод обрезается
+BRAND_COMPACT_PROMPTS = os.getenv("BRAND_COMPACT_PROMPTS", "true").lower() == "true"
+BRAND_PROMPT_FIELDS_MAX_TOKENS = int(os.getenv("BRAND_PROMPT_FIELDS_MAX_TOKENS", 400))  # Бюджет подставляемых полей (без текста шаблона)
+BRAND_CONTEXT_MAX_TOKENS = int(os.getenv("BRAND_CONTEXT_MAX_TOKENS", 200))  # Исходная мысль пользователя
+BRAND_CHOICE_MAX_TOKENS = int(os.getenv("BRAND_CHOICE_MAX_TOKENS", 60))  # Выбор прошлого этапа (в т.ч. свой вариант)
+PROMPT_CHARS_PER_TOKEN = float(os.getenv("PROMPT_CHARS_PER_TOKEN", 3))  # Оценка длины в токенах без токенизатора
+
+# Общий асинхронный LLM-шлюз (один пул соединений на всё приложение)
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))  # Таймаут запроса к LLM по умолчанию (сек)
+LLM_TIMEOUT_NAME = float(os.getenv("LLM_TIMEOUT_NAME", "15"))  # Таймаут запроса на генерацию username (сек)
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", 20))  # Максимум одновременных соединений к LLM
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", 10))  # Сколько соединений держать открытыми
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 1))  # Повторы запроса внутри клиента
+
 # Максимальное количество символов в контексте
 MAX_CONTEXT_LENGTH = 200
 
@@ -26,9 +62,123 @@ GEN_ATTEMPTS = int(os.getenv("GEN_ATTEMPTS"))
 # Максимальное общее время ожидания генерации (в секундах)
 GEN_TIMEOUT = int(os.getenv("GEN_TIMEOUT"))  # Преобразуем в число
 
+# Спекулятивная генерация: сколько попыток генерации держать одновременно (1 — строго последовательно)
+GEN_SPECULATIVE_FANOUT = int(os.getenv("GEN_SPECULATIVE_FANOUT", 1))
+
+# Потолок расходов: максимум запросов к LLM за одну генерацию (не больше GEN_ATTEMPTS)
+GEN_MAX_LLM_CALLS = int(os.getenv("GEN_MAX_LLM_CALLS", GEN_ATTEMPTS))
+
+# Потоковый режим: проверка username через Fragment начинается, пока LLM ещё дописывает список
+GEN_STREAMING = os.getenv("GEN_STREAMING", "false").lower() == "true"
+
+# Прогрессивная выдача: клавиатура отправляется с первым свободным username и дополняется по мере проверки
+PROGRESSIVE_DELIVERY = os.getenv("PROGRESSIVE_DELIVERY", "false").lower() == "true"
+
+# Статусы, с которыми username точно не получится занять — повторно их не проверяем
+TAKEN_STATUSES = ("Занято", "Продано")
+
+# Фильтр Блума занятых username (заполняется из БД при старте)
+TAKEN_FILTER_ENABLED = os.getenv("TAKEN_FILTER_ENABLED", "true").lower() == "true"
+TAKEN_FILTER_CAPACITY = int(os.getenv("TAKEN_FILTER_CAPACITY", 1000000))  # Ожидаемое число записей
+TAKEN_FILTER_ERROR_RATE = float(os.getenv("TAKEN_FILTER_ERROR_RATE", 0.01))  # Доля ложных срабатываний
+
+# Пре-проверка по БД: username, записанные как "Занято"/"Продано" не раньше N дней назад,
+# отбрасываются без запроса к Fragment (0 — отключить)
+DB_STATUS_FRESHNESS_DAYS = int(os.getenv("DB_STATUS_FRESHNESS_DAYS", 30))
+# В потоковом режиме имена копятся в пачку (до N штук или T секунд) — один запрос к БД на пачку
+DB_PRECHECK_BATCH_SIZE = int(os.getenv("DB_PRECHECK_BATCH_SIZE", 5))
+DB_PRECHECK_BATCH_WINDOW = float(os.getenv("DB_PRECHECK_BATCH_WINDOW", 0.05))
+
+# Фильтр занятых строится только из свежих записей (как и пре-проверка по БД) и периодически перестраивается,
+# чтобы устаревшие "Занято"/"Продано" снова уходили на проверку в Fragment
+TAKEN_FILTER_WINDOW_DAYS = int(os.getenv("TAKEN_FILTER_WINDOW_DAYS", DB_STATUS_FRESHNESS_DAYS or 30))
+TAKEN_FILTER_REBUILD_INTERVAL = float(os.getenv("TAKEN_FILTER_REBUILD_INTERVAL", 6 * 3600))  # Сек
+
+# Инвентарь заранее найденных свободных username по частым категориям и стилям
+INVENTORY_ENABLED = os.getenv("INVENTORY_ENABLED", "false").lower() == "true"
+INVENTORY_TOP_CATEGORIES = int(os.getenv("INVENTORY_TOP_CATEGORIES", 5))  # Сколько самых частых категорий держать
+INVENTORY_TARGET_SIZE = int(os.getenv("INVENTORY_TARGET_SIZE", 6))  # Сколько имён держать на (категория, стиль)
+INVENTORY_REFILL_INTERVAL = float(os.getenv("INVENTORY_REFILL_INTERVAL", 30))  # Пауза между пополнениями (сек)
+INVENTORY_CATEGORY_REFRESH = float(os.getenv("INVENTORY_CATEGORY_REFRESH", 3600))  # Как часто пересчитывать частые категории (сек)
+
+# Кэш результатов для похожих контекстов ("бот для медитации" ≈ "медитация бот")
+CONTEXT_CACHE_ENABLED = os.getenv("CONTEXT_CACHE_ENABLED", "true").lower() == "true"
+CONTEXT_CACHE_SIZE = int(os.getenv("CONTEXT_CACHE_SIZE", 1000))  # Сколько последних контекстов хранить
+CONTEXT_CACHE_TTL = float(os.getenv("CONTEXT_CACHE_TTL", 1800))  # Время жизни записи (сек)
+CONTEXT_CACHE_THRESHOLD = float(os.getenv("CONTEXT_CACHE_THRESHOLD", 0.8))  # Минимальное сходство (≈ Jaccard)
+CONTEXT_CACHE_NUM_HASHES = int(os.getenv("CONTEXT_CACHE_NUM_HASHES", 64))  # Длина MinHash-подписи
+CONTEXT_CACHE_SHINGLE_SIZE = int(os.getenv("CONTEXT_CACHE_SHINGLE_SIZE", 3))  # Длина символьных n-грамм
+
+# Адаптивный размер запроса к LLM по наблюдаемой доле свободных username (категория × стиль)
+ADAPTIVE_BATCH_ENABLED = os.getenv("ADAPTIVE_BATCH_ENABLED", "false").lower() == "true"
+ADAPTIVE_BATCH_CONFIDENCE = float(os.getenv("ADAPTIVE_BATCH_CONFIDENCE", 0.8))  # Вероятность, что одной попытки хватит
+ADAPTIVE_BATCH_MIN_SIZE = int(os.getenv("ADAPTIVE_BATCH_MIN_SIZE", 5))  # Минимум username в запросе
+ADAPTIVE_BATCH_MAX_TOKENS = int(os.getenv("ADAPTIVE_BATCH_MAX_TOKENS", 300))  # Потолок токенов ответа
+ADAPTIVE_BATCH_DEFAULT_RATE = float(os.getenv("ADAPTIVE_BATCH_DEFAULT_RATE", 0.3))  # Доля свободных, пока нет статистики
+ADAPTIVE_BATCH_MIN_RATE = float(os.getenv("ADAPTIVE_BATCH_MIN_RATE", 0.05))  # Нижняя граница оценки
+ADAPTIVE_BATCH_PRIOR_WEIGHT = float(os.getenv("ADAPTIVE_BATCH_PRIOR_WEIGHT", 20))  # Вес априорной оценки (в проверках)
+ADAPTIVE_BATCH_WINDOW_DAYS = int(os.getenv("ADAPTIVE_BATCH_WINDOW_DAYS", 30))  # За сколько дней считать статистику
+ADAPTIVE_BATCH_REFRESH_INTERVAL = float(os.getenv("ADAPTIVE_BATCH_REFRESH_INTERVAL", 600))  # Период пересчёта (сек)
+TOKENS_PER_USERNAME = int(os.getenv("TOKENS_PER_USERNAME", 6))  # Примерно токенов на один username в ответе
+TOKENS_RESPONSE_OVERHEAD = int(os.getenv("TOKENS_RESPONSE_OVERHEAD", 10))  # Токены на строку категории
+
+# Исключения сессии: username, уже показанные или проверенные в прошлых раундах "🔄 Еще 3 варианта"
+SESSION_EXCLUSIONS_MAX = int(os.getenv("SESSION_EXCLUSIONS_MAX", 300))  # Сколько имён хранить в FSM
+PROMPT_EXCLUSIONS_MAX = int(os.getenv("PROMPT_EXCLUSIONS_MAX", 30))  # Сколько последних из них передавать в промпт
+
+# Итеративный промпт: следующая попытка видит уже проверенные в этом запуске имена и признаки занятых
+GEN_PROMPT_FEEDBACK = os.getenv("GEN_PROMPT_FEEDBACK", "false").lower() == "true"
+TAKEN_PATTERN_MIN_COUNT = int(os.getenv("TAKEN_PATTERN_MIN_COUNT", 3))  # Сколько занятых нужно, чтобы искать признаки
+TAKEN_PATTERN_MIN_SHARE = float(os.getenv("TAKEN_PATTERN_MIN_SHARE", 0.6))  # Доля занятых с признаком
+TAKEN_PATTERN_MIN_LIFT = float(os.getenv("TAKEN_PATTERN_MIN_LIFT", 0.3))  # На сколько доля среди занятых выше, чем среди свободных
+
 # Прерывание после нескольких пустых ответов
 MAX_EMPTY_RESPONSES = 3
 
+# Бэкенды проверки username: первый — основной, второй — подстраховка (хеджирование)
+AVAILABILITY_BACKENDS = os.getenv("AVAILABILITY_BACKENDS", "fragment,telegram")
+AVAILABILITY_HEDGING = os.getenv("AVAILABILITY_HEDGING", "true").lower() == "true"
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", 2.0))  # Задержка до подстраховки, пока нет статистики (сек)
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", 20))  # Сколько замеров нужно для расчёта p90
+HEDGE_LATENCY_WINDOW = int(os.getenv("HEDGE_LATENCY_WINDOW", 200))  # По скольким последним запросам считать p90
+
+# Адреса бэкендов (для офлайн-проверки указываются адреса локальной заглушки, см. services/availability_stub.py)
+FRAGMENT_BASE_URL = os.getenv("FRAGMENT_BASE_URL", "https://fragment.com").rstrip("/")
+TELEGRAM_BASE_URL = os.getenv("TELEGRAM_BASE_URL", "https://t.me").rstrip("/")
+TELEGRAM_RATE = float(os.getenv("TELEGRAM_RATE", 5))  # Скорость запросов к t.me (запросов/сек)
+TELEGRAM_MAX_CONCURRENCY = int(os.getenv("TELEGRAM_MAX_CONCURRENCY", 5))  # Одновременных запросов к t.me
+TELEGRAM_RATE_MIN = float(os.getenv("TELEGRAM_RATE_MIN", 0.5))  # Нижняя граница скорости t.me
+TELEGRAM_BURST = int(os.getenv("TELEGRAM_BURST", 5))  # Размер "ведра" токенов t.me
+TELEGRAM_RATE_INCREASE = float(os.getenv("TELEGRAM_RATE_INCREASE", 0.1))  # +N запр/сек после успешного ответа t.me
+TELEGRAM_RATE_DECREASE = float(os.getenv("TELEGRAM_RATE_DECREASE", 0.5))  # Множитель при 429/5xx/таймауте t.me
+
+# Общая HTTP-сессия для проверок Fragment
+FRAGMENT_TIMEOUT = float(os.getenv("FRAGMENT_TIMEOUT", 10))  # Общий таймаут одного запроса (сек)
+FRAGMENT_MAX_CONNECTIONS = int(os.getenv("FRAGMENT_MAX_CONNECTIONS", 100))  # Всего соединений в пуле
+FRAGMENT_LIMIT_PER_HOST = int(os.getenv("FRAGMENT_LIMIT_PER_HOST", 20))  # Соединений к одному хосту
+FRAGMENT_DNS_CACHE_TTL = int(os.getenv("FRAGMENT_DNS_CACHE_TTL", 600))  # Кэш DNS (сек)
+FRAGMENT_KEEPALIVE_TIMEOUT = float(os.getenv("FRAGMENT_KEEPALIVE_TIMEOUT", 60))  # Сколько держать соединение открытым (сек)
+
+# Проверка по редиректу без скачивания страницы (false — старый режим с allow_redirects=True)
+FRAGMENT_REDIRECT_PROBE = os.getenv("FRAGMENT_REDIRECT_PROBE", "true").lower() == "true"
+FRAGMENT_CHUNK_SIZE = int(os.getenv("FRAGMENT_CHUNK_SIZE", 8192))  # Размер куска при чтении страницы (байт)
+FRAGMENT_MAX_BODY_BYTES = int(os.getenv("FRAGMENT_MAX_BODY_BYTES", 262144))  # Сколько максимум читать в поисках статуса
+
+# Адаптивный ограничитель запросов к Fragment (token bucket + AIMD)
+FRAGMENT_RATE = float(os.getenv("FRAGMENT_RATE", 10))  # Стартовая скорость (запросов/сек)
+FRAGMENT_RATE_MIN = float(os.getenv("FRAGMENT_RATE_MIN", 1))  # Нижняя граница скорости
+FRAGMENT_RATE_MAX = float(os.getenv("FRAGMENT_RATE_MAX", 30))  # Верхняя граница скорости
+FRAGMENT_BURST = int(os.getenv("FRAGMENT_BURST", 10))  # Размер "ведра" токенов
+FRAGMENT_MAX_CONCURRENCY = int(os.getenv("FRAGMENT_MAX_CONCURRENCY", 10))  # Одновременных запросов на процесс
+FRAGMENT_RATE_INCREASE = float(os.getenv("FRAGMENT_RATE_INCREASE", 0.2))  # +N запр/сек после успешного ответа
+FRAGMENT_RATE_DECREASE = float(os.getenv("FRAGMENT_RATE_DECREASE", 0.5))  # Множитель при 429/5xx/таймауте
+
+# Кэш статусов username перед Fragment (TTL в секундах, 0 — не кэшировать)
+AVAILABILITY_CACHE_SIZE = int(os.getenv("AVAILABILITY_CACHE_SIZE", 10000))  # Максимум записей (LRU)
+AVAILABILITY_TTL_FREE = float(os.getenv("AVAILABILITY_TTL_FREE", 300))  # "Свободно" — короткий TTL, имя могут занять
+AVAILABILITY_TTL_FOR_SALE = float(os.getenv("AVAILABILITY_TTL_FOR_SALE", 3600))  # "Доступно для покупки"
+AVAILABILITY_TTL_TAKEN = float(os.getenv("AVAILABILITY_TTL_TAKEN", 86400))  # "Продано"/"Занято" — меняется редко
+
 # Параметр для интервала между запросами (например, 1 секунда) -- способ избежать flood control exceeded
 REQUEST_INTERVAL = 0.3
 
@@ -60,6 +210,12 @@ PROMPT_WITH_STYLE = (
     "Сначала укажи только одну категорию темы (например, 'бизнес'), затем  на следующей строке список username через запятую."
 )
 
+# Добавляется к промпту генерации, чтобы модель не повторяла уже проверенные имена
+PROMPT_EXCLUDE = "\nНе предлагай эти username (уже проверены): {usernames}."
+
+# Признаки занятых имён для итеративного промпта (GEN_PROMPT_FEEDBACK)
+PROMPT_TAKEN_PATTERNS = "\nЗанятыми оказались в основном {patterns} — избегай таких."
+
 STYLE_DESCRIPTIONS = {
     "epic": "мощные, звучные, внушительные username, которые вызывают ощущение силы и значимости",
     "strict": "строгие, лаконичные, солидные username, которые выглядят профессионально",
@@ -6,5 +6,17 @@ CREATE TABLE IF NOT EXISTS generated_usernames (
     context TEXT NOT NULL, -- исходный запрос пользователя.
     style TEXT DEFAULT NULL, -- добавляем новый столбец style (по умолчанию NULL)
     llm TEXT NOT NULL, -- используемая LLM
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP -- время генерации.
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, -- время генерации.
+    checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP -- время последней проверки статуса (обновляется при повторной проверке).
 );
+
+-- checked_at для таблиц, созданных до его появления: старые статусы считаются проверенными в момент генерации
+ALTER TABLE generated_usernames ADD COLUMN IF NOT EXISTS checked_at TIMESTAMP;
+UPDATE generated_usernames SET checked_at = created_at WHERE checked_at IS NULL;
+ALTER TABLE generated_usernames ALTER COLUMN checked_at SET DEFAULT CURRENT_TIMESTAMP;
+
+-- индекс для пакетной пре-проверки статусов без учёта регистра (WHERE lower(username) = ANY(...))
+CREATE INDEX IF NOT EXISTS idx_generated_usernames_lower_username ON generated_usernames (lower(username));
+
+-- индекс для поиска категории по тому же контексту (WHERE lower(context) = lower($1)) в инвентаре и адаптивном запросе
+CREATE INDEX IF NOT EXISTS idx_generated_usernames_lower_context ON generated_usernames (lower(context));
@@ -1,6 +1,7 @@
 import asyncpg
 import os
 import logging
+from functools import lru_cache
 from dotenv import load_dotenv
 
 # Загружаем переменные окружения
@@ -27,6 +28,18 @@ logging.info(f"    PASSWORD = {'✅' if DB_CONFIG['password'] else '❌ НЕ Н
 # Глобальный пул соединений
 pool = None
 
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+@lru_cache(maxsize=None)
+def load_sql(filename: str) -> str | None:
+    """Читает SQL-запрос из файла рядом с модулем (один раз за процесс). Если файла нет — None."""
+    path = os.path.join(BASE_DIR, filename)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as file:
+        return file.read()
+
 
 async def init_db_pool():
     """Создаёт пул соединений к БД при запуске приложения."""
@@ -98,22 +111,19 @@ async def init_db():
 
 async def save_username_to_db(username: str, status: str, context: str, category: str, style: str = "None",
                               llm: str = "None"):
-    """Сохраняет username в базу данных."""
+    """Сохраняет username в базу данных; повторная проверка того же username обновляет его статус и checked_at."""
     conn = await get_connection()
     if conn is None:
         logging.error("❌ Невозможно выполнить save_username_to_db — соединение не получено.")
         return
 
-    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    INSERT_SQL_PATH = os.path.join(BASE_DIR, "insert_username.sql")
+    INSERT_SQL = load_sql("insert_username.sql")
 
-    if not os.path.exists(INSERT_SQL_PATH):
+    if INSERT_SQL is None:
         logging.error("❌ INSERT_SQL не загружен! Файл insert_username.sql отсутствует.")
+        await pool.release(conn)
         return
 
-    with open(INSERT_SQL_PATH, "r", encoding="utf-8") as file:
-        INSERT_SQL = file.read()
-
     try:
         await conn.execute(INSERT_SQL, username, status, category, context, style, llm)
         logging.info(f"✅ Добавлен в БД: @{username} | {status} | {category} | {context} | {style} | {llm}")
@@ -121,3 +131,126 @@ async def save_username_to_db(username: str, status: str, context: str, category
         logging.error(f"❌ Ошибка при сохранении в БД: {e}")
     finally:
         await pool.release(conn)
+
+
+async def fetch_username_statuses(usernames: list[str], freshness_days: int) -> dict[str, str]:
+    """
+    Одним запросом (WHERE lower(username) = ANY($1)) возвращает последний записанный статус каждого username,
+    проверенного не раньше чем `freshness_days` дней назад.
+    Ключ словаря — username в нижнем регистре.
+    """
+    if not usernames:
+        return {}
+
+    conn = await get_connection()
+    if conn is None:
+        logging.error("❌ Невозможно выполнить fetch_username_statuses — соединение не получено.")
+        return {}
+
+    SELECT_SQL = load_sql("select_username_statuses.sql")
+
+    if SELECT_SQL is None:
+        logging.error("❌ SELECT_SQL не загружен! Файл select_username_statuses.sql отсутствует.")
+        await pool.release(conn)
+        return {}
+
+    try:
+        rows = await conn.fetch(SELECT_SQL, [username.lower() for username in usernames], freshness_days)
+        return {row["username"]: row["status"] for row in rows}
+    except Exception as e:
+        logging.error(f"❌ Ошибка при чтении статусов из БД: {e}")
+        return {}
+    finally:
+        await pool.release(conn)
+
+
+async def fetch_taken_usernames(window_days: int):
+    """
+    Асинхронно отдаёт username со статусом "Занято"/"Продано", проверенные за последние `window_days` дней
+    (курсором, без загрузки таблицы в память).
+    """
+    conn = await get_connection()
+    if conn is None:
+        logging.error("❌ Невозможно выполнить fetch_taken_usernames — соединение не получено.")
+        return
+
+    SELECT_SQL = load_sql("select_taken_usernames.sql")
+
+    try:
+        if SELECT_SQL is None:
+            logging.error("❌ SELECT_SQL не загружен! Файл select_taken_usernames.sql отсутствует.")
+            return
+
+        async with conn.transaction():
+            async for row in conn.cursor(SELECT_SQL, window_days):
+                yield row["username"]
+    finally:
+        await pool.release(conn)
+
+
+async def fetch_top_categories(limit: int) -> list[str]:
+    """Возвращает самые частые категории из generated_usernames (без служебных и инвентарных записей)."""
+    conn = await get_connection()
+    if conn is None:
+        logging.error("❌ Невозможно выполнить fetch_top_categories — соединение не получено.")
+        return []
+
+    SELECT_SQL = load_sql("select_top_categories.sql")
+
+    try:
+        if SELECT_SQL is None:
+            logging.error("❌ SELECT_SQL не загружен! Файл select_top_categories.sql отсутствует.")
+            return []
+
+        rows = await conn.fetch(SELECT_SQL, limit)
+        return [row["category"] for row in rows]
+    except Exception as e:
+        logging.error(f"❌ Ошибка при чтении категорий из БД: {e}")
+        return []
+    finally:
+        await pool.release(conn)
+
+
+async def fetch_context_category(context: str) -> str | None:
+    """Возвращает категорию, которую LLM чаще всего давала этому же контексту (без учёта регистра)."""
+    conn = await get_connection()
+    if conn is None:
+        logging.error("❌ Невозможно выполнить fetch_context_category — соединение не получено.")
+        return None
+
+    SELECT_SQL = load_sql("select_context_category.sql")
+
+    try:
+        if SELECT_SQL is None:
+            logging.error("❌ SELECT_SQL не загружен! Файл select_context_category.sql отсутствует.")
+            return None
+
+        return await conn.fetchval(SELECT_SQL, context)
+    except Exception as e:
+        logging.error(f"❌ Ошибка при чтении категории контекста из БД: {e}")
+        return None
+    finally:
+        await pool.release(conn)
+
+
+async def fetch_free_rates(window_days: int) -> list[tuple[str | None, str | None, int, int]]:
+    """Возвращает (категория, стиль, свободных, всего) по проверкам за последние `window_days` дней."""
+    conn = await get_connection()
+    if conn is None:
+        logging.error("❌ Невозможно выполнить fetch_free_rates — соединение не получено.")
+        return []
+
+    SELECT_SQL = load_sql("select_free_rates.sql")
+
+    try:
+        if SELECT_SQL is None:
+            logging.error("❌ SELECT_SQL не загружен! Файл select_free_rates.sql отсутствует.")
+            return []
+
+        rows = await conn.fetch(SELECT_SQL, window_days)
+        return [(row["category"], row["style"], row["free"], row["total"]) for row in rows]
+    except Exception as e:
+        logging.error(f"❌ Ошибка при чтении статистики свободных username из БД: {e}")
+        return []
+    finally:
+        await pool.release(conn)
@@ -1,3 +1,5 @@
 INSERT INTO generated_usernames (username, status, category, context, style, llm)
 VALUES ($1, $2, $3, $4, $5, $6)
-ON CONFLICT (username) DO NOTHING;
+ON CONFLICT (username) DO UPDATE
+SET status = EXCLUDED.status, checked_at = CURRENT_TIMESTAMP
+WHERE EXCLUDED.status <> 'Невозможно определить'; -- неудачная проверка не затирает известный статус
@@ -0,0 +1,8 @@
+SELECT category
+FROM generated_usernames
+WHERE lower(context) = lower($1)
+  AND category IS NOT NULL
+  AND category NOT IN ('Неизвестно', 'Этический отказ', 'Пользовательская проверка')
+GROUP BY category
+ORDER BY count(*) DESC
+LIMIT 1;
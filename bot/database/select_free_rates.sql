@@ -0,0 +1,7 @@
+SELECT category, style,
+       count(*) FILTER (WHERE status = 'Свободно') AS free,
+       count(*) AS total
+FROM generated_usernames
+WHERE created_at >= CURRENT_TIMESTAMP - ($1::int * INTERVAL '1 day')
+  AND category NOT IN ('Пользовательская проверка', 'Этический отказ')
+GROUP BY category, style;
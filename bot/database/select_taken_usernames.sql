@@ -0,0 +1,4 @@
+SELECT username
+FROM generated_usernames
+WHERE status IN ('Занято', 'Продано')
+  AND checked_at >= CURRENT_TIMESTAMP - ($1::int * INTERVAL '1 day');
@@ -0,0 +1,8 @@
+SELECT category, count(*) AS total
+FROM generated_usernames
+WHERE category IS NOT NULL
+  AND category NOT IN ('Неизвестно', 'Этический отказ', 'Пользовательская проверка')
+  AND context NOT LIKE '[inventory]%'
+GROUP BY category
+ORDER BY total DESC
+LIMIT $1;
@@ -0,0 +1,5 @@
+SELECT DISTINCT ON (lower(username)) lower(username) AS username, status
+FROM generated_usernames
+WHERE lower(username) = ANY($1::text[])
+  AND checked_at >= CURRENT_TIMESTAMP - ($2::int * INTERVAL '1 day')
+ORDER BY lower(username), checked_at DESC;
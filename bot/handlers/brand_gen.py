@@ -1,4 +1,5 @@
 import logging
+import time
 
 from aiogram import Router, types
 from aiogram.fsm.context import FSMContext
@@ -6,10 +7,251 @@ from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 
 from bot.handlers.states import BrandCreationStates
 from bot.handlers.main_menu import show_main_menu
-from bot.services.brand_ask_ai import get_parsed_response
+from bot.services.brand_ask_ai import (
+    get_parsed_response, get_parsed_response_with_usage, parse_ai_response, parse_stage_response, stream_ai
+)
+from bot.services.brand_prompts import (
+    build_stage1_prompt, build_stage2_prompt, build_stage3_prompt, build_profile_prompt, choice_short
+)
+from bot.services.brand_prefetch import brand_prefetch
+from bot.services import brand_buffer
+from bot.services.brand_buffer import OPTIONS_SHOWN, option_key, split_options
+
+import config
 
 brand_router = Router()
 
+STAGE_STATES = {
+    1: BrandCreationStates.waiting_for_stage1,
+    2: BrandCreationStates.waiting_for_stage2,
+    3: BrandCreationStates.waiting_for_stage3,
+}
+STAGE_NUMBERS = {stage_state.state: stage_number for stage_number, stage_state in STAGE_STATES.items()}
+
+STAGE_TEXTS = {
+    1: "<b>Этап 1: суть.</b>\n",
+    2: "<b>Этап 2: для кого?</b>\n",
+    3: "<b>Этап 3: формат</b>\n",
+}
+
+
+async def get_stage_response(send_message, placeholder: str, prompt: str, render, stage: str,
+                             user_id: int | None = None, max_tokens: int | None = None) -> tuple[dict, types.Message | None]:
+    """
+    Отправляет заглушку "⏳ ..." и получает разобранный ответ AI для этапа (`stage` — для статистики разбора).
+    Если ответ на этот промпт уже предзагружен (BRAND_PREFETCH), берёт его.
+    В потоковом режиме (BRAND_STREAMING) заглушка редактируется по мере генерации:
+    `render(parsed)` строит текст из уже разобранной части ответа.
+    Возвращает ответ и сообщение, в которое потом добавляются кнопки (None — без потокового режима).
+    """
+    if config.BRAND_PREFETCH and user_id is not None:
+        task = brand_prefetch.take(user_id, prompt)
+        if task is not None:
+            try:
+                if not task.done():
+                    await send_message(placeholder)  # Предзагрузка ещё идёт — ждём её, а не новый запрос
+                parsed, _ = await task
+                logging.info("🔮 Ответ этапа взят из предзагрузки.")
+                return parsed, None
+            except Exception as e:
+                logging.error(f"❌ Предзагрузка этапа не удалась, запрашиваем заново: {e}")
+            finally:
+                brand_prefetch.log_stats()
+
+    if not config.BRAND_STREAMING:
+        await send_message(placeholder)
+        return await get_parsed_response(prompt, max_tokens, stage), None
+
+    message = await send_message(placeholder)
+    shown_text = placeholder
+    edited_at = 0.0
+    started_at = time.monotonic()
+    first_token_at = None
+    text = ""
+
+    try:
+        async for text in stream_ai(prompt, max_tokens, json_output=config.BRAND_JSON_OUTPUT):
+            if first_token_at is None:
+                first_token_at = time.monotonic()
+            # Правки не чаще BRAND_STREAM_EDIT_INTERVAL: у Telegram ограничение на частоту редактирования.
+            # Недописанный JSON (BRAND_JSON_OUTPUT) не разобрать — показываем только итог
+            if config.BRAND_JSON_OUTPUT or time.monotonic() - edited_at < config.BRAND_STREAM_EDIT_INTERVAL:
+                continue
+
+            partial_text = await render(parse_ai_response(text, partial=True))
+            if partial_text and partial_text != shown_text:
+                try:
+                    await message.edit_text(partial_text, parse_mode="HTML")
+                    shown_text = partial_text
+                except Exception as e:
+                    logging.warning(f"⚠️ Не удалось обновить сообщение по ходу генерации: {e}")
+                edited_at = time.monotonic()
+    except Exception as e:
+        logging.error(f"Ошибка при потоковом обращении к AI: {e}")
+
+    logging.info(f"Сырой ответ от AI (поток): {text}")
+    if first_token_at is not None:
+        logging.info(
+            f"⚡ Первый фрагмент через {first_token_at - started_at:.2f} сек, "
+            f"ответ целиком через {time.monotonic() - started_at:.2f} сек"
+        )
+
+    parsed, _ = await parse_stage_response(text, stage, max_tokens=max_tokens)
+    logging.info(f"Парсированный ответ: {parsed}")
+    return parsed, message
+
+
+async def show_stage_message(message: types.Message | None, send_message, text: str, reply_markup=None):
+    """Последняя правка потокового сообщения (вместе с кнопками) или обычная отправка нового."""
+    if message is not None:
+        try:
+            await message.edit_text(text, reply_markup=reply_markup, parse_mode="HTML")
+            return
+        except Exception as e:
+            logging.warning(f"⚠️ Не удалось дописать потоковое сообщение, отправляем новое: {e}")
+
+    await send_message(text, reply_markup=reply_markup, parse_mode="HTML")
+
+
+def stage_option_count() -> int:
+    """Сколько вариантов просить у AI за один запрос этапа (с запасом — BRAND_OPTIONS_BATCH)."""
+    return config.BRAND_OPTIONS_BATCH if config.BRAND_OPTIONS_BUFFER else OPTIONS_SHOWN
+
+
+def stage_max_tokens() -> int | None:
+    """Лимит токенов запроса этапа: для запроса с запасом вариантов нужен больший."""
+    return config.BRAND_OPTIONS_MAX_TOKENS if config.BRAND_OPTIONS_BUFFER else None
+
+
+def next_stage_prompts(stage_number: int, data: dict, options: list[dict]) -> list[str]:
+    """Промпты следующего этапа для каждого из показанных вариантов этапа `stage_number`."""
+    context, username = data.get("context"), data.get("username")
+    match stage_number:
+        case 1:
+            return [build_stage2_prompt(context, username, option, stage_option_count()) for option in options]
+        case 2:
+            return [
+                build_stage3_prompt(context, username, data.get("stage1_choice"), option, stage_option_count())
+                for option in options
+            ]
+        case _:
+            return [
+                build_profile_prompt(
+                    context, username, choice_short(data.get("stage1_choice")),
+                    choice_short(data.get("stage2_choice")), choice_short(option)
+                )
+                for option in options
+            ]
+
+
+def schedule_prefetch(event: types.Message | types.CallbackQuery, stage_number: int, data: dict, options: list[dict]):
+    """Запускает предзагрузку следующего этапа для каждого показанного варианта (BRAND_PREFETCH)."""
+    if config.BRAND_PREFETCH:
+        max_tokens, next_stage = (stage_max_tokens(), f"stage{stage_number + 1}") if stage_number < 3 else (None, "profile")
+        brand_prefetch.schedule(event.from_user.id, next_stage_prompts(stage_number, data, options), max_tokens, next_stage)
+
+
+async def store_stage_options(event: types.Message | types.CallbackQuery, state: FSMContext,
+                              stage_number: int, parsed_response: dict, prompt: str) -> tuple[list[dict], list[dict]]:
+    """
+    Сохраняет варианты этапа в FSM и возвращает те, что нужно показать, и запас.
+    С запасом (BRAND_OPTIONS_BUFFER) показываются первые 3, остальные ждут "🔄 Еще 3 варианта".
+    """
+    options = parsed_response["options"]
+    if not config.BRAND_OPTIONS_BUFFER:
+        await state.update_data({f"stage{stage_number}_options": options})
+        return options, []
+
+    brand_buffer.cancel_refill(event.from_user.id)  # Запас прошлого запроса больше не нужен
+    shown, reserve = split_options(options)
+    async with brand_buffer.buffer_lock(event.from_user.id):
+        await state.update_data({
+            f"stage{stage_number}_options": shown,
+            f"stage{stage_number}_buffer": reserve,
+            f"stage{stage_number}_answer": parsed_response["answer"],
+            f"stage{stage_number}_prompt": prompt,
+            f"stage{stage_number}_seen": [option_key(option) for option in options],
+        })
+    return shown, reserve
+
+
+def refill_if_low(user_id: int, state: FSMContext, stage_number: int, prompt: str, reserve: list[dict]):
+    """Когда в запасе остаётся BRAND_OPTIONS_REFILL_AT вариантов или меньше, дозапрашивает их в фоне."""
+    if config.BRAND_OPTIONS_BUFFER and len(reserve) <= config.BRAND_OPTIONS_REFILL_AT:
+        brand_buffer.start_refill(user_id, refill_stage_buffer(user_id, state, stage_number, prompt))
+
+
+async def refill_stage_buffer(user_id: int, state: FSMContext, stage_number: int, prompt: str):
+    """Фоновый дозапрос вариантов этапа тем же промптом; новые варианты (без повторов) идут в запас."""
+    try:
+        parsed, _ = await get_parsed_response_with_usage(prompt, stage_max_tokens(), f"stage{stage_number}", placeholder=False)
+        options = parsed["options"]
+
+        # Запас перечитывается под блокировкой: пока шёл запрос, его мог забрать "Еще 3 варианта"
+        async with brand_buffer.buffer_lock(user_id):
+            data = await state.get_data()
+            if await state.get_state() != STAGE_STATES[stage_number].state or data.get(f"stage{stage_number}_prompt") != prompt:
+                logging.info(f"🗂️ Дозапрос вариантов этапа {stage_number} устарел: пользователь ушёл с этапа.")
+                return
+
+            seen = data.get(f"stage{stage_number}_seen", [])
+            fresh = brand_buffer.new_options(options, seen)
+            await state.update_data({
+                f"stage{stage_number}_buffer": data.get(f"stage{stage_number}_buffer", []) + fresh,
+                f"stage{stage_number}_seen": seen + [option_key(option) for option in fresh],
+            })
+        logging.info(f"🗂️ Запас этапа {stage_number} пополнен: +{len(fresh)} (повторов {len(options) - len(fresh)})")
+    except Exception as e:
+        logging.error(f"❌ Ошибка дозапроса вариантов этапа {stage_number}: {e}")
+
+
+async def show_buffered_options(query: types.CallbackQuery, state: FSMContext, stage_number: int) -> bool:
+    """
+    "🔄 Еще 3 варианта" из запаса без обращения к AI (если запас пуст, но дозапрос уже идёт — ждёт его).
+    False — запаса нет, этап нужно сгенерировать заново.
+    """
+    user_id = query.from_user.id
+    data = await state.get_data()
+    if not data.get(f"stage{stage_number}_buffer") and brand_buffer.is_refilling(user_id):
+        await query.message.answer("⏳ Подбираю ещё варианты...")
+        await brand_buffer.wait_refill(user_id)
+
+    async with brand_buffer.buffer_lock(user_id):
+        data = await state.get_data()
+        reserve = data.get(f"stage{stage_number}_buffer", [])
+        if not reserve or await state.get_state() != STAGE_STATES[stage_number].state:
+            brand_buffer.record_miss()
+            brand_buffer.log_stats()
+            return False
+
+        shown, reserve = split_options(reserve)
+        await state.update_data({f"stage{stage_number}_options": shown, f"stage{stage_number}_buffer": reserve})
+    brand_buffer.record_hit()
+
+    msg_text, kb = await generate_message_and_keyboard(
+        answer=STAGE_TEXTS[stage_number] + data.get(f"stage{stage_number}_answer", ""),
+        options=shown,
+        prefix=f"choose_stage{stage_number}"
+    )
+    kb.inline_keyboard.append([InlineKeyboardButton(text="🏠 В меню", callback_data="start")])
+    await query.message.answer(msg_text, reply_markup=kb, parse_mode="HTML")
+
+    refill_if_low(user_id, state, stage_number, data[f"stage{stage_number}_prompt"], reserve)
+    schedule_prefetch(query, stage_number, data, shown)
+    brand_buffer.log_stats()
+    return True
+
+
+def stage_renderer(stage_text: str, prefix: str):
+    """Промежуточный текст этапа для потокового режима: комментарий и уже готовые варианты."""
+    async def render(parsed: dict) -> str:
+        if not parsed["answer"]:
+            return ""
+        options = parsed["options"][:OPTIONS_SHOWN] if config.BRAND_OPTIONS_BUFFER else parsed["options"]
+        msg_text, _ = await generate_message_and_keyboard(stage_text + parsed["answer"], options, prefix)
+        return msg_text
+    return render
+
 
 
 async def generate_message_and_keyboard(answer: str, options: list[dict], prefix: str) -> tuple[str, InlineKeyboardMarkup]:
@@ -113,45 +355,40 @@ async def stage1_problem(event: types.Message | types.CallbackQuery, state: FSMC
     # Определяем, какой метод использовать для отправки сообщений
     send_message = event.message.answer if isinstance(event, types.CallbackQuery) else event.answer
 
-    # Отправляем сообщение пользователю перед генерацией
-    await send_message("⏳ Переходим к определению проблемного поля проекта..")
-
-    prompt = f"""
-    Исходный контекст: {context}, выбрано название {username}.
-    Проанализируй название и контекст с точки зрения смысловых ассоциаций и потенциального позиционирования.
-    Каким 3 различным вариантам проблемы или потребностей может быть адресован такой проект?
-
-    Ответ выведи строго по формату:
-    Комментарий: [краткий комментарий к выбору {username} и подводящий вопрос. 1-2 предложения.]
+    prompt = build_stage1_prompt(context, username, stage_option_count())
 
-    1. **[эмодзи]** [Проблема/Потребность 1]: [Описание]
-    2. **[эмодзи]** [Проблема/Потребность 2]: [Описание]
-    3. **[эмодзи]** [Проблема/Потребность 3]: [Описание]
-    """
+    stage_text = STAGE_TEXTS[1]
 
-    parsed_response = get_parsed_response(prompt)
+    # Отправляем сообщение пользователю перед генерацией (в потоковом режиме оно же и обновляется)
+    parsed_response, stage_message = await get_stage_response(
+        send_message, "⏳ Переходим к определению проблемного поля проекта..", prompt,
+        stage_renderer(stage_text, "choose_stage1"), "stage1", user_id=event.from_user.id,
+        max_tokens=stage_max_tokens()
+    )
 
     if not parsed_response["options"]:
-        await send_message("❌ Ошибка при генерации форматов. Попробуйте снова.")
+        await show_stage_message(stage_message, send_message, "❌ Ошибка при генерации форматов. Попробуйте снова.")
         return
 
-    await state.update_data(stage1_options=parsed_response["options"])
+    options, reserve = await store_stage_options(event, state, 1, parsed_response, prompt)
 
     # После получения parsed_response
-    stage_text = "<b>Этап 1: суть.</b>\n"
     final_answer = stage_text + parsed_response["answer"]
 
     msg_text, kb = await generate_message_and_keyboard(
         answer=final_answer,
-        options=parsed_response["options"],
+        options=options,
         prefix="choose_stage1"
     )
 
     kb.inline_keyboard.append([InlineKeyboardButton(text="🏠 В меню", callback_data="start")])
 
-    await send_message(msg_text, reply_markup=kb, parse_mode="HTML")
+    await show_stage_message(stage_message, send_message, msg_text, reply_markup=kb)
     await state.set_state(BrandCreationStates.waiting_for_stage1)
 
+    refill_if_low(event.from_user.id, state, 1, prompt, reserve)
+    schedule_prefetch(event, 1, data, options)
+
 
 @brand_router.callback_query(lambda c: c.data.startswith("choose_stage1:"))
 async def process_stage1(query: types.CallbackQuery, state: FSMContext):
@@ -197,44 +434,40 @@ async def stage2_audience(event: types.Message | types.CallbackQuery, state: FSM
     # Логируем данные для отладки
     logging.info(f"Данные для этапа 2: username={username}, context={context}, stage1_choice={stage1_choice}")
 
-    # Отправляем сообщение пользователю перед генерацией
-    await send_message("⏳ Переходим к определению целевой аудитории ...")
-
     # Формируем промпт с учётом введённого пользователем текста
-    prompt = f"""
-    Пользователь изначально указал: {context}.
-    Пользователь выбрал название {username} и указал на проблему/потребность {stage1_choice}.
-    Исходя из выявленной проблемы, с учетом контекста и выбранного названия предложи 3 варианта целевой аудитории, которая получит наибольшую выгоду от решения.
+    prompt = build_stage2_prompt(context, username, stage1_choice, stage_option_count())
 
-    Ответ выведи строго по формату:
-    Комментарий: [краткий комментарий к выбору {stage1_choice} (отметь выбор в тексте) и краткий вопрос-подводка к вариантам. 1-2 предложения]
-1. [эмодзи] [Название аудитории 1]: [Описание, почему именно эта аудитория заинтересована и какие выгоды она получит (1-2 предложения)]
-2. [эмодзи] [Название аудитории 2]: [Описание, почему именно эта аудитория заинтересована и какие выгоды она получит (1-2 предложения)]
-3. [эмодзи] [Название аудитории 3]: [Описание, почему именно эта аудитория заинтересована и какие выгоды она получит (1-2 предложения)]
-    """
+    stage_text = STAGE_TEXTS[2]
 
-    parsed_response = get_parsed_response(prompt)
+    # Отправляем сообщение пользователю перед генерацией
+    parsed_response, stage_message = await get_stage_response(
+        send_message, "⏳ Переходим к определению целевой аудитории ...", prompt,
+        stage_renderer(stage_text, "choose_stage2"), "stage2", user_id=event.from_user.id,
+        max_tokens=stage_max_tokens()
+    )
 
     if not parsed_response["options"]:
-        await send_message("❌ Ошибка при генерации аудитории. Попробуйте снова.")
+        await show_stage_message(stage_message, send_message, "❌ Ошибка при генерации аудитории. Попробуйте снова.")
         return
 
-    await state.update_data(stage2_options=parsed_response["options"])
+    options, reserve = await store_stage_options(event, state, 2, parsed_response, prompt)
 
-    stage_text = "<b>Этап 2: для кого?</b>\n"
     final_answer = stage_text + parsed_response["answer"]
 
     msg_text, kb = await generate_message_and_keyboard(
         answer=final_answer,
-        options=parsed_response["options"],
+        options=options,
         prefix="choose_stage2"
     )
 
     kb.inline_keyboard.append([InlineKeyboardButton(text="🏠 В меню", callback_data="start")])
 
-    await send_message(msg_text, reply_markup=kb, parse_mode="HTML")
+    await show_stage_message(stage_message, send_message, msg_text, reply_markup=kb)
     await state.set_state(BrandCreationStates.waiting_for_stage2)
 
+    refill_if_low(event.from_user.id, state, 2, prompt, reserve)
+    schedule_prefetch(event, 2, data, options)
+
 # 📍 Обработка выбора аудитории
 @brand_router.callback_query(lambda c: c.data.startswith("choose_stage2:"))
 async def process_stage2(query: types.CallbackQuery, state: FSMContext):
@@ -288,42 +521,38 @@ async def stage3_shape(event: types.Message | types.CallbackQuery, state: FSMCon
     # Логируем данные для отладки
     logging.info(f"Данные для этапа 3: username={username}, context={context}, stage1_choice={stage1_choice}, stage2_choice={stage2_choice}")
 
-    # Отправляем сообщение пользователю перед генерацией
-    await send_message("⏳ Переходим к самому интересному - в каком формате это будет...")
+    prompt = build_stage3_prompt(context, username, stage1_choice, stage2_choice, stage_option_count())
 
-    prompt = f"""
-    Исходный контекст: {context}, выбрано имя "{username}".
-    Проблема/потребность "{stage1_choice}" и целевая аудитория "{stage2_choice}" (результаты предыдущих этапов).
-    С учетом всего этого, какой конкретно можно реализовать проект, чтобы эффективно решать указанную проблему и приносить качественную ценность для аудитории?
+    stage_text = STAGE_TEXTS[3]
 
-    Ответ выведи строго по формату:
-    Комментарий: [краткий комментарий к выбору {stage2_choice} (отметь выбор в тексте) и краткий вопрос-подводка к вариантам. 1-2 предложения]
-    1. [эмодзи] [Краткое определение]: [1-2 предложения, поясняющие формат]
-    2. [эмодзи] [Краткое определение]: [1-2 предложения, поясняющие формат]
-    3. [эмодзи] [Краткое определение]: [1-2 предложения, поясняющие формат]
-    """
-
-    parsed_response = get_parsed_response(prompt)
+    # Отправляем сообщение пользователю перед генерацией
+    parsed_response, stage_message = await get_stage_response(
+        send_message, "⏳ Переходим к самому интересному - в каком формате это будет...", prompt,
+        stage_renderer(stage_text, "choose_stage3"), "stage3", user_id=event.from_user.id,
+        max_tokens=stage_max_tokens()
+    )
 
     if not parsed_response["options"]:
-        await send_message("❌ Ошибка при генерации сути проекта. Попробуйте снова.")
+        await show_stage_message(stage_message, send_message, "❌ Ошибка при генерации сути проекта. Попробуйте снова.")
         return
 
-    await state.update_data(stage3_options=parsed_response["options"])
+    options, reserve = await store_stage_options(event, state, 3, parsed_response, prompt)
 
     # После получения parsed_response
-    stage_text = "<b>Этап 3: формат</b>\n"
     final_answer = stage_text + parsed_response["answer"]
 
     msg_text, kb = await generate_message_and_keyboard(
         answer=final_answer,
-        options=parsed_response["options"],
+        options=options,
         prefix="choose_stage3"
     )
 
     kb.inline_keyboard.append([InlineKeyboardButton(text="🏠 В меню", callback_data="start")])
-    await send_message(msg_text, reply_markup=kb, parse_mode="HTML")
+    await show_stage_message(stage_message, send_message, msg_text, reply_markup=kb)
     await state.set_state(BrandCreationStates.waiting_for_stage3)
+
+    refill_if_low(event.from_user.id, state, 3, prompt, reserve)
+    schedule_prefetch(event, 3, data, options)
 # 📍 Обработка выбора Этапа 3
 @brand_router.callback_query(lambda c: c.data.startswith("choose_stage3:"))
 async def process_stage3_choice(query: types.CallbackQuery, state: FSMContext):
@@ -380,63 +609,9 @@ async def show_final_profile(event: types.Message | types.CallbackQuery, state:
     await send_message(msg_text, reply_markup=keyboard, parse_mode="HTML")
     await state.set_state(BrandCreationStates.project_ready)
 
-@brand_router.callback_query(lambda c: c.data == "get_project")
-async def send_project_profile(event: types.Message | types.CallbackQuery, state: FSMContext):
-    """
-    Отправляет пользователю полный профиль проекта после нажатия на "📜 Забрать проект".
-    """
-    # Определяем метод отправки сообщений
-    if isinstance(event, types.CallbackQuery):
-        send_message = event.message.answer
-        query = event
-    else:
-        send_message = event.answer
-        query = None
-
-    data = await state.get_data()
-    username = data.get("username")
-    context = data.get("context")
-
-    # Применяем ту же логику, что и для stage1_choice и stage2_choice
-    stage1_choice = data.get("stage1_choice", {})
-    stage2_choice = data.get("stage2_choice", {})
-    stage3_choice = data.get("stage3_choice", {})
-
-    if isinstance(stage1_choice, dict):
-        stage1_choice = stage1_choice.get("short", "Не выбрано")
-    if isinstance(stage2_choice, dict):
-        stage2_choice = stage2_choice.get("short", "Не выбрано")
-    if isinstance(stage3_choice, dict):
-        stage3_choice = stage3_choice.get("short", "Не выбрано")
-
-    # Отправляем сообщение пользователю перед генерацией
-    await send_message("⏳ Собираю всё вместе...")
-
-
-    # Генерируем тэглайн и примеры существующих проектов
-    prompt = f"""
-    Пользователь создал концепцию проекта:
-    - Мысль: {context}
-    - Название: {username}
-    - Проблема: {stage1_choice}
-    - Аудитория: {stage2_choice}
-    - Формат: {stage3_choice}
-
-    Сформулируй:
-    2. **Краткое описание проекта** – 2-3 предложения, объясняющие суть проекта.
-    3. **3 реально существующих проекта** в этой сфере, с кратким описанием каждого.
-
-    Учитывай изначальную мысль пользователя.
-    Сформулируй и выведи в формате:
-    Тэглайн: [короткое, яркое описание сути проекта одно предложение]
-    Описание: [краткое, чёткое описание проекта, в 1-2 предложения] 
-    Примеры похожих проектов:
-    1. **[Название проекта]** – [1 предложение о сути и цели проекта]
-    2. **[Название проекта]** – [1 предложение о сути и цели проекта]
-    3. **[Название проекта]** – [1 предложение о сути и цели проекта]
-    """
-
-    parsed_response = get_parsed_response(prompt)
+def build_profile_text(parsed_response: dict, username: str, context: str,
+                       stage1_choice: str, stage2_choice: str, stage3_choice: str) -> str:
+    """Текст профиля проекта (и промежуточный, пока ответ ещё генерируется)."""
     tagline = parsed_response.get("answer", "Не удалось сгенерировать тэглайн")
     description = parsed_response.get("description", "Не удалось сгенерировать описание")
     references = parsed_response.get("options", [])
@@ -467,6 +642,49 @@ async def send_project_profile(event: types.Message | types.CallbackQuery, state
 
     profile_text += f"\n<i>{context}</i>"
 
+    return profile_text
+
+
+@brand_router.callback_query(lambda c: c.data == "get_project")
+async def send_project_profile(event: types.Message | types.CallbackQuery, state: FSMContext):
+    """
+    Отправляет пользователю полный профиль проекта после нажатия на "📜 Забрать проект".
+    """
+    # Определяем метод отправки сообщений
+    if isinstance(event, types.CallbackQuery):
+        send_message = event.message.answer
+        query = event
+    else:
+        send_message = event.answer
+        query = None
+
+    data = await state.get_data()
+    username = data.get("username")
+    context = data.get("context")
+
+    # Применяем ту же логику, что и для stage1_choice и stage2_choice
+    stage1_choice = data.get("stage1_choice", {})
+    stage2_choice = data.get("stage2_choice", {})
+    stage3_choice = data.get("stage3_choice", {})
+
+    stage1_choice = choice_short(stage1_choice)
+    stage2_choice = choice_short(stage2_choice)
+    stage3_choice = choice_short(stage3_choice)
+
+    # Генерируем тэглайн и примеры существующих проектов
+    prompt = build_profile_prompt(context, username, stage1_choice, stage2_choice, stage3_choice)
+
+    async def render_profile(parsed: dict) -> str:
+        if not parsed["answer"]:
+            return ""
+        return build_profile_text(parsed, username, context, stage1_choice, stage2_choice, stage3_choice)
+
+    # Отправляем сообщение пользователю перед генерацией
+    parsed_response, profile_message = await get_stage_response(
+        send_message, "⏳ Собираю всё вместе...", prompt, render_profile, "profile", user_id=event.from_user.id
+    )
+    profile_text = build_profile_text(parsed_response, username, context, stage1_choice, stage2_choice, stage3_choice)
+
     # **Создаём инлайн-клавиатуру**
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="🔄 Вернуться в меню", callback_data="start")],
@@ -475,7 +693,7 @@ async def send_project_profile(event: types.Message | types.CallbackQuery, state
     ])
 
     # Отправляем итоговый профиль
-    await send_message(profile_text, parse_mode="HTML", reply_markup=keyboard)
+    await show_stage_message(profile_message, send_message, profile_text, reply_markup=keyboard)
 
     # Очищаем состояние FSM
     await state.clear()
@@ -488,6 +706,11 @@ async def repeat_generation(query: types.CallbackQuery, state: FSMContext):
 
     current_state = await state.get_state()
 
+    # Сначала — из запаса вариантов, без обращения к AI
+    stage_number = STAGE_NUMBERS.get(current_state)
+    if config.BRAND_OPTIONS_BUFFER and stage_number and await show_buffered_options(query, state, stage_number):
+        return
+
     if current_state == BrandCreationStates.waiting_for_stage1:
         await stage1_problem(query, state)
 
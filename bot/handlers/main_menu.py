@@ -139,7 +139,7 @@ async def generate_random_idea(query: types.CallbackQuery, state: FSMContext):
 
     # Генерация случайной идеи (3-6 слов)
     prompt = "Придумай уникальную и креативную идею для проекта. Идея должна состоять из 3-6 слов и быть максимально непохожей на предыдущие идеи. "
-    random_idea = ask_ai(prompt).strip()
+    random_idea = (await ask_ai(prompt)).strip()
 
     if not random_idea:
         await query.message.answer("❌ Не удалось сгенерировать идею. Попробуйте ещё раз.")
@@ -147,8 +147,8 @@ async def generate_random_idea(query: types.CallbackQuery, state: FSMContext):
 
     logging.info(f"🎲 Случайная идея: {random_idea}")
 
-    # Сохраняем случайную идею в FSM
-    await state.update_data(context=random_idea, is_random=True)
+    # Сохраняем случайную идею в FSM; исключения прошлой темы к новой не относятся (как в process_context_input)
+    await state.update_data(context=random_idea, is_random=True, excluded_usernames=[])
 
     # Устанавливаем start_time для расчета duration
     start_time = datetime.now().isoformat()
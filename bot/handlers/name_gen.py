@@ -9,6 +9,9 @@ from aiogram.fsm.context import FSMContext
 
 
 from services.name_gen import gen_process_and_check
+from services.deadline import Deadline
+from services.name_inventory import take_verified_from_inventory
+from services.context_cache import context_cache, take_verified_from_context_cache
 from bot.handlers.keyboards.name_generate import generate_username_kb, initial_styles_kb, styles_kb
 from bot.handlers.main_menu import back_to_menu_kb
 from .states import BrandCreationStates
@@ -37,8 +40,8 @@ async def process_context_input(message: types.Message, state: FSMContext):
         await message.answer(f"⚠️ Контекст слишком длинный. Обрезаю до {config.MAX_CONTEXT_LENGTH} символов.")
         context_text = context_text[:config.MAX_CONTEXT_LENGTH]
 
-    # ✅ Сохраняем контекст в FSM
-    await state.update_data(context=context_text)
+    # ✅ Сохраняем контекст в FSM (исключения прошлой темы больше не нужны)
+    await state.update_data(context=context_text, excluded_usernames=[])
 
     # ✅ Отправляем inline-клавиатуру с двумя вариантами
     await message.answer(
@@ -71,16 +74,18 @@ async def process_style_choice(query: CallbackQuery, state: FSMContext, bot: Bot
 
     elif selected_option == "no_style":
         await state.update_data(start_time=datetime.now().isoformat())
-        progress_task = asyncio.create_task(send_progress_messages(query))
+        progress_task = start_progress_messages(query)
         await perform_username_generation(query, state, bot, style=None)
-        progress_task.cancel()
+        if progress_task:
+            progress_task.cancel()
         return
 
     # Обработка выбора конкретного стиля
     await state.update_data(start_time=datetime.now().isoformat())
-    progress_task = asyncio.create_task(send_progress_messages(query))
+    progress_task = start_progress_messages(query)
     await perform_username_generation(query, state, bot, style=selected_option)
-    progress_task.cancel()
+    if progress_task:
+        progress_task.cancel()
 
 
 
@@ -107,6 +112,101 @@ async def send_progress_messages(query: CallbackQuery):
             break
 
 
+def start_progress_messages(query: CallbackQuery) -> asyncio.Task | None:
+    """Сообщения-заглушки нужны только без прогрессивной выдачи: там первое имя приходит сразу."""
+    if config.PROGRESSIVE_DELIVERY:
+        return None
+    return asyncio.create_task(send_progress_messages(query))
+
+
+def generation_duration(start_time: str) -> float:
+    """Сколько секунд прошло с начала генерации (start_time из FSM в ISO-формате)."""
+    try:
+        start_dt = datetime.fromisoformat(start_time)
+    except ValueError:
+        logging.error(f"❌ Ошибка: Некорректный формат start_time: '{start_time}'. Используем текущее время.")
+        start_dt = datetime.now()
+
+    return (datetime.now() - start_dt).total_seconds()
+
+
+class ProgressiveDelivery:
+    """
+    Прогрессивная выдача (PROGRESSIVE_DELIVERY): сообщение с клавиатурой отправляется,
+    как только подтверждён первый свободный username, затем клавиатура дополняется
+    каждым новым именем через edit_message_reply_markup.
+    """
+
+    def __init__(self, query: CallbackQuery, state: FSMContext, context: str, style: str | None, start_time: str):
+        self.query = query
+        self.state = state
+        self.context = context
+        self.style = style
+        self.start_time = start_time
+
+        self.usernames: list[str] = []  # Подтверждённые свободные username в порядке нахождения
+        self.message: types.Message | None = None  # Сообщение с клавиатурой (после первого имени)
+        self._rendered = 0  # Сколько имён уже показано
+        self._lock = asyncio.Lock()  # Отправка и правки сообщения идут строго по очереди
+        self._tasks: set[asyncio.Task] = set()
+
+    def add(self, username: str):
+        """Колбэк для gen_process_and_check: показывает новое имя, не задерживая генерацию."""
+        if username in self.usernames:
+            return
+        self.usernames.append(username)
+        task = asyncio.create_task(self._render())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _render(self):
+        async with self._lock:
+            if len(self.usernames) == self._rendered:
+                return  # Уже показано более поздней правкой
+            usernames = list(self.usernames)
+
+            try:
+                if self.message is None:
+                    # Кнопки выбора работают уже сейчас, поэтому сразу переходим в состояние выбора
+                    await self.state.update_data(usernames=usernames)
+                    await self.state.set_state(BrandCreationStates.waiting_for_username_choice)
+
+                    duration = generation_duration(self.start_time)
+                    message_text, keyboard = generate_username_kb(usernames, self.context, self.style, duration)
+                    self.message = await self.query.message.answer(
+                        message_text,
+                        parse_mode="MarkdownV2",
+                        reply_markup=keyboard
+                    )
+                    logging.info(f"⚡ Первый свободный username отправлен пользователю через {duration:.2f} сек.")
+                else:
+                    _, keyboard = generate_username_kb(usernames, self.context, self.style)
+                    await self.message.edit_reply_markup(reply_markup=keyboard)
+                    await self.state.update_data(usernames=usernames)
+                    logging.info(f"➕ Клавиатура дополнена: {len(usernames)} username.")
+
+                self._rendered = len(usernames)
+            except Exception as e:
+                logging.error(f"❌ Ошибка прогрессивной выдачи username: {e}")
+
+    async def finish(self, usernames: list[str]) -> list[str]:
+        """Добавляет оставшиеся имена, дожидается последних правок и возвращает всё показанное."""
+        for username in usernames:
+            self.add(username)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        return list(self.usernames)
+
+
+def add_exclusions(excluded: list[str], usernames: list[str]):
+    """Дописывает username в исключения сессии (casefold, без повторов)."""
+    known = set(excluded)
+    for key in (username.casefold() for username in usernames):
+        if key not in known:
+            known.add(key)
+            excluded.append(key)
+
+
 async def perform_username_generation(query: CallbackQuery, state: FSMContext, bot: Bot, style: str | None):
     data = await state.get_data()
     context_text = data.get("context", "")
@@ -123,14 +223,59 @@ async def perform_username_generation(query: CallbackQuery, state: FSMContext, b
 
     logging.info(f"🚀 Генерация username: контекст='{context_text}', стиль='{style}'")
 
+    delivery = ProgressiveDelivery(query, state, context_text, style, start_time) if config.PROGRESSIVE_DELIVERY else None
+    deadline = Deadline(config.GEN_TIMEOUT)  # Общий бюджет на инвентарь, кэш, LLM, Fragment и БД
+    # 🚫 Имена, уже показанные или проверенные в прошлых раундах этой темы (casefold)
+    excluded = list(data.get("excluded_usernames", []))
 
     try:
-        raw_usernames = await asyncio.wait_for(
-            gen_process_and_check(bot, context_text, style, config.AVAILABLE_USERNAME_COUNT),
-            timeout=config.GEN_TIMEOUT
-        )
+        # 🗃️ Сначала пробуем выдать готовые проверенные имена из инвентаря
+        inventory_usernames = []
+        if config.INVENTORY_ENABLED:
+            inventory_usernames = await take_verified_from_inventory(
+                context_text, style, config.AVAILABLE_USERNAME_COUNT, deadline=deadline
+            )
+
+        raw_usernames = list(inventory_usernames)
+
+        # 🧩 Затем — имена, найденные недавно для похожего контекста
+        missing_count = config.AVAILABLE_USERNAME_COUNT - len(raw_usernames)
+        if config.CONTEXT_CACHE_ENABLED and missing_count > 0:
+            cached_usernames = await take_verified_from_context_cache(
+                context_text, style, missing_count, exclude=raw_usernames + data.get("usernames", []) + excluded,
+                deadline=deadline
+            )
+            raw_usernames += cached_usernames
+
+        if delivery:
+            for username in raw_usernames:
+                delivery.add(username)
+        add_exclusions(excluded, raw_usernames)
+
+        missing_count = config.AVAILABLE_USERNAME_COUNT - len(raw_usernames)
+        if missing_count > 0:
+            # По истечении бюджета возвращаются уже проверенные свободные имена (а не отмена целиком)
+            raw_usernames += await gen_process_and_check(
+                bot, context_text, style, missing_count,
+                on_found=delivery.add if delivery else None, deadline=deadline, excluded=excluded
+            )
         usernames = [u.strip() for u in raw_usernames if u.strip()]
 
+        # gen_process_and_check уже дописал в excluded имена с окончательным статусом и найденные свободные
+        await state.update_data(excluded_usernames=excluded[-config.SESSION_EXCLUSIONS_MAX:])
+
+        if delivery:
+            usernames = await delivery.finish(usernames)
+
+        if not usernames and deadline.expired:
+            logging.warning(f"⏰ За {config.GEN_TIMEOUT} сек. не найдено ни одного свободного username (контекст: '{context_text}').")
+            await query.message.answer(
+                "⏳ Не успел найти свободные имена. Попробуйте ещё раз или измените запрос.",
+                reply_markup=back_to_menu_kb()
+            )
+            await state.clear()
+            return
+
         if not usernames:
             logging.warning(f"❌ AI отказался генерировать username по этическим соображениям (контекст: '{context_text}', стиль: '{style}').")
             await query.message.answer(
@@ -140,6 +285,16 @@ async def perform_username_generation(query: CallbackQuery, state: FSMContext, b
             await state.clear()
             return
 
+        if config.CONTEXT_CACHE_ENABLED:
+            context_cache.store(context_text, style, usernames)
+
+        if delivery and delivery.message is not None:
+            # Результат уже на экране; пользователь мог успеть выбрать имя и уйти дальше
+            if await state.get_state() == BrandCreationStates.waiting_for_username_choice.state:
+                await state.update_data(usernames=usernames)
+            logging.info("✅ Прогрессивная выдача username завершена.")
+            return
+
         # Сохраняем сгенерированные usernames в FSM
         await state.update_data(usernames=usernames)
         await handle_generation_result(query, usernames, context_text, style, start_time)
@@ -147,6 +302,8 @@ async def perform_username_generation(query: CallbackQuery, state: FSMContext, b
 
     except Exception as e:
         logging.error(f"❌ Ошибка генерации: {e}")
+        if delivery and delivery.message is not None:
+            return  # Найденные имена уже показаны — не затираем их сообщением об ошибке
         await query.message.answer("❌ Ошибка при генерации. Попробуйте ещё раз.", reply_markup=back_to_menu_kb())
         await state.clear()
 
@@ -155,13 +312,7 @@ async def handle_generation_result(query: CallbackQuery, usernames: list[str], c
     """
     Отправка результата генерации username пользователю.
     """
-    try:
-        start_dt = datetime.fromisoformat(start_time)
-    except ValueError:
-        logging.error(f"❌ Ошибка: Некорректный формат start_time: '{start_time}'. Используем текущее время.")
-        start_dt = datetime.now()
-
-    duration = (datetime.now() - start_dt).total_seconds()
+    duration = generation_duration(start_time)
 
     # 📌 Вызываем генерацию клавиатуры (НЕ экранируем повторно!)
     message_text, keyboard = generate_username_kb(usernames, context, style, duration)
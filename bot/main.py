@@ -18,9 +18,15 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))  # Добавляе
 from bot.handlers.name_gen import username_router
 from bot.handlers.brand_gen import brand_router
 from bot.handlers.main_menu import main_menu_router, command_router
-from database.database import init_db, init_db_pool
+from database.database import init_db, init_db_pool, close_db_pool
+from bot.services.llm_gateway import close_llm_client
+from services.name_check import init_http_session, close_http_session
+from services.taken_filter import start_taken_filter_loading, stop_taken_filter_loading
+from services.name_inventory import start_inventory_worker, stop_inventory_worker
+from services.free_rate import start_free_rate_refresher, stop_free_rate_refresher
 
 from logger import setup_logging
+import config
 
 setup_logging()
 load_dotenv()
@@ -78,6 +84,13 @@ async def on_startup():
     """Запуск бота и подключение к БД"""
     await init_db_pool()  # 📌 Добавить вызов, если его нет
     await init_db()  # ✅ Проверка таблиц
+    await init_http_session()  # 🌐 Общая HTTP-сессия для проверок Fragment
+    if config.TAKEN_FILTER_ENABLED:
+        start_taken_filter_loading()  # 🧮 Фильтр занятых username строится в фоне
+    if config.INVENTORY_ENABLED:
+        start_inventory_worker()  # 🗃️ Фоновое пополнение инвентаря свободных username
+    if config.ADAPTIVE_BATCH_ENABLED:
+        start_free_rate_refresher()  # 📈 Периодический пересчёт доли свободных username
 
 
     if IS_LOCAL:
@@ -98,7 +111,13 @@ async def on_shutdown(_):
     """Закрытие сессии перед остановкой"""
     logging.info("🚨 Бот остановлен! Закрываю сессию...")
     try:
+        await stop_inventory_worker()
+        await stop_free_rate_refresher()
+        await stop_taken_filter_loading()
         await bot.session.close()
+        await close_llm_client()
+        await close_http_session()
+        await close_db_pool()
     except Exception as e:
         logging.error(f"❌ Ошибка при закрытии сессии: {e}")
     logging.info("✅ Сессия закрыта.")
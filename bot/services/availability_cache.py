@@ -0,0 +1,88 @@
+import logging
+import time
+from collections import OrderedDict
+
+import config
+
+
+class AvailabilityCache:
+    """
+    Кэш статусов username (в памяти процесса) перед проверкой через Fragment.
+    Ключ — username в нижнем регистре (casefold). У каждого статуса свой TTL,
+    статусы с TTL 0 (например, "Невозможно определить") не кэшируются.
+    При превышении размера вытесняется давно не использованная запись (LRU).
+    """
+
+    def __init__(self, max_size: int, ttl_by_status: dict[str, float]):
+        self.max_size = max_size
+        self.ttl_by_status = ttl_by_status
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()  # key -> (статус, истекает в)
+
+        # 📦 Метрики
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(username: str) -> str:
+        return username.casefold()
+
+    def get(self, username: str) -> str | None:
+        """Возвращает статус из кэша или None, если записи нет или она устарела."""
+        key = self._key(username)
+        entry = self._entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        status, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return status
+
+    def set(self, username: str, status: str):
+        """Запоминает статус, если для него задан положительный TTL."""
+        ttl = self.ttl_by_status.get(status, 0)
+        if ttl <= 0:
+            return
+
+        key = self._key(username)
+        self._entries[key] = (status, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, username: str):
+        self._entries.pop(self._key(username), None)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def log_stats(self):
+        logging.info(
+            f"🗃️ Кэш статусов: {len(self._entries)}/{self.max_size} записей, "
+            f"попаданий {self.hits}, промахов {self.misses} ({self.hit_rate:.0%}), вытеснено {self.evictions}"
+        )
+
+
+# Общий кэш статусов на весь процесс
+availability_cache = AvailabilityCache(
+    max_size=config.AVAILABILITY_CACHE_SIZE,
+    ttl_by_status={
+        "Свободно": config.AVAILABILITY_TTL_FREE,
+        "Доступно для покупки": config.AVAILABILITY_TTL_FOR_SALE,
+        "Продано": config.AVAILABILITY_TTL_TAKEN,
+        "Занято": config.AVAILABILITY_TTL_TAKEN,
+        "Невозможно определить": 0,  # Не кэшируем: следующая проверка может дать ответ
+    },
+)
@@ -0,0 +1,98 @@
+"""
+Локальная заглушка бэкендов проверки username (Fragment и t.me) для офлайн-проверки.
+
+Запуск:
+    python bot/services/availability_stub.py --fragment-port 8081 --telegram-port 8082
+
+Затем в .env:
+    FRAGMENT_BASE_URL=http://127.0.0.1:8081
+    TELEGRAM_BASE_URL=http://127.0.0.1:8082
+
+Поведение определяется префиксом username:
+    free...   — Fragment перенаправляет на поиск (свободно), профиля t.me нет
+    sold...   — Fragment: Sold
+    sale...   — Fragment: Available (на продаже)
+    slow...   — Fragment отвечает с задержкой --slow-delay (для проверки хеджирования)
+    busy...   — Fragment отвечает 429 (для проверки ограничителя)
+    остальные — Fragment: Taken, профиль t.me существует
+"""
+import argparse
+import asyncio
+
+from aiohttp import web
+
+FRAGMENT_PAGE = (
+    "<html><body><div class=\"tm-section-header\">"
+    "<span class=\"tm-section-header-status tm-status-{css}\">{status}</span>"
+    "</div></body></html>"
+)
+TELEGRAM_PROFILE_PAGE = (
+    "<html><body><div class=\"tgme_page_title\"><span dir=\"auto\">{username}</span></div></body></html>"
+)
+TELEGRAM_EMPTY_PAGE = "<html><body><div class=\"tgme_page_description\">If you have Telegram, you can contact @{username} right away.</div></body></html>"
+
+
+def fragment_app(slow_delay: float) -> web.Application:
+    async def username_page(request: web.Request) -> web.Response:
+        username = request.match_info["username"]
+        name = username.lower()
+
+        if name.startswith("slow"):
+            await asyncio.sleep(slow_delay)
+        if name.startswith("busy"):
+            return web.Response(status=429)
+        if name.startswith("free"):
+            raise web.HTTPFound(f"/?query={username}")
+        if name.startswith("sold"):
+            return web.Response(text=FRAGMENT_PAGE.format(css="sold", status="Sold"), content_type="text/html")
+        if name.startswith("sale"):
+            return web.Response(text=FRAGMENT_PAGE.format(css="avail", status="Available"), content_type="text/html")
+        return web.Response(text=FRAGMENT_PAGE.format(css="taken", status="Taken"), content_type="text/html")
+
+    async def search_page(request: web.Request) -> web.Response:
+        return web.Response(text="<html><body>search</body></html>", content_type="text/html")
+
+    app = web.Application()
+    app.add_routes([web.get("/username/{username}", username_page), web.get("/", search_page)])
+    return app
+
+
+def telegram_app() -> web.Application:
+    async def profile_page(request: web.Request) -> web.Response:
+        username = request.match_info["username"]
+        page = TELEGRAM_EMPTY_PAGE if username.lower().startswith("free") else TELEGRAM_PROFILE_PAGE
+        return web.Response(text=page.format(username=username), content_type="text/html")
+
+    app = web.Application()
+    app.add_routes([web.get("/{username}", profile_page)])
+    return app
+
+
+async def run_stub(host: str, fragment_port: int, telegram_port: int, slow_delay: float):
+    runners = []
+    for app, port in ((fragment_app(slow_delay), fragment_port), (telegram_app(), telegram_port)):
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        runners.append(runner)
+
+    print(f"✅ Заглушка Fragment: http://{host}:{fragment_port}, t.me: http://{host}:{telegram_port}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        for runner in runners:
+            await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Локальная заглушка Fragment и t.me")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--fragment-port", type=int, default=8081)
+    parser.add_argument("--telegram-port", type=int, default=8082)
+    parser.add_argument("--slow-delay", type=float, default=5.0)
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run_stub(args.host, args.fragment_port, args.telegram_port, args.slow_delay))
+    except KeyboardInterrupt:
+        pass
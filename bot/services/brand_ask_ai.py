@@ -1,41 +1,71 @@
-import os
 import logging
-from dotenv import load_dotenv
-from openai import OpenAI
+import time
 from bot import config
+from bot.services.llm_gateway import chat_completion, stream_chat_completion
+from bot.services.brand_json import JSON_INSTRUCTION, REPAIR_PROMPT, decode_json_response, parse_stats, response_format
+from bot.services.brand_prompts import record_prompt_sent
 import re
 
-# Загрузка переменных окружения
-load_dotenv()
 
-# Получение ключей API из окружения
-API_KEY = os.getenv("API_KEY")
-BASE_URL = os.getenv("BASE_URL")
-
-# Создание клиента OpenAI
-client = OpenAI(api_key=API_KEY, base_url=BASE_URL)
+SYSTEM_PROMPT = "Ты - талантливый и конструктивный разработчик проектов. "
 
 
 # Функция для отправки запроса к AI
-def ask_ai(prompt: str) -> str:
+async def ask_ai(prompt: str, max_tokens: int | None = None) -> str:
+    text, _ = await ask_ai_with_usage(prompt, max_tokens)
+    return text
+
+
+async def ask_ai_with_usage(prompt: str, max_tokens: int | None = None, json_output: bool = False) -> tuple[str, int]:
+    """
+    Как ask_ai, но вместе с числом потраченных токенов (0, если провайдер не вернул usage).
+    `max_tokens` — вместо MAX_TOKENS_BRAND (например, для запроса с запасом вариантов).
+    `json_output=True` — ответ просится одним JSON-объектом (только для этапов проекта, режим BRAND_JSON_OUTPUT).
+    """
+    record_prompt_sent(prompt)
     try:
-        response = client.chat.completions.create(
+        response = await chat_completion(
             model=config.MODEL_BRAND,
             messages=[
-                {"role": "system", "content": "Ты - талантливый и конструктивный разработчик проектов. "},
-                {"role": "user", "content": prompt}
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt + JSON_INSTRUCTION if json_output else prompt}
             ],
-            max_tokens=config.MAX_TOKENS_BRAND,
+            max_tokens=max_tokens or config.MAX_TOKENS_BRAND,
             temperature=config.TEMPERATURE_BRAND,
+            response_format=response_format() if json_output else None,
         )
-        return response.choices[0].message.content
+        usage = getattr(response, "usage", None)
+        return response.choices[0].message.content, (usage.total_tokens if usage else 0)
     except Exception as e:
         logging.error(f"Ошибка при обращении к AI: {e}")
-        return ""
+        return "", 0
+
+
+async def stream_ai(prompt: str, max_tokens: int | None = None, json_output: bool = False):
+    """
+    Потоковый вариант ask_ai: отдаёт накопленный текст ответа после каждого фрагмента.
+    Ошибки не перехватываются — вызывающий решает, что делать с уже полученной частью.
+    `json_output` — как в ask_ai_with_usage.
+    """
+    record_prompt_sent(prompt)
+    text = ""
+    async for delta in stream_chat_completion(
+        model=config.MODEL_BRAND,
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt + JSON_INSTRUCTION if json_output else prompt}
+        ],
+        max_tokens=max_tokens or config.MAX_TOKENS_BRAND,
+        temperature=config.TEMPERATURE_BRAND,
+        response_format=response_format() if json_output else None,
+    ):
+        text += delta
+        yield text
 
 
 # Парсер ответа от AI
-def parse_ai_response(response: str) -> dict:
+def parse_ai_response(response: str, partial: bool = False) -> dict:
+    """`partial=True` — ответ ещё дописывается: без заглушки "Ошибка", если вариантов пока нет."""
     parsed_data = {
         "answer": "",  # Сюда будет попадать тэглайн или старый комментарий
         "description": "",  # Новое поле для описания проекта
@@ -43,7 +73,8 @@ def parse_ai_response(response: str) -> dict:
     }
 
     if not response or not response.strip():
-        logging.error("❌ Пустой ответ от AI передан в парсер!")
+        if not partial:
+            logging.error("❌ Пустой ответ от AI передан в парсер!")
         return parsed_data
 
     lines = response.strip().split('\n')
@@ -122,7 +153,7 @@ def parse_ai_response(response: str) -> dict:
                 continue
 
             # Обработка вариантов (старый формат)
-            if (len(line) > 2 and line[0].isdigit() and line[1] == '.') or line.startswith("•"):
+            if re.match(r'^\d+\.\s*\S', line) or line.startswith("•"):  # "1." ... "12." — запас бывает больше 9
                 if line.startswith("•"):
                     option_body = line[1:].strip()
                 else:
@@ -159,7 +190,7 @@ def parse_ai_response(response: str) -> dict:
     if not parsed_data["answer"] and lines:
         parsed_data["answer"] = convert_markdown_links(clean_text(lines[0].strip()))
 
-    if not parsed_data["options"]:
+    if not parsed_data["options"] and not partial:
         logging.error("❌ Парсер не нашел 'options' в ответе AI!")
         parsed_data["options"] = [{
             "short": "Ошибка",
@@ -168,15 +199,58 @@ def parse_ai_response(response: str) -> dict:
 
     return parsed_data
 
-# Обертка для вызова AI и парсинга ответа
-def get_parsed_response(prompt: str) -> dict:
+async def parse_stage_response(response: str, stage: str, placeholder: bool = True,
+                               max_tokens: int | None = None) -> tuple[dict, int]:
     """
-    Отправляет запрос к AI, логирует сырой ответ, парсит и возвращает результат.
+    Разбирает ответ этапа `stage` и возвращает его вместе с токенами переспроса.
+    В режиме BRAND_JSON_OUTPUT: сначала JSON, затем старый парсер (модель могла ответить текстом),
+    и только если не разобралось ничего — один переспрос с просьбой исправить ответ.
+    `placeholder=False` — без варианта "Ошибка", если разобрать не удалось; `max_tokens` — как у исходного запроса.
     """
-    response = ask_ai(prompt)
+    started_at = time.perf_counter()
+    parse_time = 0.0
+    tokens = 0
+
+    parsed = decode_json_response(response) if config.BRAND_JSON_OUTPUT else None
+    if parsed is not None:
+        outcome = "json"
+    else:
+        parsed = parse_ai_response(response, partial=True)  # partial — без заглушки "Ошибка"
+        outcome = "legacy" if parsed["options"] else "failed"
+
+    if outcome == "failed" and config.BRAND_JSON_OUTPUT and config.BRAND_JSON_REPAIR and response.strip():
+        parse_time += time.perf_counter() - started_at
+        logging.warning(f"⚠️ Ответ этапа '{stage}' не разобран, переспрашиваем.")
+        repaired, tokens = await ask_ai_with_usage(REPAIR_PROMPT.format(response=response), max_tokens, json_output=True)
+        started_at = time.perf_counter()
+        repaired_parsed = decode_json_response(repaired)
+        if repaired_parsed is not None:
+            parsed, outcome = repaired_parsed, "repaired"
+
+    if outcome == "failed":
+        parsed = parse_ai_response(response, partial=not placeholder)
+
+    parse_stats.record(stage, outcome, parse_time + time.perf_counter() - started_at)
+    parse_stats.log_stats(stage)
+    return parsed, tokens
+
+
+async def get_parsed_response_with_usage(prompt: str, max_tokens: int | None = None, stage: str = "brand",
+                                         placeholder: bool = True) -> tuple[dict, int]:
+    """Как get_parsed_response, но вместе с потраченными токенами (включая переспрос)."""
+    response, tokens = await ask_ai_with_usage(prompt, max_tokens, json_output=config.BRAND_JSON_OUTPUT)
     logging.info(f"Сырой ответ от AI: {response}")
 
-    parsed = parse_ai_response(response)
+    parsed, repair_tokens = await parse_stage_response(response, stage, placeholder, max_tokens)
     logging.info(f"Парсированный ответ: {parsed}")
 
+    return parsed, tokens + repair_tokens
+
+
+# Обертка для вызова AI и парсинга ответа
+async def get_parsed_response(prompt: str, max_tokens: int | None = None, stage: str = "brand") -> dict:
+    """
+    Отправляет запрос к AI, логирует сырой ответ, парсит и возвращает результат.
+    """
+    parsed, _ = await get_parsed_response_with_usage(prompt, max_tokens, stage)
     return parsed
\ No newline at end of file
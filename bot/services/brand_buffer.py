@@ -0,0 +1,98 @@
+import asyncio
+import logging
+import weakref
+
+# Сколько вариантов показывается за раз (кнопка "🔄 Еще 3 варианта")
+OPTIONS_SHOWN = 3
+
+# Фоновые дозапросы запаса вариантов: user_id -> задача
+_refill_tasks: dict[int, asyncio.Task] = {}
+
+# Блокировки запаса: user_id -> asyncio.Lock (забываются сами, когда их никто не держит)
+_buffer_locks: weakref.WeakValueDictionary[int, asyncio.Lock] = weakref.WeakValueDictionary()
+
+# 📦 Метрики
+buffer_hits = 0  # "Еще 3 варианта" отдано из запаса без обращения к AI
+buffer_misses = 0  # Запас пуст — пришлось генерировать заново
+buffer_refills = 0
+
+
+def split_options(options: list[dict]) -> tuple[list[dict], list[dict]]:
+    """Делит варианты на показываемые сейчас и запас."""
+    return options[:OPTIONS_SHOWN], options[OPTIONS_SHOWN:]
+
+
+def option_key(option: dict) -> str:
+    return option["short"].casefold()
+
+
+def new_options(options: list[dict], known_keys: list[str]) -> list[dict]:
+    """Варианты, которых ещё не было среди `known_keys` (повторы из дозапроса отбрасываются)."""
+    known = set(known_keys)
+    result = []
+    for option in options:
+        if option_key(option) not in known:
+            known.add(option_key(option))
+            result.append(option)
+    return result
+
+
+def buffer_lock(user_id: int) -> asyncio.Lock:
+    """
+    Блокировка запаса пользователя: чтение и запись запаса в FSM (показ "Еще 3 варианта",
+    фоновый дозапрос, новый запрос этапа) идут под ней, чтобы не затирать друг друга.
+    """
+    lock = _buffer_locks.get(user_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _buffer_locks[user_id] = lock
+    return lock
+
+
+def start_refill(user_id: int, coro):
+    """Запускает фоновый дозапрос запаса пользователя, если он ещё не идёт."""
+    global buffer_refills
+    if user_id in _refill_tasks:
+        coro.close()
+        return
+    task = asyncio.create_task(coro)
+    _refill_tasks[user_id] = task
+    task.add_done_callback(lambda t: _refill_tasks.pop(user_id, None) if _refill_tasks.get(user_id) is t else None)
+    buffer_refills += 1
+
+
+def is_refilling(user_id: int) -> bool:
+    return user_id in _refill_tasks
+
+
+def cancel_refill(user_id: int):
+    task = _refill_tasks.pop(user_id, None)
+    if task is not None and not task.done():
+        task.cancel()
+
+
+async def wait_refill(user_id: int) -> bool:
+    """Дожидается идущего дозапроса пользователя; False — дозапроса нет."""
+    task = _refill_tasks.get(user_id)
+    if task is None:
+        return False
+    await asyncio.gather(asyncio.shield(task), return_exceptions=True)
+    return True
+
+
+def record_hit():
+    global buffer_hits
+    buffer_hits += 1
+
+
+def record_miss():
+    global buffer_misses
+    buffer_misses += 1
+
+
+def log_stats():
+    total = buffer_hits + buffer_misses
+    logging.info(
+        f"🗂️ Запас вариантов: из запаса {buffer_hits}, заново {buffer_misses} "
+        f"({buffer_hits / total if total else 0:.0%}), дозапросов {buffer_refills}, в работе {len(_refill_tasks)}"
+    )
@@ -0,0 +1,129 @@
+import json
+import logging
+import re
+from collections import Counter, defaultdict
+
+from bot import config
+
+# Дописывается к промпту этапа: тот же ответ, но одним JSON-объектом
+JSON_INSTRUCTION = """
+    Верни ответ строго одним JSON-объектом, без markdown и пояснений:
+    {"answer": "комментарий (для профиля — тэглайн)", "description": "описание проекта или пустая строка",
+     "options": [{"title": "эмодзи и краткое название варианта", "details": "описание варианта"}]}
+    В "options" — все пункты списка из формата выше, по одному объекту на пункт.
+    """
+
+# Переспрос, если ответ не разобрался ни как JSON, ни старым парсером (к нему тоже дописывается JSON_INSTRUCTION)
+REPAIR_PROMPT = """
+    Ответ ниже не удалось разобрать. Перепиши его без изменения смысла, сохранив все варианты.
+    Ответ:
+    {response}
+    """
+
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "answer": {"type": "string"},
+        "description": {"type": "string"},
+        "options": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"title": {"type": "string"}, "details": {"type": "string"}},
+                "required": ["title", "details"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["answer", "description", "options"],
+    "additionalProperties": False,
+}
+
+MARKDOWN_EMPHASIS = re.compile(r"(\*\*|__|[*_~`])")
+MARKDOWN_LINK = re.compile(r"\[([^\]]+)\]\((https?://[^\)]+)\)")
+
+
+def response_format() -> dict | None:
+    """response_format для запроса в режиме BRAND_JSON_MODE (None — только инструкция в промпте)."""
+    match config.BRAND_JSON_MODE:
+        case "json_schema":
+            return {"type": "json_schema", "json_schema": {"name": "brand_stage", "strict": True, "schema": RESPONSE_SCHEMA}}
+        case "json_object":
+            return {"type": "json_object"}
+        case _:
+            return None
+
+
+def clean_value(value: str) -> str:
+    """Та же чистка, что в parse_ai_response: без markdown-выделения, ссылки — в HTML."""
+    value = MARKDOWN_EMPHASIS.sub("", value)
+    value = re.sub(r"\s+", " ", value).strip()
+    return MARKDOWN_LINK.sub(r'<a href="\2">\1</a>', value)
+
+
+def decode_json_response(response: str) -> dict | None:
+    """
+    Разбирает JSON-ответ этапа в тот же словарь, что и parse_ai_response.
+    None — ответ не JSON или не подходит под схему (нет вариантов, поля не тех типов).
+    """
+    if not response:
+        return None
+
+    # Модель может обернуть JSON в ```json ... ``` или добавить текст вокруг
+    start, end = response.find("{"), response.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    try:
+        data = json.loads(response[start:end + 1])
+    except json.JSONDecodeError:
+        return None
+
+    if not isinstance(data, dict) or not isinstance(data.get("answer"), str) or not isinstance(data.get("options"), list):
+        return None
+    description = data.get("description") or ""
+    if not isinstance(description, str):
+        return None
+
+    options = []
+    for option in data["options"]:
+        if not isinstance(option, dict) or not isinstance(option.get("title"), str):
+            return None
+        title = clean_value(option["title"])
+        details = clean_value(option["details"]) if isinstance(option.get("details"), str) else ""
+        if not title:
+            continue
+        options.append({"short": title, "full": f"<b>{title}</b>: {details}" if details else title})
+
+    if not options:
+        return None
+
+    return {"answer": clean_value(data["answer"]), "description": clean_value(description), "options": options}
+
+
+class ParseStats:
+    """Как разбираются ответы каждого этапа: JSON, старым парсером, после переспроса или не разобрались."""
+
+    OUTCOMES = ("json", "legacy", "repaired", "failed")
+
+    def __init__(self):
+        self.outcomes: defaultdict[str, Counter] = defaultdict(Counter)
+        self.parse_time: defaultdict[str, float] = defaultdict(float)  # Только локальный разбор, без переспроса
+
+    def record(self, stage: str, outcome: str, elapsed: float):
+        self.outcomes[stage][outcome] += 1
+        self.parse_time[stage] += elapsed
+
+    def log_stats(self, stage: str):
+        outcomes = self.outcomes[stage]
+        total = sum(outcomes.values())
+        if not total:
+            return
+        counts = ", ".join(f"{outcome} {outcomes[outcome]}" for outcome in self.OUTCOMES)
+        logging.info(
+            f"🧾 Разбор ответов '{stage}': {counts}; не разобрано {outcomes['failed'] / total:.0%}, "
+            f"среднее время разбора {self.parse_time[stage] / total * 1000:.2f} мс"
+        )
+
+
+# Общая статистика разбора на весь процесс
+parse_stats = ParseStats()
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import time
+
+from bot import config
+from bot.services.brand_ask_ai import get_parsed_response_with_usage
+
+
+class PrefetchScheduler:
+    """
+    Предзагрузка следующего этапа проекта, пока пользователь выбирает вариант.
+    Для каждого показанного варианта в фоне запускается запрос следующего этапа;
+    ключ — готовый промпт, так что обработчик клика забирает ответ, только если промпт совпал.
+    Невыбранные предзагрузки отменяются. Одновременных запросов не больше
+    `per_user_limit` на пользователя и `global_limit` на весь процесс.
+    """
+
+    def __init__(self, per_user_limit: int, global_limit: int, ttl: float):
+        self.per_user_limit = per_user_limit
+        self.global_limit = global_limit
+        self.ttl = ttl
+        self._entries: dict[int, dict[str, tuple[asyncio.Task, float]]] = {}  # user_id -> {промпт: (задача, создана)}
+
+        # 📦 Метрики
+        self.scheduled = 0
+        self.skipped = 0  # Не запущены из-за бюджета
+        self.hits = 0
+        self.misses = 0
+        self.cancelled_in_flight = 0  # Отменены до ответа (токены частично потрачены)
+        self.wasted_tokens = 0  # Токены готовых, но невыбранных ответов
+        self.used_tokens = 0  # Токены предзагрузок, которые пригодились
+
+    @property
+    def in_flight(self) -> int:
+        return sum(1 for entries in self._entries.values() for task, _ in entries.values() if not task.done())
+
+    async def _fetch(self, prompt: str, max_tokens: int | None, stage: str) -> tuple[dict, int]:
+        return await get_parsed_response_with_usage(prompt, max_tokens, stage)
+
+    def schedule(self, user_id: int, prompts: list[str], max_tokens: int | None = None, stage: str = "brand"):
+        """Заменяет предзагрузки пользователя новыми (по одной на показанный вариант)."""
+        self.cancel(user_id)
+        self._evict_expired()
+
+        entries = self._entries.setdefault(user_id, {})
+        for prompt in prompts:
+            if len(entries) >= self.per_user_limit or self.in_flight >= self.global_limit:
+                self.skipped += 1
+                continue
+            entries[prompt] = (asyncio.create_task(self._fetch(prompt, max_tokens, stage)), time.monotonic())
+            self.scheduled += 1
+
+    def take(self, user_id: int, prompt: str) -> asyncio.Task | None:
+        """
+        Забирает предзагрузку для выбранного варианта (задача может быть ещё в работе),
+        остальные предзагрузки пользователя отменяются.
+        """
+        entry = self._entries.get(user_id, {}).pop(prompt, None)
+        self.cancel(user_id)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        task = entry[0]
+        task.add_done_callback(self._count_used)
+        return task
+
+    def _count_used(self, task: asyncio.Task):
+        if not task.cancelled() and task.exception() is None:
+            self.used_tokens += task.result()[1]
+
+    def cancel(self, user_id: int):
+        """Отменяет все невыбранные предзагрузки пользователя и учитывает потраченное впустую."""
+        for task, _ in self._entries.pop(user_id, {}).values():
+            if task.done():
+                if not task.cancelled() and task.exception() is None:
+                    self.wasted_tokens += task.result()[1]
+            else:
+                task.cancel()
+                self.cancelled_in_flight += 1
+
+    def _evict_expired(self):
+        """Пользователь мог уйти, не выбрав вариант: старые предзагрузки не держим в памяти."""
+        now = time.monotonic()
+        expired_users = [
+            user_id for user_id, entries in self._entries.items()
+            if entries and all(now - created_at > self.ttl for _, created_at in entries.values())
+        ]
+        for user_id in expired_users:
+            self.cancel(user_id)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def log_stats(self):
+        logging.info(
+            f"🔮 Предзагрузка этапов: запущено {self.scheduled} (пропущено по бюджету {self.skipped}), "
+            f"в работе {self.in_flight}, попаданий {self.hits}, промахов {self.misses} ({self.hit_rate:.0%}); "
+            f"токенов пригодилось {self.used_tokens}, впустую {self.wasted_tokens}, "
+            f"отменено до ответа {self.cancelled_in_flight}"
+        )
+
+
+# Общий планировщик предзагрузки на весь процесс
+brand_prefetch = PrefetchScheduler(
+    per_user_limit=config.BRAND_PREFETCH_PER_USER,
+    global_limit=config.BRAND_PREFETCH_GLOBAL,
+    ttl=config.BRAND_PREFETCH_TTL,
+)
@@ -0,0 +1,222 @@
+# Промпты этапов разработки проекта (вынесены из обработчиков, чтобы их можно было
+# собирать заранее — например, для предзагрузки следующего этапа).
+import html
+import logging
+import math
+import re
+from collections import OrderedDict
+
+from bot import config
+
+HTML_TAG = re.compile(r"<[^>]+>")
+
+# Меньше не обрезаем исходную мысль, даже если поля не влезают в бюджет этапа
+CONTEXT_MIN_TOKENS = 30
+
+# Оценки собранных промптов: промпт -> (этап, прежняя подстановка, компактно без обрезки, итог).
+# Учитываются только при отправке (record_prompt_sent): предзагрузка и повторная сборка того же промпта не в счёт
+PROMPT_ESTIMATES_MAX = 500
+_prompt_estimates: OrderedDict[str, tuple[str, int, int, int]] = OrderedDict()
+
+# 📦 Метрики по отправленным промптам (оценка в токенах)
+prompt_tokens_sent = 0
+prompt_tokens_saved = 0  # Компактная подстановка выборов (без repr словаря и HTML)
+prompt_tokens_truncated = 0  # Обрезано из длинного ввода пользователя
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка длины текста в токенах (PROMPT_CHARS_PER_TOKEN символов на токен)."""
+    return math.ceil(len(text) / config.PROMPT_CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Обрезает текст до ~`max_tokens` токенов по границе слова."""
+    max_chars = int(max_tokens * config.PROMPT_CHARS_PER_TOKEN)
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars].rsplit(" ", 1)[0] or text[:max_chars]
+    return cut.rstrip(" ,.;:—-") + "…"
+
+
+def plain_text(text: str) -> str:
+    """Без HTML-тегов, сущностей и лишних пробелов."""
+    return re.sub(r"\s+", " ", html.unescape(HTML_TAG.sub("", text))).strip()
+
+
+def choice_text(choice, default: str = "Не выбрано") -> str:
+    """
+    Выбор прошлого этапа для промпта: один раз, без repr словаря и HTML.
+    Для варианта AI — "краткое: описание" (поле full уже начинается с краткой формулировки),
+    для своего варианта — сам текст.
+    """
+    if isinstance(choice, dict):
+        text = choice.get("full") or choice.get("short") or default
+    else:
+        text = choice or default
+    return plain_text(text)
+
+
+def compact_prompt(stage: str, template, context: str, *choices) -> str:
+    """
+    Собирает промпт этапа `stage` шаблоном `template(context, *choices)` из компактных полей:
+    выборы обрезаются до BRAND_CHOICE_MAX_TOKENS, исходная мысль — до BRAND_CONTEXT_MAX_TOKENS.
+    Бюджет BRAND_PROMPT_FIELDS_MAX_TOKENS — только на подставленные поля (текст шаблона растёт с числом
+    вариантов и в бюджет не входит); при превышении мысль обрезается ещё, но не короче CONTEXT_MIN_TOKENS.
+    """
+    if not config.BRAND_COMPACT_PROMPTS:
+        return template(context, *choices)
+
+    legacy_tokens = estimate_tokens(template(context, *choices))
+    context = plain_text(context or "")
+    choices = [choice_text(choice) for choice in choices]
+    untruncated_tokens = estimate_tokens(template(context, *choices))
+
+    context = truncate_to_tokens(context, config.BRAND_CONTEXT_MAX_TOKENS)
+    choices = [truncate_to_tokens(choice, config.BRAND_CHOICE_MAX_TOKENS) for choice in choices]
+    prompt = template(context, *choices)
+
+    template_tokens = estimate_tokens(template("", *[""] * len(choices)))
+    overflow = estimate_tokens(prompt) - template_tokens - config.BRAND_PROMPT_FIELDS_MAX_TOKENS
+    if overflow > 0:
+        context = truncate_to_tokens(context, max(estimate_tokens(context) - overflow, CONTEXT_MIN_TOKENS))
+        prompt = template(context, *choices)
+
+    _prompt_estimates[prompt] = (stage, legacy_tokens, untruncated_tokens, estimate_tokens(prompt))
+    _prompt_estimates.move_to_end(prompt)
+    while len(_prompt_estimates) > PROMPT_ESTIMATES_MAX:
+        _prompt_estimates.popitem(last=False)
+    return prompt
+
+
+def record_prompt_sent(prompt: str):
+    """Учитывает экономию промпта, который действительно уходит в LLM (собранного compact_prompt)."""
+    global prompt_tokens_sent, prompt_tokens_saved, prompt_tokens_truncated
+    estimate = _prompt_estimates.get(prompt)
+    if estimate is None:
+        return
+
+    stage, legacy_tokens, untruncated_tokens, tokens = estimate
+    saved = max(legacy_tokens - untruncated_tokens, 0)
+    truncated = max(untruncated_tokens - tokens, 0)
+    prompt_tokens_sent += tokens
+    prompt_tokens_saved += saved
+    prompt_tokens_truncated += truncated
+    logging.info(
+        f"✂️ Промпт '{stage}': ~{tokens} токенов (компактная подстановка −{saved}, обрезано ввода −{truncated}); "
+        f"всего отправлено ~{prompt_tokens_sent}, сэкономлено ~{prompt_tokens_saved}, обрезано ~{prompt_tokens_truncated}"
+    )
+
+
+def options_word(n: int) -> str:
+    """"3 варианта", "9 вариантов"."""
+    return "варианта" if 2 <= n % 10 <= 4 and not 12 <= n % 100 <= 14 else "вариантов"
+
+
+def numbered_options(template: str, n: int, indent: str = "    ") -> str:
+    """Строки формата ответа "1. ...", "2. ..." для `n` вариантов (`{i}` в шаблоне — номер варианта)."""
+    return f"\n{indent}".join(f"{i}. {template.format(i=i)}" for i in range(1, n + 1))
+
+
+def choice_short(choice, default: str = "Не выбрано") -> str:
+    """Краткая формулировка выбора этапа (вариант AI или свой вариант пользователя)."""
+    if isinstance(choice, dict):
+        return choice.get("short", default)
+    return choice or default
+
+
+def stage1_template(context: str, username: str, n: int) -> str:
+    """Этап 1: проблема или потребность (`n` — сколько вариантов просить)."""
+    return f"""
+    Исходный контекст: {context}, выбрано название {username}.
+    Проанализируй название и контекст с точки зрения смысловых ассоциаций и потенциального позиционирования.
+    Каким {n} различным вариантам проблемы или потребностей может быть адресован такой проект?
+
+    Ответ выведи строго по формату:
+    Комментарий: [краткий комментарий к выбору {username} и подводящий вопрос. 1-2 предложения.]
+
+    {numbered_options("**[эмодзи]** [Проблема/Потребность {i}]: [Описание]", n)}
+    """
+
+
+AUDIENCE_OPTION = (
+    "[эмодзи] [Название аудитории {i}]: [Описание, почему именно эта аудитория заинтересована "
+    "и какие выгоды она получит (1-2 предложения)]"
+)
+
+
+def stage2_template(context: str, username: str, stage1_choice, n: int) -> str:
+    """Этап 2: целевая аудитория (`n` — сколько вариантов просить)."""
+    return f"""
+    Пользователь изначально указал: {context}.
+    Пользователь выбрал название {username} и указал на проблему/потребность {stage1_choice}.
+    Исходя из выявленной проблемы, с учетом контекста и выбранного названия предложи {n} {options_word(n)} целевой аудитории, которая получит наибольшую выгоду от решения.
+
+    Ответ выведи строго по формату:
+    Комментарий: [краткий комментарий к выбору {stage1_choice} (отметь выбор в тексте) и краткий вопрос-подводка к вариантам. 1-2 предложения]
+{numbered_options(AUDIENCE_OPTION, n, indent="")}
+    """
+
+
+def stage3_template(context: str, username: str, stage1_choice, stage2_choice, n: int) -> str:
+    """Этап 3: формат проекта (`n` — сколько вариантов просить)."""
+    return f"""
+    Исходный контекст: {context}, выбрано имя "{username}".
+    Проблема/потребность "{stage1_choice}" и целевая аудитория "{stage2_choice}" (результаты предыдущих этапов).
+    С учетом всего этого, какой конкретно можно реализовать проект, чтобы эффективно решать указанную проблему и приносить качественную ценность для аудитории?
+
+    Ответ выведи строго по формату:
+    Комментарий: [краткий комментарий к выбору {stage2_choice} (отметь выбор в тексте) и краткий вопрос-подводка к вариантам. 1-2 предложения]
+    {numbered_options("[эмодзи] [Краткое определение]: [1-2 предложения, поясняющие формат]", n)}
+    """
+
+
+def profile_template(context: str, username: str, stage1_choice: str, stage2_choice: str, stage3_choice: str) -> str:
+    """Профиль проекта: тэглайн, описание и похожие проекты (выборы этапов — краткие формулировки)."""
+    return f"""
+    Пользователь создал концепцию проекта:
+    - Мысль: {context}
+    - Название: {username}
+    - Проблема: {stage1_choice}
+    - Аудитория: {stage2_choice}
+    - Формат: {stage3_choice}
+
+    Сформулируй:
+    2. **Краткое описание проекта** – 2-3 предложения, объясняющие суть проекта.
+    3. **3 реально существующих проекта** в этой сфере, с кратким описанием каждого.
+
+    Учитывай изначальную мысль пользователя.
+    Сформулируй и выведи в формате:
+    Тэглайн: [короткое, яркое описание сути проекта одно предложение]
+    Описание: [краткое, чёткое описание проекта, в 1-2 предложения] 
+    Примеры похожих проектов:
+    1. **[Название проекта]** – [1 предложение о сути и цели проекта]
+    2. **[Название проекта]** – [1 предложение о сути и цели проекта]
+    3. **[Название проекта]** – [1 предложение о сути и цели проекта]
+    """
+
+
+def build_stage1_prompt(context: str, username: str, n: int = 3) -> str:
+    return compact_prompt("stage1", lambda context: stage1_template(context, username, n), context)
+
+
+def build_stage2_prompt(context: str, username: str, stage1_choice, n: int = 3) -> str:
+    return compact_prompt(
+        "stage2", lambda context, stage1_choice: stage2_template(context, username, stage1_choice, n),
+        context, stage1_choice
+    )
+
+
+def build_stage3_prompt(context: str, username: str, stage1_choice, stage2_choice, n: int = 3) -> str:
+    return compact_prompt(
+        "stage3",
+        lambda context, stage1_choice, stage2_choice: stage3_template(context, username, stage1_choice, stage2_choice, n),
+        context, stage1_choice, stage2_choice
+    )
+
+
+def build_profile_prompt(context: str, username: str, stage1_choice: str, stage2_choice: str, stage3_choice: str) -> str:
+    return compact_prompt(
+        "profile",
+        lambda context, *choices: profile_template(context, username, *choices),
+        context, stage1_choice, stage2_choice, stage3_choice
+    )
@@ -0,0 +1,196 @@
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict
+
+from services.name_check import check_multiple_usernames, UNKNOWN_STATUS
+from services.deadline import Deadline
+
+import config
+
+# Слова, не влияющие на смысл идеи ("бот для медитации" ≈ "медитация бот")
+STOPWORDS = {
+    "и", "в", "во", "на", "для", "с", "со", "по", "о", "об", "от", "до", "из", "к", "ко", "у", "за", "про",
+    "а", "но", "или", "что", "как", "это", "мой", "моя", "мое", "моё", "наш", "наша", "свой", "своя",
+    "the", "a", "an", "for", "of", "and", "or", "to", "in", "on", "with", "my", "our",
+}
+
+# Окончания, которые отрезаются при упрощённом стемминге (длинные проверяются первыми)
+SUFFIXES = sorted({
+    "ами", "ями", "ии", "ого", "его", "ому", "ему", "ыми", "ими", "ией", "ия", "ие", "ий", "ой", "ей", "ам", "ям",
+    "ах", "ях", "ом", "ем", "ов", "ев", "ую", "юю", "ая", "яя", "ое", "ее", "ые", "ы", "и", "а", "я",
+    "о", "е", "у", "ю", "ь", "s", "es", "ing", "ed",
+}, key=len, reverse=True)
+
+MERSENNE_PRIME = (1 << 61) - 1
+
+
+def stem(word: str) -> str:
+    """Упрощённый стемминг: отрезает типичное окончание, оставляя не меньше 4 символов."""
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            return word[:-len(suffix)]
+    return word
+
+
+def normalize_context(context: str) -> list[str]:
+    """Приводит контекст к набору значимых основ слов (порядок не важен)."""
+    words = re.findall(r"[a-zа-яё0-9]+", context.casefold().replace("ё", "е"))
+    return sorted({stem(word) for word in words if word not in STOPWORDS})
+
+
+def shingles(tokens: list[str], size: int) -> set[str]:
+    """Символьные n-граммы по каждой основе (с границами слова)."""
+    result = set()
+    for token in tokens:
+        padded = f"_{token}_"
+        if len(padded) <= size:
+            result.add(padded)
+        for i in range(len(padded) - size + 1):
+            result.add(padded[i:i + size])
+    return result
+
+
+class ContextSimilarityCache:
+    """
+    Кэш результатов генерации для почти одинаковых контекстов.
+    Контекст нормализуется и разбивается на шинглы, сходство оценивается по MinHash (≈ Jaccard).
+    Хранит последние `max_size` контекстов, записи старше `ttl` секунд удаляются.
+    """
+
+    def __init__(self, max_size: int, ttl: float, threshold: float, num_hashes: int, shingle_size: int):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self._hash_params = [self._hash_param(i) for i in range(num_hashes)]
+        self._entries: OrderedDict[tuple, dict] = OrderedDict()  # (основы, стиль) -> запись
+
+        # 📦 Метрики
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _hash_param(seed: int) -> tuple[int, int]:
+        digest = hashlib.blake2b(seed.to_bytes(4, "little"), digest_size=16).digest()
+        return int.from_bytes(digest[:8], "little") % MERSENNE_PRIME | 1, int.from_bytes(digest[8:], "little") % MERSENNE_PRIME
+
+    def signature(self, shingle_set: set[str]) -> list[int]:
+        hashed = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little") for s in shingle_set]
+        if not hashed:
+            return [MERSENNE_PRIME] * len(self._hash_params)
+        return [min((a * h + b) % MERSENNE_PRIME for h in hashed) for a, b in self._hash_params]
+
+    @staticmethod
+    def similarity(first: list[int], second: list[int]) -> float:
+        return sum(x == y for x, y in zip(first, second)) / len(first)
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        for key in [key for key, entry in self._entries.items() if entry["expires_at"] <= now]:
+            del self._entries[key]
+
+    def store(self, context: str, style: str | None, usernames: list[str]):
+        """Запоминает проверенные свободные username для контекста."""
+        tokens = normalize_context(context)
+        if not tokens or not usernames:
+            return
+
+        key = (tuple(tokens), style)
+        self._entries[key] = {
+            "signature": self.signature(shingles(tokens, self.shingle_size)),
+            "style": style,
+            "usernames": list(usernames),
+            "expires_at": time.monotonic() + self.ttl,
+        }
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def lookup(self, context: str, style: str | None, exclude: list[str] | None = None) -> tuple[list[str], float]:
+        """
+        Возвращает username самого похожего контекста с тем же стилем (если сходство ≥ порога).
+        `exclude` — имена, которые выдавать нельзя; запись, где других не осталось, не считается попаданием.
+        """
+        self._evict_expired()
+        tokens = normalize_context(context)
+        if not tokens:
+            self.misses += 1
+            return [], 0.0
+
+        excluded = {username.casefold() for username in exclude or []}
+
+        def usable(entry_key: tuple) -> list[str]:
+            return [u for u in self._entries[entry_key]["usernames"] if u.casefold() not in excluded]
+
+        key = (tuple(tokens), style)
+        if key in self._entries and usable(key):
+            best_key, best_similarity = key, 1.0
+        else:
+            signature = self.signature(shingles(tokens, self.shingle_size))
+            best_key, best_similarity = None, 0.0
+            for entry_key, entry in self._entries.items():
+                if entry["style"] != style:
+                    continue
+                similarity = self.similarity(signature, entry["signature"])
+                if similarity > best_similarity and similarity >= self.threshold and usable(entry_key):
+                    best_key, best_similarity = entry_key, similarity
+
+        if best_key is None:
+            self.misses += 1
+            return [], best_similarity
+
+        self._entries.move_to_end(best_key)
+        self.hits += 1
+        return usable(best_key), best_similarity
+
+    def discard(self, usernames: list[str]):
+        """Убирает username, которые оказались заняты, из всех записей."""
+        gone = {username.casefold() for username in usernames}
+        for entry in self._entries.values():
+            entry["usernames"] = [u for u in entry["usernames"] if u.casefold() not in gone]
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def log_stats(self):
+        logging.info(
+            f"🧩 Кэш похожих контекстов: {len(self._entries)}/{self.max_size} записей, "
+            f"попаданий {self.hits}, промахов {self.misses} ({self.hit_rate:.0%})"
+        )
+
+
+# Общий кэш похожих контекстов на весь процесс
+context_cache = ContextSimilarityCache(
+    max_size=config.CONTEXT_CACHE_SIZE,
+    ttl=config.CONTEXT_CACHE_TTL,
+    threshold=config.CONTEXT_CACHE_THRESHOLD,
+    num_hashes=config.CONTEXT_CACHE_NUM_HASHES,
+    shingle_size=config.CONTEXT_CACHE_SHINGLE_SIZE,
+)
+
+
+async def take_verified_from_context_cache(context: str, style: str | None, n: int,
+                                           exclude: list[str] | None = None,
+                                           deadline: Deadline | None = None) -> list[str]:
+    """
+    Выдаёт до `n` ранее найденных свободных username для похожего контекста
+    после быстрой перепроверки (мимо кэша статусов). `exclude` — уже показанные пользователю имена.
+    """
+    candidates, similarity = context_cache.lookup(context, style, exclude)
+    if not candidates:
+        context_cache.log_stats()
+        return []
+
+    candidates = candidates[:n]
+    results = await check_multiple_usernames(candidates, fresh=True, deadline=deadline)
+    usernames = [username for username in candidates if results.get(username) == "Свободно"]
+    context_cache.discard([username for username in candidates if results.get(username) not in ("Свободно", UNKNOWN_STATUS)])
+
+    logging.info(f"🧩 Похожий контекст (сходство {similarity:.2f}): выдано {len(usernames)} из {len(candidates)}")
+    context_cache.log_stats()
+    return usernames
@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import time
+from collections import Counter, defaultdict
+
+# 📦 Таймауты по этапам за всё время работы процесса
+stage_timeouts_total: Counter = Counter()
+
+
+class Deadline:
+    """
+    Общий бюджет времени одного запроса пользователя (например, GEN_TIMEOUT).
+    Передаётся во все вызовы LLM, Fragment и БД: каждый получает не больше оставшегося времени,
+    так что по истечении бюджета конвейер отдаёт то, что успел проверить, а не отменяется целиком.
+    Запоминает, сколько времени и таймаутов пришлось на каждый этап.
+    """
+
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + budget
+
+        # 📦 Метрики по этапам ("llm", "fragment", "db")
+        self.stage_time: defaultdict[str, float] = defaultdict(float)  # Суммарно (параллельные вызовы складываются)
+        self.stage_timeouts: Counter = Counter()
+
+    @property
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining <= 0
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def timeout(self, cap: float | None = None) -> float:
+        """Оставшееся время, но не больше собственного таймаута вызова `cap`."""
+        return self.remaining if cap is None else min(self.remaining, cap)
+
+    def record_timeout(self, stage: str):
+        self.stage_timeouts[stage] += 1
+        stage_timeouts_total[stage] += 1
+
+    async def run(self, stage: str, awaitable):
+        """Выполняет вызов этапа `stage` в пределах оставшегося бюджета; по истечении — asyncio.TimeoutError."""
+        started_at = time.monotonic()
+        try:
+            return await asyncio.wait_for(awaitable, timeout=self.remaining)
+        except asyncio.TimeoutError:
+            self.record_timeout(stage)
+            raise
+        except asyncio.CancelledError:
+            if self.expired:
+                self.record_timeout(stage)  # Вызов отменён вместе с попыткой по истечении бюджета
+            raise
+        finally:
+            self.stage_time[stage] += time.monotonic() - started_at
+
+    def log_stats(self):
+        stages = ", ".join(
+            f"{stage} {spent:.2f} сек (таймаутов {self.stage_timeouts[stage]})"
+            for stage, spent in self.stage_time.items()
+        ) or "нет вызовов"
+        logging.info(
+            f"⏰ Бюджет: {min(self.elapsed, self.budget):.2f} из {self.budget:g} сек; по этапам: {stages}; "
+            f"таймаутов за всё время: {dict(stage_timeouts_total) or 0}"
+        )
+
+
+async def run_with_deadline(deadline: Deadline | None, stage: str, awaitable):
+    """Как Deadline.run, но без дедлайна просто дожидается вызова (фоновые задачи, ручная проверка)."""
+    if deadline is None:
+        return await awaitable
+    return await deadline.run(stage, awaitable)
@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import math
+
+from database.database import fetch_free_rates
+
+import config
+
+# Оценки доли свободных username (сглаженные): по (категория, стиль), по стилю и общая
+rates_by_category_style: dict[tuple[str | None, str | None], float] = {}
+rates_by_style: dict[str | None, float] = {}
+global_rate = config.ADAPTIVE_BATCH_DEFAULT_RATE
+
+# Сколько username из ответа LLM доходит до проверки: [дошло, сгенерировано] по стилю.
+# Отсеянные фильтром занятых, пре-проверкой по БД и исключениями сессии в generated_usernames не попадают,
+# поэтому доля свободных из БД считается только по дошедшим до проверки — её нужно умножить на эту долю
+pass_counts: dict[str | None, list[int]] = {}
+
+_refresh_task = None
+
+
+def smoothed_rate(free: int, total: int, prior_rate: float) -> float:
+    """Байесовское сглаживание: редкие комбинации тянутся к более общей оценке."""
+    weight = config.ADAPTIVE_BATCH_PRIOR_WEIGHT
+    return (free + prior_rate * weight) / (total + weight)
+
+
+async def refresh_free_rates():
+    """Пересчитывает доли свободных username из generated_usernames."""
+    global rates_by_category_style, rates_by_style, global_rate
+
+    rows = await fetch_free_rates(config.ADAPTIVE_BATCH_WINDOW_DAYS)
+    if not rows:
+        return
+
+    total_free = sum(row[2] for row in rows)
+    total_checked = sum(row[3] for row in rows)
+    new_global = smoothed_rate(total_free, total_checked, config.ADAPTIVE_BATCH_DEFAULT_RATE)
+
+    by_style: dict[str | None, list[int]] = {}
+    for _category, style, free, total in rows:
+        counts = by_style.setdefault(style, [0, 0])
+        counts[0] += free
+        counts[1] += total
+    new_by_style = {style: smoothed_rate(free, total, new_global) for style, (free, total) in by_style.items()}
+
+    rates_by_category_style = {
+        (category, style): smoothed_rate(free, total, new_by_style[style])
+        for category, style, free, total in rows
+    }
+    rates_by_style = new_by_style
+    global_rate = new_global
+
+    logging.info(
+        f"📈 Доли свободных username обновлены: общая {global_rate:.0%}, "
+        f"по стилям {', '.join(f'{style}: {rate:.0%}' for style, rate in rates_by_style.items())}"
+    )
+
+
+def record_pass_rate(style: str | None, generated: int, passed: int):
+    """Учитывает итог запуска: сколько из `generated` username LLM дошло до проверки (не отсеяно заранее)."""
+    if generated <= 0:
+        return
+    counts = pass_counts.setdefault(style, [0, 0])
+    counts[0] += passed
+    counts[1] += generated
+
+
+def estimate_pass_rate(style: str | None) -> float:
+    """Доля username из ответа LLM, которые не отсеиваются до проверки (сглаженная к 1 — пока нет данных)."""
+    passed, generated = pass_counts.get(style, (0, 0))
+    return smoothed_rate(passed, generated, 1.0)
+
+
+def estimate_free_rate(category: str | None, style: str | None) -> float:
+    """Доля свободных среди всех username ответа LLM: доля свободных среди проверенных × доля дошедших до проверки."""
+    rate = rates_by_category_style.get((category, style))
+    if rate is None:
+        rate = rates_by_style.get(style, global_rate)
+    return min(max(rate * estimate_pass_rate(style), config.ADAPTIVE_BATCH_MIN_RATE), 1.0)
+
+
+def probability_at_least(k: int, n: int, p: float) -> float:
+    """P(X ≥ k) для X ~ Binomial(n, p)."""
+    return 1.0 - sum(math.comb(n, i) * p ** i * (1 - p) ** (n - i) for i in range(k))
+
+
+def max_batch_by_tokens() -> int:
+    """Сколько username помещается в ADAPTIVE_BATCH_MAX_TOKENS."""
+    return max(1, (config.ADAPTIVE_BATCH_MAX_TOKENS - config.TOKENS_RESPONSE_OVERHEAD) // config.TOKENS_PER_USERNAME)
+
+
+def batch_size_for(needed: int, category: str | None, style: str | None) -> int:
+    """
+    Наименьший размер запроса к LLM, при котором одна попытка с вероятностью
+    ADAPTIVE_BATCH_CONFIDENCE даст `needed` свободных username (в пределах лимита токенов).
+    """
+    p = estimate_free_rate(category, style)
+    upper = max(config.GENERATED_USERNAME_COUNT, max_batch_by_tokens())
+    for n in range(max(needed, config.ADAPTIVE_BATCH_MIN_SIZE), upper + 1):
+        if probability_at_least(needed, n, p) >= config.ADAPTIVE_BATCH_CONFIDENCE:
+            return n
+    return upper
+
+
+def max_tokens_for(batch_size: int) -> int:
+    """Бюджет токенов ответа под `batch_size` username (не меньше MAX_TOKENS)."""
+    needed_tokens = config.TOKENS_RESPONSE_OVERHEAD + batch_size * config.TOKENS_PER_USERNAME
+    return max(config.MAX_TOKENS, min(needed_tokens, config.ADAPTIVE_BATCH_MAX_TOKENS))
+
+
+async def run_free_rate_refresher():
+    while True:
+        try:
+            await refresh_free_rates()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"❌ Ошибка обновления долей свободных username: {e}")
+        await asyncio.sleep(config.ADAPTIVE_BATCH_REFRESH_INTERVAL)
+
+
+def start_free_rate_refresher():
+    """Запускает периодическое обновление оценок в фоне (из on_startup)."""
+    global _refresh_task
+    if _refresh_task is None:
+        _refresh_task = asyncio.create_task(run_free_rate_refresher())
+
+
+async def stop_free_rate_refresher():
+    global _refresh_task
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        await asyncio.gather(_refresh_task, return_exceptions=True)
+        _refresh_task = None
@@ -0,0 +1,97 @@
+import os
+import logging
+
+import httpx
+from dotenv import load_dotenv
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from bot import config
+
+# Загрузка переменных окружения
+load_dotenv()
+
+# Получение ключей API из окружения
+API_KEY = os.getenv("API_KEY")
+BASE_URL = os.getenv("BASE_URL")
+
+# Глобальный асинхронный клиент (один пул соединений на всё приложение)
+client = None
+
+
+def get_client() -> AsyncOpenAI:
+    """Возвращает общий AsyncOpenAI-клиент. Если его нет — создаёт."""
+    global client
+    if client is None:
+        http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=config.LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=config.LLM_MAX_KEEPALIVE_CONNECTIONS,
+            )
+        )
+        client = AsyncOpenAI(
+            api_key=API_KEY,
+            base_url=BASE_URL,
+            http_client=http_client,
+            timeout=config.LLM_TIMEOUT,
+            max_retries=config.LLM_MAX_RETRIES,
+        )
+        logging.info(
+            f"✅ LLM-клиент создан (соединений: {config.LLM_MAX_CONNECTIONS}, "
+            f"keep-alive: {config.LLM_MAX_KEEPALIVE_CONNECTIONS}, таймаут: {config.LLM_TIMEOUT} сек)"
+        )
+    return client
+
+
+async def close_llm_client():
+    """Закрывает пул соединений LLM-клиента при завершении работы."""
+    global client
+    if client is not None:
+        await client.close()
+        client = None
+        logging.info("✅ LLM-клиент закрыт.")
+
+
+async def chat_completion(messages: list[dict], model: str, max_tokens: int, temperature: float,
+                          timeout: float | None = None, response_format: dict | None = None):
+    """
+    Асинхронно отправляет запрос к LLM через общий клиент и возвращает объект ответа.
+    `timeout` — таймаут именно этого вызова (по умолчанию config.LLM_TIMEOUT).
+    `response_format` — структурированный ответ (json_object / json_schema), если провайдер его поддерживает.
+    """
+    extra = {"response_format": response_format} if response_format else {}
+    return await get_client().chat.completions.create(
+        model=model,
+        messages=messages,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        timeout=config.LLM_TIMEOUT if timeout is None else timeout,
+        **extra,
+    )
+
+
+async def stream_chat_completion(messages: list[dict], model: str, max_tokens: int, temperature: float,
+                                 timeout: float | None = None, response_format: dict | None = None,
+                                 on_finish=None):
+    """
+    Потоковый вариант chat_completion: асинхронно отдаёт фрагменты текста по мере генерации.
+    `on_finish(finish_reason)` вызывается с причиной окончания из последнего фрагмента ("stop", "length", ...).
+    Если потребитель прекращает чтение раньше, поток закрывается.
+    """
+    extra = {"response_format": response_format} if response_format else {}
+    stream = await get_client().chat.completions.create(
+        model=model,
+        messages=messages,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        timeout=config.LLM_TIMEOUT if timeout is None else timeout,
+        stream=True,
+        **extra,
+    )
+    try:
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].finish_reason and on_finish:
+                on_finish(chunk.choices[0].finish_reason)
+            if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        await stream.close()
@@ -1,24 +1,127 @@
 import asyncio
+import html as html_lib
 import logging
 import re
+import time
 import aiohttp
 import ssl
+from abc import ABC, abstractmethod
+from collections import deque
+from urllib.parse import urljoin, urlparse, parse_qs
 from bs4 import BeautifulSoup
 from database.database import save_username_to_db  # Импорт здесь, чтобы избежать циклических импортов
+from services.availability_cache import availability_cache
+from services.deadline import Deadline, run_with_deadline
+from services.rate_limiter import AdaptiveRateLimiter
+from services.single_flight import SingleFlight
+from services.taken_filter import remember_status
 
+import config
 
-async def check_multiple_usernames(usernames: list[str], save_to_db: bool = False) -> dict:
+# SSL-контекст создаётся один раз на процесс (а не на каждый username)
+SSL_CONTEXT = ssl.create_default_context()
+SSL_CONTEXT.check_hostname = False
+SSL_CONTEXT.verify_mode = ssl.CERT_NONE
+
+# Общая HTTP-сессия для проверок Fragment (создаётся в on_startup, закрывается в on_shutdown)
+http_session = None
+
+# Общий на процесс ограничитель запросов к fragment.com (token bucket + AIMD)
+fragment_limiter = AdaptiveRateLimiter(
+    name="Fragment",
+    rate=config.FRAGMENT_RATE,
+    min_rate=config.FRAGMENT_RATE_MIN,
+    max_rate=config.FRAGMENT_RATE_MAX,
+    burst=config.FRAGMENT_BURST,
+    max_concurrency=config.FRAGMENT_MAX_CONCURRENCY,
+    increase_step=config.FRAGMENT_RATE_INCREASE,
+    decrease_factor=config.FRAGMENT_RATE_DECREASE,
+)
+
+# Ограничитель для запасного бэкенда (страницы профилей t.me)
+telegram_limiter = AdaptiveRateLimiter(
+    name="t.me",
+    rate=config.TELEGRAM_RATE,
+    min_rate=config.TELEGRAM_RATE_MIN,
+    max_rate=config.TELEGRAM_RATE,
+    burst=config.TELEGRAM_BURST,
+    max_concurrency=config.TELEGRAM_MAX_CONCURRENCY,
+    increase_step=config.TELEGRAM_RATE_INCREASE,
+    decrease_factor=config.TELEGRAM_RATE_DECREASE,
+)
+
+# Одновременные проверки одного и того же username (без учёта регистра) делят один запрос
+fragment_single_flight = SingleFlight()
+
+UNKNOWN_STATUS = "Невозможно определить"
+
+
+async def init_http_session():
+    """Создаёт общую HTTP-сессию с keep-alive, лимитом соединений на хост и DNS-кэшем."""
+    global http_session
+    if http_session is not None and not http_session.closed:
+        return
+
+    connector = aiohttp.TCPConnector(
+        ssl=SSL_CONTEXT,
+        limit=config.FRAGMENT_MAX_CONNECTIONS,
+        limit_per_host=config.FRAGMENT_LIMIT_PER_HOST,
+        ttl_dns_cache=config.FRAGMENT_DNS_CACHE_TTL,
+        keepalive_timeout=config.FRAGMENT_KEEPALIVE_TIMEOUT,
+    )
+    http_session = aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=config.FRAGMENT_TIMEOUT),
+    )
+    logging.info(f"✅ HTTP-сессия для Fragment создана (соединений на хост: {config.FRAGMENT_LIMIT_PER_HOST}).")
+
+
+async def get_http_session() -> aiohttp.ClientSession:
+    """Возвращает общую HTTP-сессию. Если её нет — создаёт."""
+    if http_session is None or http_session.closed:
+        logging.warning("⚠️ HTTP-сессия отсутствует, создаю...")
+        await init_http_session()
+    return http_session
+
+
+async def close_http_session():
+    """Закрывает общую HTTP-сессию при завершении работы."""
+    global http_session
+    if http_session is not None:
+        await http_session.close()
+        http_session = None
+        logging.info("✅ HTTP-сессия для Fragment закрыта.")
+
+
+async def check_multiple_usernames(usernames: list[str], save_to_db: bool = False, fresh: bool = False,
+                                   deadline: Deadline | None = None, on_result=None) -> dict:
     """
     Проверяет список username параллельно.
+    `deadline` — общий бюджет запроса: не успевшие имена получают "Невозможно определить".
+    `on_result(username, статус)` вызывается по мере готовности каждой проверки.
     Возвращает словарь {username: статус}.
     """
-    async with aiohttp.ClientSession() as session:
-        tasks = [check_username_via_fragment(session, username) for username in usernames]
-        results = await asyncio.gather(*tasks)
+    async def check_one(username: str) -> str:
+        status = await check_username(username, fresh=fresh, deadline=deadline)
+        if on_result:
+            on_result(username, status)
+        return status
+
+    tasks = [check_one(username) for username in usernames]
+    results = await asyncio.gather(*tasks)
 
     availability = dict(zip(usernames, results))
+    availability_cache.log_stats()
+    fragment_limiter.log_stats()
+    logging.info(
+        f"🔗 Склейка проверок: запущено {fragment_single_flight.started}, "
+        f"получено чужим запросом {fragment_single_flight.shared}"
+    )
+
+    if save_to_db: # если запущена не генерация, а отдельная проверка (без бюджета: запись в БД не ограничиваем)
+        for username, status in availability.items():
+            remember_status(username, status)
 
-    if save_to_db: # если запущена не генерация, а отдельная проверка
         tasks = [
             save_username_to_db(username=username, status=status, category="Пользовательская проверка",
                                 context="Ручная проверка", llm="none")
@@ -28,52 +131,328 @@ async def check_multiple_usernames(usernames: list[str], save_to_db: bool = Fals
 
     return availability
 
+async def check_username(username: str, session: aiohttp.ClientSession | None = None, fresh: bool = False,
+                         deadline: Deadline | None = None) -> str:
+    """
+    Проверяет один username. Если сессия не передана, использует общую.
+    Используется и пакетной проверкой, и потоковой генерацией (проверка по одному имени).
+    Сначала смотрит в кэш статусов, в Fragment идёт только при промахе;
+    одновременные проверки одного имени склеиваются в один запрос.
+    `fresh=True` — не доверять кэшу (перепроверка перед выдачей ранее найденных имён).
+    `deadline` — ждать ответа не дольше оставшегося бюджета запроса.
+    """
+    cached_status = None if fresh else availability_cache.get(username)
+    if cached_status is not None:
+        logging.info(f"[CACHE] 🗃️ @{username}: {cached_status}")
+        return cached_status
+
+    if session is None:
+        session = await get_http_session()
+
+    async def fetch_status() -> str:
+        status = await check_username_hedged(session, username)
+        availability_cache.set(username, status)
+        return status
+
+    try:
+        # По дедлайну перестаёт ждать только этот вызов: склеенный запрос продолжится, если его ждут другие
+        return await run_with_deadline(deadline, "fragment", fragment_single_flight.run(username.casefold(), fetch_status))
+    except asyncio.TimeoutError:
+        logging.warning(f"[TIMEOUT] ⏰ @{username}: бюджет запроса исчерпан до ответа.")
+        return UNKNOWN_STATUS
+
+
+class AvailabilityBackend(ABC):
+    """
+    Источник статуса username. Запоминает задержки последних запросов,
+    чтобы по их p90 решать, когда подстраховаться запасным бэкендом.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self.latencies = deque(maxlen=config.HEDGE_LATENCY_WINDOW)
+
+    @abstractmethod
+    async def check(self, session, username: str) -> str:
+        """Статус username по данным бэкенда; UNKNOWN_STATUS — ответ не окончательный."""
+
+    async def timed_check(self, session, username: str) -> str:
+        started_at = time.monotonic()
+        status = await self.check(session, username)
+        self.latencies.append(time.monotonic() - started_at)  # Отменённые запросы в статистику не попадают
+        return status
+
+    def hedge_delay(self) -> float:
+        """p90 задержки; пока замеров мало — HEDGE_DEFAULT_DELAY."""
+        if len(self.latencies) < config.HEDGE_MIN_SAMPLES:
+            return config.HEDGE_DEFAULT_DELAY
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.9))]
+
+
+class FragmentBackend(AvailabilityBackend):
+    """Основной бэкенд: fragment.com (различает свободно / продано / занято / на продаже)."""
+
+    name = "fragment"
+
+    async def check(self, session, username: str) -> str:
+        return await check_username_via_fragment(session, username)
+
+
+class TelegramBackend(AvailabilityBackend):
+    """
+    Запасной бэкенд: страница профиля t.me/<username>.
+    Существующий профиль — надёжный признак "Занято". Отсутствие профиля не значит, что имя свободно
+    (оно может принадлежать Fragment), поэтому в этом случае ответ не окончательный.
+    """
+
+    name = "telegram"
+
+    async def check(self, session, username: str) -> str:
+        url = f"{config.TELEGRAM_BASE_URL}/{username}"
+        try:
+            async with telegram_limiter.slot():
+                async with session.get(url, ssl=SSL_CONTEXT, allow_redirects=True) as response:
+                    if response.status == 429 or response.status >= 500:
+                        telegram_limiter.on_throttle()
+                        return UNKNOWN_STATUS
+                    telegram_limiter.on_success()
+
+                    has_profile = await find_in_body(response, PROFILE_TITLE_MARKER)
+        except asyncio.TimeoutError:
+            telegram_limiter.on_throttle()
+            return UNKNOWN_STATUS
+        except Exception as e:
+            logging.warning(f"[ERROR] ❗ Ошибка запроса t.me @{username}: {e}")
+            return UNKNOWN_STATUS
+
+        if has_profile:
+            logging.info(f"[RESULT] ❌ @{username} занят (профиль t.me).")
+            return "Занято"
+        return UNKNOWN_STATUS
+
+
+PROFILE_TITLE_MARKER = b'class="tgme_page_title"'
+
+
+async def find_in_body(response, marker: bytes) -> bool:
+    """
+    Читает тело ответа кусками (как extract_status_text), пока не встретится `marker`
+    или не прочитано FRAGMENT_MAX_BODY_BYTES. content.read(n) отдаёт только уже пришедшие байты,
+    поэтому маркер из следующего куска им можно пропустить.
+    """
+    body = bytearray()
+    async for chunk in response.content.iter_chunked(config.FRAGMENT_CHUNK_SIZE):
+        search_from = max(0, len(body) - len(marker) + 1)
+        body += chunk
+        if body.find(marker, search_from) != -1:
+            return True
+        if len(body) >= config.FRAGMENT_MAX_BODY_BYTES:
+            break
+    return False
+
+
+AVAILABLE_BACKENDS = {backend.name: backend for backend in (FragmentBackend(), TelegramBackend())}
+
+# Порядок опроса: первый — основной, второй — подстраховка
+availability_backends = [
+    AVAILABLE_BACKENDS[name.strip()] for name in config.AVAILABILITY_BACKENDS.split(",") if name.strip() in AVAILABLE_BACKENDS
+] or [AVAILABLE_BACKENDS["fragment"]]
+
+
+async def check_username_hedged(session, username: str) -> str:
+    """
+    Хеджированная проверка: запрос идёт в основной бэкенд; если за его p90 ответа нет
+    (или ответ не окончательный), параллельно запускается запасной.
+    Берётся первый окончательный ответ, остальные запросы отменяются.
+    """
+    primary = availability_backends[0]
+    if not config.AVAILABILITY_HEDGING or len(availability_backends) < 2:
+        return await primary.timed_check(session, username)
+
+    secondary = availability_backends[1]
+    primary_task = asyncio.create_task(primary.timed_check(session, username))
+    pending = {primary_task}
+
+    try:
+        done, pending = await asyncio.wait(pending, timeout=primary.hedge_delay())
+        if primary_task in done and primary_task.result() != UNKNOWN_STATUS:
+            return primary_task.result()
+
+        logging.info(f"[HEDGE] 🛡️ @{username}: нет быстрого окончательного ответа от {primary.name}, подключаем {secondary.name}")
+        pending.add(asyncio.create_task(secondary.timed_check(session, username)))
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.result() != UNKNOWN_STATUS:
+                    return task.result()
+
+        return UNKNOWN_STATUS
+    finally:
+        for task in pending:
+            task.cancel()
+        # Дожидаемся отменённых запросов, чтобы они не оставались висеть и не теряли исключения
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
 async def check_username_via_fragment(session, username: str) -> str:
     """Проверка статуса через Fragment. Анализирует редирект и 'Unavailable'."""
 
-    # 🔥 Добавляем инициализацию SSL-контекста прямо в функцию
-    ssl_context = ssl.create_default_context()
-    ssl_context.check_hostname = False
-    ssl_context.verify_mode = ssl.CERT_NONE
-
-    url_username = f"https://fragment.com/username/{username}"
-    url_query = f"https://fragment.com/?query={username}"
+    url_username = f"{config.FRAGMENT_BASE_URL}/username/{username}"
+    url_query = f"{config.FRAGMENT_BASE_URL}/?query={username}"
 
     logging.info(f"[CHECK] 🔎 Проверяем final=query. if true > свободно @{username}")
 
     try:
-        async with session.get(url_username, ssl=ssl_context, allow_redirects=True) as response:
-            final_url = str(response.url)
+        if config.FRAGMENT_REDIRECT_PROBE:
+            return await probe_username_via_redirect(session, username, url_username)  # Слот — на каждый свой запрос
 
-            if final_url == url_query:
-                logging.info(f"[RESULT]🔹 @{username} свободно.")
-                return "Свободно"
+        async with fragment_limiter.slot():
+            async with session.get(url_username, ssl=SSL_CONTEXT, allow_redirects=True) as response:
+                if is_throttled_response(response, username):
+                    return "Невозможно определить"
+
+                final_url = str(response.url)
 
-            html = await response.text()
-            return await analyze_username_page(html, username)
+                if final_url == url_query:
+                    logging.info(f"[RESULT]🔹 @{username} свободно.")
+                    return "Свободно"
 
+                return await analyze_username_response(response, username)
+
+    except asyncio.TimeoutError:
+        fragment_limiter.on_throttle()
+        logging.warning(f"[THROTTLE] 🐢 Таймаут запроса @{username}")
+        return "Невозможно определить"
     except Exception as e:
         print(f"[ERROR] ❗ Ошибка запроса @{username}: {e}")
         return "Невозможно определить"
 
 
+async def probe_username_via_redirect(session, username: str, url_username: str) -> str:
+    """
+    Проверка без скачивания страницы: запрос с отключёнными редиректами.
+    Свободное имя Fragment перенаправляет на поиск (?query=username) — это видно по Location,
+    тело не нужно. Страница читается только для несвободных имён, чтобы узнать продано/занято.
+    Каждый из (до двух) запросов идёт через свой слот и токен fragment_limiter.
+    """
+    async with fragment_limiter.slot():
+        async with session.get(url_username, ssl=SSL_CONTEXT, allow_redirects=False) as response:
+            if is_throttled_response(response, username):
+                return "Невозможно определить"
+
+            if response.status not in (301, 302, 303, 307, 308):
+                return await analyze_username_response(response, username)
+
+            location = urljoin(url_username, response.headers.get("Location", ""))
+            await response.read()  # Тело редиректа пустое; дочитываем, чтобы соединение вернулось в пул
+
+    if is_search_redirect(location, username):
+        logging.info(f"[RESULT]🔹 @{username} свободно (по редиректу).")
+        return "Свободно"
+
+    # Редирект не на поиск — статус придётся смотреть на целевой странице (второй запрос — второй токен)
+    async with fragment_limiter.slot():
+        async with session.get(location, ssl=SSL_CONTEXT, allow_redirects=True) as response:
+            if is_throttled_response(response, username):
+                return "Невозможно определить"
+
+            if is_search_redirect(str(response.url), username):
+                logging.info(f"[RESULT]🔹 @{username} свободно.")
+                return "Свободно"
+
+            return await analyze_username_response(response, username)
+
+
+def is_search_redirect(url: str, username: str) -> bool:
+    """Ведёт ли адрес на страницу поиска Fragment по этому username (признак свободного имени)."""
+    parsed = urlparse(url)
+    query = parse_qs(parsed.query).get("query", [])
+    return parsed.path in ("", "/") and len(query) == 1 and query[0].lower() == username.lower()
+
+
+def is_throttled_response(response, username: str) -> bool:
+    """Сообщает ограничителю об исходе запроса. True — Fragment троттлит (429/5xx)."""
+    if response.status == 429 or response.status >= 500:
+        fragment_limiter.on_throttle()
+        logging.warning(f"[THROTTLE] 🐢 Fragment ответил {response.status} для @{username}")
+        return True
+
+    fragment_limiter.on_success()
+    return False
+
+
+# Span статуса на странице username: <span class="tm-section-header-status ...">Sold</span>
+STATUS_SPAN_PATTERN = re.compile(
+    rb'<span[^>]*class="[^"]*\btm-section-header-status\b[^"]*"[^>]*>(.*?)</span>', re.S
+)
+STATUS_SPAN_OVERLAP = 1024  # Сколько байт предыдущего куска пересматривать (span мог разрезаться)
+
+
+async def extract_status_text(response) -> tuple[str | None, bytes]:
+    """
+    Читает тело ответа кусками и останавливается, как только найден span статуса
+    или прочитано FRAGMENT_MAX_BODY_BYTES. Возвращает (текст статуса или None, прочитанные байты).
+    """
+    body = bytearray()
+
+    async for chunk in response.content.iter_chunked(config.FRAGMENT_CHUNK_SIZE):
+        search_from = max(0, len(body) - STATUS_SPAN_OVERLAP)
+        body += chunk
+
+        match = STATUS_SPAN_PATTERN.search(body, search_from)
+        if match:
+            status_text = re.sub(rb"<[^>]+>", b"", match.group(1)).decode("utf-8", errors="replace")
+            return html_lib.unescape(status_text).strip(), bytes(body)
+
+        if len(body) >= config.FRAGMENT_MAX_BODY_BYTES:
+            logging.debug(f"[PARSE] Достигнут лимит {config.FRAGMENT_MAX_BODY_BYTES} байт, span статуса не найден.")
+            break
+
+    return None, bytes(body)
+
+
+async def analyze_username_response(response, username: str) -> str:
+    """
+    Определяет статус по ответу Fragment без полного разбора страницы.
+    BeautifulSoup используется только как запасной вариант, если быстрый поиск не сработал.
+    """
+    status_text, body = await extract_status_text(response)
+    if status_text is not None:
+        return classify_status_text(status_text, username)
+
+    logging.debug(f"[PARSE] Быстрый поиск статуса @{username} не сработал, разбираем через BeautifulSoup.")
+    html = body.decode(response.charset or "utf-8", errors="replace")
+    return await analyze_username_page(html, username)
+
+
 async def analyze_username_page(html: str, username: str) -> str:
     """Анализирует страницу конкретного username на Fragment."""
     soup = BeautifulSoup(html, 'html.parser')
 
     status_element = soup.find("span", class_="tm-section-header-status")
     if status_element:
-        status_text = status_element.text.strip().lower()
-
-        if "available" in status_text:
-            logging.info(f"[RESULT] ⚠️ @{username} доступен для покупки.")
-            return "Доступно для покупки"
-        elif "sold" in status_text:
-            logging.info(f"[RESULT] ❌ @{username} продан.")
-            return "Продано"
-        elif "taken" in status_text:
-            logging.info(f"[RESULT] ❌ @{username} уже занят.")
-            return "Занято"
+        return classify_status_text(status_element.text, username)
+
+    logging.info(f"[WARNING] ⚠️ Статус @{username} не определён.")
+    return "Невозможно определить"
+
+
+def classify_status_text(status_text: str, username: str) -> str:
+    """Переводит текст статуса со страницы Fragment в статус бота."""
+    status_text = status_text.strip().lower()
+
+    if "available" in status_text:
+        logging.info(f"[RESULT] ⚠️ @{username} доступен для покупки.")
+        return "Доступно для покупки"
+    elif "sold" in status_text:
+        logging.info(f"[RESULT] ❌ @{username} продан.")
+        return "Продано"
+    elif "taken" in status_text:
+        logging.info(f"[RESULT] ❌ @{username} уже занят.")
+        return "Занято"
 
     logging.info(f"[WARNING] ⚠️ Статус @{username} не определён.")
     return "Невозможно определить"
@@ -1,32 +1,23 @@
 from aiogram import Bot
-from openai import OpenAI
-from dotenv import load_dotenv
-import os
+from openai import APITimeoutError
 import logging
 import asyncio
 from typing import List
 import re
+from collections import Counter
 from datetime import datetime
 
-from database.database import save_username_to_db
-from services.name_check import check_multiple_usernames, is_valid_username  # Проверка username
+from database.database import save_username_to_db, fetch_username_statuses, fetch_context_category
+from services.taken_filter import is_likely_taken, remember_status, log_filter_stats
+from services.name_check import check_multiple_usernames, check_username, is_valid_username, UNKNOWN_STATUS  # Проверка username
+from services.free_rate import batch_size_for, max_tokens_for, estimate_free_rate, record_pass_rate
+from services.deadline import Deadline, run_with_deadline
+from bot.services.llm_gateway import chat_completion, stream_chat_completion  # Общий асинхронный LLM-шлюз
 
 
 import config
 
 
-# Загрузка переменных окружения и настройка логирования
-load_dotenv()
-
-# Получение ключей API из окружения
-API_KEY = os.getenv("API_KEY")
-BASE_URL = os.getenv("BASE_URL")
-
-# Создание клиента OpenAI для генерации username
-client = OpenAI(api_key=API_KEY, base_url=BASE_URL)
-
-
-
 REJECTION_PATTERNS = [
     r"не могу",
     r"противоречит",
@@ -48,53 +39,174 @@ def is_rejection_response(usernames: List[str]) -> bool:
     return False
 
 
-async def generate_username_list(context: str, style: str | None, n: int = config.GENERATED_USERNAME_COUNT) -> tuple[list[str], str]:
+def build_username_prompt(context: str, style: str | None, n: int, exclude: list[str] | None = None,
+                          taken_patterns: list[str] | None = None) -> str:
     """
-    Генерирует `n` username на основе контекста и стиля (если стиль указан).
-    Возвращает список username (или текст отказа) и категорию.
+    Собирает промпт генерации username (со стилем или без).
+    `exclude` — уже проверенные имена: последние PROMPT_EXCLUSIONS_MAX из них просим не предлагать.
+    `taken_patterns` — замеченные признаки занятых имён (итеративный режим).
     """
-    logging.info(f"🔄 Генерация username: context='{context}', style='{style}', n={n}")
-
     if style:
         prompt = config.PROMPT_WITH_STYLE.format(n=n, context=context, style=style)
-        prompt_type = "WITH STYLE"
     else:
         prompt = config.PROMPT_NO_STYLE.format(n=n, context=context)
-        prompt_type = "NO STYLE"
 
-    response = client.chat.completions.create(
+    if exclude and config.PROMPT_EXCLUSIONS_MAX > 0:
+        prompt += config.PROMPT_EXCLUDE.format(usernames=", ".join(exclude[-config.PROMPT_EXCLUSIONS_MAX:]))
+    if taken_patterns:
+        prompt += config.PROMPT_TAKEN_PATTERNS.format(patterns="; ".join(taken_patterns))
+    return prompt
+
+
+def describe_taken_patterns(taken_usernames: list[str], free_usernames: list[str]) -> list[str]:
+    """
+    Общие признаки занятых username: простые слова, короткие имена, одинаковое начало.
+    Признак попадает в список, если он есть у доли TAKEN_PATTERN_MIN_SHARE занятых имён
+    и среди занятых встречается чаще, чем среди свободных того же запуска, хотя бы на TAKEN_PATTERN_MIN_LIFT
+    (имена от LLM почти всегда короткие и из букв — такой признак ничего не говорит о занятости).
+    """
+    if len(taken_usernames) < config.TAKEN_PATTERN_MIN_COUNT:
+        return []
+
+    def predicts_taken(predicate) -> bool:
+        taken_share = sum(1 for username in taken_usernames if predicate(username)) / len(taken_usernames)
+        # Доля среди свободных со сглаживанием: пока свободных мало, она близка к 1/2, а не к 0
+        free_share = (sum(1 for username in free_usernames if predicate(username)) + 1) / (len(free_usernames) + 2)
+        return taken_share >= config.TAKEN_PATTERN_MIN_SHARE and taken_share - free_share >= config.TAKEN_PATTERN_MIN_LIFT
+
+    patterns = []
+    if predicts_taken(str.isalpha):
+        patterns.append("простые слова без цифр и подчёркиваний")
+    if predicts_taken(lambda username: len(username) <= 7):
+        patterns.append("короткие имена (до 7 символов)")
+    if predicts_taken(lambda username: username.lower().endswith("bot")):
+        patterns.append("имена с окончанием bot")
+
+    prefixes = Counter(username.lower()[:4] for username in taken_usernames if len(username) > 4)
+    if prefixes:
+        prefix, count = prefixes.most_common(1)[0]
+        # Как и остальные признаки — по доле занятых, а не по числу (из 50 занятых 3 с одним началом — не закономерность)
+        if count > 1 and predicts_taken(lambda username: len(username) > 4 and username.lower()[:4] == prefix):
+            patterns.append(f"имена, начинающиеся на '{prefix}'")
+
+    return patterns
+
+
+def llm_timeout(deadline: Deadline | None) -> float:
+    """Таймаут запроса к LLM: LLM_TIMEOUT_NAME, но не дольше оставшегося бюджета."""
+    if deadline is None:
+        return config.LLM_TIMEOUT_NAME
+    return max(0.1, deadline.timeout(config.LLM_TIMEOUT_NAME))
+
+
+LIST_MARKER_PATTERN = re.compile(r"^(?:\d+[.)]|[-*•–])\s*")  # "1." "2)" "-" "*" "•"
+CATEGORY_PREFIX_PATTERN = re.compile(r"^[*_`]*\s*категория\s*[*_`]*\s*:?\s*[*_`]*\s*", re.IGNORECASE)
+SEPARATOR_PATTERN = re.compile(r"[,;]")
+
+
+def is_category_line(line: str, next_line: str | None = None) -> bool:
+    """
+    Первая строка ответа — категория, если она так подписана или выглядит как текст
+    (кириллица, пробелы), а не как элемент списка. Одно латинское слово считается категорией,
+    только если следующая строка — список через запятую.
+    """
+    if CATEGORY_PREFIX_PATTERN.match(line):
+        return True
+    if SEPARATOR_PATTERN.search(line) or LIST_MARKER_PATTERN.match(line) or line.startswith("@"):
+        return False
+    if re.search(r"[а-яА-ЯёЁ]|\s", line):
+        return True
+    return next_line is not None and bool(SEPARATOR_PATTERN.search(next_line))
+
+
+def clean_category(line: str) -> str:
+    return CATEGORY_PREFIX_PATTERN.sub("", line).strip(" *_`'\".") or "Неизвестно"
+
+
+def clean_username_piece(piece: str) -> str:
+    """
+    Приводит элемент списка к username: убирает нумерацию и маркеры, @, кавычки и markdown,
+    а также пояснение после имени ("zenmind — спокойный" → "zenmind").
+    """
+    piece = LIST_MARKER_PATTERN.sub("", piece.strip()).strip(" `*\"'«»")
+    piece = piece.lstrip("@")
+    tokens = piece.split()
+    return tokens[0].strip("`*\"'«».:") if tokens else ""
+
+
+def parse_username_response(text: str, truncated: bool = False) -> tuple[str, list[str], list[str]]:
+    """
+    Разбирает ответ LLM в любом из привычных форматов: через запятую, по одному в строке,
+    нумерованный или маркированный список, с @ или в блоке кода.
+    `truncated` — ответ оборван по max_tokens: незакрытый последний элемент отбрасывается.
+    Возвращает (категория, валидные username без повторов, исходные элементы для проверки на отказ).
+    """
+    lines = [line.strip() for line in text.split("\n")]
+    lines = [line for line in lines if line and not line.startswith("```")]
+
+    category = "Неизвестно"
+    if lines and is_category_line(lines[0], lines[1] if len(lines) > 1 else None) and (
+            len(lines) > 1 or CATEGORY_PREFIX_PATTERN.match(lines[0])):
+        category = clean_category(lines[0])
+        lines = lines[1:]
+    else:
+        logging.warning("⚠️ API не вернул категорию, берем 'Неизвестно'")
+
+    raw_pieces = [piece.strip() for line in lines for piece in SEPARATOR_PATTERN.split(line) if piece.strip()]
+
+    if truncated and raw_pieces and not text.rstrip(" ").endswith((",", ";", "\n")):
+        logging.warning(f"✂️ Ответ обрезан по max_tokens, отбрасываем неполный элемент: '{raw_pieces[-1]}'")
+        raw_pieces.pop()
+
+    usernames = []
+    seen = set()
+    for piece in raw_pieces:
+        username = clean_username_piece(piece)
+        if is_valid_username(username) and username.casefold() not in seen:
+            seen.add(username.casefold())
+            usernames.append(username)
+
+    return category, usernames, raw_pieces
+
+
+async def generate_username_list(context: str, style: str | None, n: int = config.GENERATED_USERNAME_COUNT,
+                                 max_tokens: int = config.MAX_TOKENS, deadline: Deadline | None = None,
+                                 exclude: list[str] | None = None,
+                                 taken_patterns: list[str] | None = None) -> tuple[list[str], str]:
+    """
+    Генерирует `n` username на основе контекста и стиля (если стиль указан).
+    `exclude` и `taken_patterns` — имена и признаки, которых модель просим избегать.
+    `max_tokens` — лимит токенов ответа (растёт вместе с `n`).
+    `deadline` — общий бюджет запроса; по его истечении — asyncio.TimeoutError.
+    Возвращает список username (или текст отказа) и категорию.
+    """
+    logging.info(f"🔄 Генерация username: context='{context}', style='{style}', n={n}")
+
+    prompt = build_username_prompt(context, style, n, exclude, taken_patterns)
+
+    response = await run_with_deadline(deadline, "llm", chat_completion(
         model=config.MODEL_NAME,
         messages=[{"role": "user", "content": prompt}],
-        max_tokens=config.MAX_TOKENS,
+        max_tokens=max_tokens,
         temperature=config.TEMPERATURE_NAME,
-    )
+        timeout=llm_timeout(deadline),
+    ))
 
     logging.debug(f"API Response: {response}")
 
     if response.choices and response.choices[0].message and response.choices[0].message.content:
-        response_text = response.choices[0].message.content.strip()
-        logging.info(f"📝 Полный ответ AI: {response_text}")
-
-        lines = [line.strip() for line in response_text.split("\n") if line.strip()]
+        response_text = response.choices[0].message.content
+        logging.info(f"📝 Полный ответ AI: {response_text.strip()}")
 
-        if len(lines) < 2:
-            logging.warning("⚠️ API не вернул категорию, берем 'Неизвестно'")
-            category = "Неизвестно"
-            usernames_raw = lines[0] if lines else ""
-        else:
-            category = lines[0].replace("Категория:", "").strip()
-            usernames_raw = lines[1]
-
-        raw_usernames = [u.strip() for u in usernames_raw.split(",")]
+        truncated = response.choices[0].finish_reason == "length"
+        category, valid_usernames, raw_usernames = parse_username_response(response_text, truncated=truncated)
 
         # Проверка на текстовый отказ по этическим соображениям
         if is_rejection_response(raw_usernames):
             logging.warning("❌ AI вернул текст отказа по этическим соображениям.")
             return raw_usernames, "Этический отказ"
 
-        # Фильтрация только валидных username
-        valid_usernames = [username for username in raw_usernames if is_valid_username(username)]
-        logging.info(f"✅ категория: {category}, сгенерировано username: {len(valid_usernames)}")
+        logging.info(f"✅ категория: {category}, сгенерировано username: {len(valid_usernames)} из {n} запрошенных")
 
         return valid_usernames, category
 
@@ -104,91 +216,623 @@ async def generate_username_list(context: str, style: str | None, n: int = confi
 
 
 
-async def gen_process_and_check(bot: Bot, context: str, style: str | None, n: int = config.AVAILABLE_USERNAME_COUNT) -> list[str]:
-    logging.info(f"🔎 Поиск {n} доступных username для контекста: '{context}' со стилем: '{style}'")
+async def stream_username_list(context: str, style: str | None, on_username,
+                               n: int = config.GENERATED_USERNAME_COUNT, on_category=None,
+                               max_tokens: int = config.MAX_TOKENS, deadline: Deadline | None = None,
+                               exclude: list[str] | None = None,
+                               taken_patterns: list[str] | None = None) -> tuple[list[str], str]:
+    """
+    Потоковый вариант generate_username_list.
+    Читает ответ LLM по мере генерации и вызывает `on_username(username)` для каждого
+    валидного username, как только закрывается его запятая или перевод строки.
+    Элементы очищаются так же, как в parse_username_response (нумерация, маркеры, @, markdown).
+    Возвращает то же, что generate_username_list: список username (или текст отказа) и категорию.
+    """
+    logging.info(f"🔄 Потоковая генерация username: context='{context}', style='{style}', n={n}")
+
+    prompt = build_username_prompt(context, style, n, exclude, taken_patterns)
+
+    raw_usernames = []
+    valid_usernames = []
+    seen = set()
+    first_line_done = False  # Первая строка разобрана: это категория или уже начало списка
+    category = "Неизвестно"
+    buffer = ""
+    response_text = ""
+    finish_reasons = []
+
+    def take_first_line(line: str):
+        """Первая целая строка ответа: категория или первое имя списка (по одному имени в строке)."""
+        nonlocal first_line_done, category
+        first_line_done = True
+        if is_category_line(line):
+            category = clean_category(line)
+            if on_category:
+                on_category(category)
+        else:
+            emit(line)  # Список по одному имени в строке, без категории
+
+    def emit(piece: str):
+        piece = piece.strip()
+        if not piece or piece.startswith("```"):
+            return
+        raw_usernames.append(piece)
+        username = clean_username_piece(piece)
+        if is_valid_username(username) and username.casefold() not in seen:
+            seen.add(username.casefold())
+            valid_usernames.append(username)
+            on_username(username)
+
+    async for delta in stream_chat_completion(
+        model=config.MODEL_NAME,
+        messages=[{"role": "user", "content": prompt}],
+        max_tokens=max_tokens,
+        temperature=config.TEMPERATURE_NAME,
+        timeout=llm_timeout(deadline),
+        on_finish=finish_reasons.append,
+    ):
+        response_text += delta
+        buffer += delta
+
+        while (match := re.search(r"[,;\n]", buffer)):
+            if not first_line_done:
+                # "Категория: бизнес, финансы" — запятые подписанной категории не разделяют имена, ждём конца строки
+                if match.group() != "\n" and CATEGORY_PREFIX_PATTERN.match(buffer.lstrip()):
+                    match = re.search(r"\n", buffer)
+                    if not match:
+                        break
+
+                line, separator, buffer = buffer[:match.start()].strip(), match.group(), buffer[match.end():]
+                if separator != "\n":
+                    # Разделитель в первой строке — значит, категории нет и это уже список
+                    first_line_done = True
+                    emit(line)
+                elif line and not line.startswith("```"):
+                    take_first_line(line)
+                continue  # Пустые строки и начало блока кода пропускаем
+
+            piece, buffer = buffer[:match.start()], buffer[match.end():]
+            emit(piece)
+
+    # Хвост ответа после последнего разделителя; оборванный по max_tokens — неполное имя, как в parse_username_response
+    if finish_reasons[-1:] == ["length"] and buffer.strip():
+        logging.warning(f"✂️ Ответ обрезан по max_tokens, отбрасываем неполный элемент: '{buffer.strip()}'")
+        buffer = ""
+    if not first_line_done and CATEGORY_PREFIX_PATTERN.match(buffer.strip()):
+        take_first_line(buffer.strip())
+    else:
+        emit(buffer)
+    if category == "Неизвестно":
+        logging.warning("⚠️ API не вернул категорию, берем 'Неизвестно'")
+
+    logging.info(f"📝 Полный ответ AI (поток): {response_text.strip()}")
 
-    available_usernames = set()
-    checked_usernames = set()
-    attempts = 0
-    empty_responses = 0
+    if is_rejection_response(raw_usernames):
+        logging.warning("❌ AI вернул текст отказа по этическим соображениям.")
+        return raw_usernames, "Этический отказ"
 
-    # 📦 Новые метрики
-    total_generated = 0  # Всего сгенерировано username
-    total_free = 0        # Свободные username
-    total_saved = 0       # Добавленные в БД username
+    logging.info(f"✅ категория: {category}, сгенерировано username: {len(valid_usernames)} из {n} запрошенных")
 
-    start_time = datetime.now()  # Засекаем время начала генерации
+    return valid_usernames, category
 
-    while len(available_usernames) < n and attempts < config.GEN_ATTEMPTS:
-        attempts += 1
-        logging.info(f"🔄 Попытка {attempts}/{config.GEN_ATTEMPTS}")
 
-        try:
-            usernames, category = await generate_username_list(context, style or "", n=config.GENERATED_USERNAME_COUNT)
-        except Exception as e:
-            logging.error(f"❌ Ошибка генерации username через OpenAI: {e}")
-            return []
+class GenerationRun:
+    """
+    Общее состояние одного запуска генерации.
+    Разделяется между всеми попытками, в том числе запущенными параллельно.
+    """
 
-        # Проверка на этический отказ
-        if is_rejection_response(usernames):
-            logging.warning("❌ AI вернул текст отказа по этическим соображениям.")
-            return []
+    def __init__(self, context: str, style: str | None, n: int, db_context: str | None = None, on_found=None,
+                 deadline: Deadline | None = None, excluded: list[str] | None = None):
+        self.context = context
+        self.style = style
+        self.n = n
+        self.db_context = db_context or context  # Как записать контекст в БД
+        self.on_found = on_found  # Вызывается для каждого нового свободного username (прогрессивная выдача)
+        self.deadline = deadline  # Общий бюджет времени запроса (None — без ограничения)
+
+        self.available_usernames: list[str] = []  # Свободные username в порядке нахождения
+        self.checked_usernames: set[str] = set()  # Все username, уже отправленные на проверку
+
+        # Исключения сессии (casefold): показанные и проверенные в прошлых раундах.
+        # Пополняются только именами с окончательным статусом или показанными пользователю
+        # (не дождавшиеся проверки и отменённые можно предложить снова) — вызывающий сохраняет их в FSM
+        self.excluded = excluded if excluded is not None else []
+        self._session_keys = frozenset(self.excluded)
+        self._excluded_keys = set(self.excluded)  # Уже в исключениях сессии
+        self._claimed_keys: list[str] = []  # Взятые на проверку в этом запуске (только от повторов внутри запуска)
+        self._claimed_keys_set: set[str] = set()
+        self.prompt_exclusions = list(self.excluded)  # "Не предлагай" в промпте — имена прошлых раундов
+        self.taken_usernames: list[str] = []  # Занятые в этом запуске (для признаков в итеративном промпте)
+        self.attempts = 0
+        self.empty_responses = 0
+        self.stop_reason: str | None = None  # Причина досрочной остановки ("error", "rejected", "empty", "deadline")
+
+        self.done_event = asyncio.Event()  # Выставляется, как только найдено `n` свободных username
+        self.known_category: str | None = None  # Категория этого контекста из прошлых запусков (для оценки доли свободных)
+
+        # 📦 Метрики
+        self.total_generated = 0  # Всего сгенерировано username
+        self.total_free = 0  # Свободные username
+        self.total_saved = 0  # Добавленные в БД username
+        self.total_db_skipped = 0  # Отсеянные пре-проверкой по БД (без запроса к Fragment)
+        self.total_filter_skipped = 0  # Отсеянные фильтром занятых username (без БД и Fragment)
+        self.total_excluded = 0  # Повторы из прошлых раундов сессии (без БД и Fragment)
+
+    @property
+    def is_done(self) -> bool:
+        return len(self.available_usernames) >= self.n
+
+    def next_batch_size(self) -> tuple[int, int]:
+        """
+        Сколько username просить у LLM в следующей попытке и с каким лимитом токенов.
+        При ADAPTIVE_BATCH_ENABLED — по доле свободных для (категория, стиль) и числу недостающих имён,
+        иначе — фиксированные GENERATED_USERNAME_COUNT и MAX_TOKENS.
+        """
+        if not config.ADAPTIVE_BATCH_ENABLED:
+            return config.GENERATED_USERNAME_COUNT, config.MAX_TOKENS
+        batch_size = batch_size_for(self.n - len(self.available_usernames), self.known_category, self.style)
+        return batch_size, max_tokens_for(batch_size)
+
+    def prompt_feedback(self) -> tuple[list[str], list[str]]:
+        """
+        Что сообщить модели в следующей попытке: (имена "не предлагай", признаки занятых).
+        В итеративном режиме (GEN_PROMPT_FEEDBACK) — вместе с проверенными в этом запуске.
+        """
+        if not config.GEN_PROMPT_FEEDBACK:
+            return self.prompt_exclusions, []
+        return self.prompt_exclusions + self._claimed_keys, describe_taken_patterns(self.taken_usernames, self.available_usernames)
+
+    def exclude(self, usernames: list[str]):
+        """Запоминает username в исключениях сессии: статус окончательный или имя показано пользователю."""
+        for key in (username.casefold() for username in usernames):
+            if key not in self._excluded_keys:
+                self._excluded_keys.add(key)
+                self.excluded.append(key)
+
+    def add_taken(self, usernames: list[str]):
+        self.taken_usernames.extend(usernames)
+        self.exclude(usernames)
+
+    def claim(self, username: str) -> bool:
+        """
+        Берёт username на проверку. False — если он уже проверялся в этом запуске
+        или в прошлых раундах сессии: такие имена не уходят ни в БД, ни в Fragment.
+        """
+        key = username.casefold()
+        if key in self._session_keys:
+            self.total_excluded += 1
+            return False
+        if key in self._claimed_keys_set:
+            return False
+
+        self._claimed_keys_set.add(key)
+        self._claimed_keys.append(key)
+        self.checked_usernames.add(username)
+        return True
+
+    def add_available(self, username: str):
+        """Добавляет свободный username, если ещё не набрано `n`."""
+        if self.is_done:
+            return
+        self.available_usernames.append(username)
+        self.exclude([username])
+        self.total_free += 1  # ✅ Учитываем количество свободных username
+        if self.on_found:
+            self.on_found(username)
+        if self.is_done:
+            self.done_event.set()
+
+
+def drop_likely_taken(run: GenerationRun, usernames: list[str]) -> list[str]:
+    """Отбрасывает за O(1) username, которые фильтр занятых считает уже занятыми."""
+    if not config.TAKEN_FILTER_ENABLED:
+        return usernames
+
+    unknown_usernames = [u for u in usernames if not is_likely_taken(u)]
+    run.total_filter_skipped += len(usernames) - len(unknown_usernames)
+    run.add_taken([u for u in usernames if u not in unknown_usernames])
+    return unknown_usernames
+
+
+async def drop_known_taken(run: GenerationRun, usernames: list[str]) -> list[str]:
+    """
+    Сначала отсев фильтром занятых username (без обращения к БД),
+    затем пре-проверка по generated_usernames: одним запросом отбрасывает username,
+    которые уже записаны как занятые/проданные в пределах DB_STATUS_FRESHNESS_DAYS.
+    В Fragment идут только неизвестные или устаревшие имена.
+    """
+    usernames = drop_likely_taken(run, usernames)
 
-        # Если AI не вернул username
-        if not usernames:
-            empty_responses += 1
-            logging.warning(f"⚠️ AI не дал username ({empty_responses}/{config.MAX_EMPTY_RESPONSES})")
+    if not usernames or config.DB_STATUS_FRESHNESS_DAYS <= 0:
+        return usernames
 
-            if empty_responses >= config.MAX_EMPTY_RESPONSES:
-                logging.error("❌ AI отказывается генерировать username. Останавливаем процесс.")
-                break
+    try:
+        known_statuses = await run_with_deadline(
+            run.deadline, "db", fetch_username_statuses(usernames, config.DB_STATUS_FRESHNESS_DAYS)
+        )
+    except asyncio.TimeoutError:
+        return usernames  # Не успели спросить БД — проверим в Fragment, сколько успеем
+    unknown_usernames = [u for u in usernames if known_statuses.get(u.lower()) not in config.TAKEN_STATUSES]
 
-            continue
+    skipped = len(usernames) - len(unknown_usernames)
+    if skipped:
+        run.total_db_skipped += skipped
+        run.add_taken([u for u in usernames if u not in unknown_usernames])
+        logging.info(f"🗄️ Пре-проверка по БД: отсеяно {skipped} из {len(usernames)} username")
 
-        total_generated += len(usernames)  # 📦 Учитываем общее количество сгенерированных username
+    return unknown_usernames
 
-        valid_usernames = [u for u in usernames if u not in checked_usernames and is_valid_username(u)]
-        checked_usernames.update(valid_usernames)
 
-        if not valid_usernames:
-            continue
+class PrecheckBatcher:
+    """
+    Пре-проверка username из потока пачками: имена копятся до DB_PRECHECK_BATCH_SIZE штук
+    или DB_PRECHECK_BATCH_WINDOW секунд, затем вся пачка уходит в drop_known_taken одним запросом.
+    """
 
+    def __init__(self, run: GenerationRun):
+        self.run = run
+        self._pending: dict[str, asyncio.Future] = {}
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self.batches = 0
+
+    async def passes(self, username: str) -> bool:
+        """True — username не отсеян фильтром и БД, его нужно проверить в Fragment."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending[username] = future
+        if len(self._pending) >= config.DB_PRECHECK_BATCH_SIZE:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(config.DB_PRECHECK_BATCH_WINDOW, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            task = asyncio.create_task(self._check(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _check(self, batch: dict[str, asyncio.Future]):
+        self.batches += 1
         try:
-            check_results = await check_multiple_usernames(valid_usernames)
+            unknown_usernames = set(await drop_known_taken(self.run, list(batch)))
         except Exception as e:
-            logging.error(f"❌ Ошибка при проверке username: {e}")
-            continue
+            logging.error(f"❌ Ошибка пре-проверки пачки username: {e}")
+            unknown_usernames = set(batch)  # Проверим в Fragment
+        for username, future in batch.items():
+            if not future.done():  # Проверка username могла быть уже отменена
+                future.set_result(username in unknown_usernames)
+
+    async def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        for future in self._pending.values():
+            future.cancel()
+        self._pending = {}
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+async def stream_and_check_usernames(run: GenerationRun) -> tuple[list[str], str, dict]:
+    """
+    Потоковая попытка: каждый username отправляется на проверку через Fragment сразу,
+    как только LLM его дописала, так что проверки идут параллельно с генерацией.
+    Если `n` свободных имён набрано раньше, чем закончился ответ, поток прерывается.
+    Возвращает (username, категория, {username: статус}).
+    """
+    check_tasks: dict[str, asyncio.Task] = {}
+    stream_category = ["Неизвестно"]  # Категория, если поток придётся прервать досрочно
+    prechecker = PrecheckBatcher(run)
+
+    async def check_and_collect(username: str) -> str | None:
+        if not await prechecker.passes(username):
+            return None
+        result = await check_username(username, deadline=run.deadline)
+        if result == "Свободно":
+            run.add_available(username)
+        elif result != UNKNOWN_STATUS:
+            run.exclude([username])
+        return result
+
+    def on_username(username: str):
+        if run.is_done or not run.claim(username):
+            return
+        check_tasks[username] = asyncio.create_task(check_and_collect(username))
+
+    def on_category(category: str):
+        stream_category[0] = category
+
+    batch_size, max_tokens = run.next_batch_size()
+    exclude, taken_patterns = run.prompt_feedback()
+    stream_task = asyncio.create_task(stream_username_list(
+        run.context, run.style or "", on_username, n=batch_size, on_category=on_category, max_tokens=max_tokens,
+        deadline=run.deadline, exclude=exclude, taken_patterns=taken_patterns
+    ))
+    done_task = asyncio.create_task(run.done_event.wait())
+    stream_started_at = datetime.now()
+
+    def remaining() -> float | None:
+        return run.deadline.remaining if run.deadline else None
+
+    try:
+        await asyncio.wait({stream_task, done_task}, timeout=remaining(), return_when=asyncio.FIRST_COMPLETED)
+        if run.deadline:
+            run.deadline.stage_time["llm"] += (datetime.now() - stream_started_at).total_seconds()
+
+        if stream_task.done():
+            usernames, category = stream_task.result()
+            # Дожидаемся оставшихся проверок (или момента, когда свободных уже достаточно)
+            pending_checks = {task for task in check_tasks.values() if not task.done()}
+            while pending_checks and not run.is_done:
+                done, _ = await asyncio.wait({done_task, *pending_checks}, timeout=remaining(), return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break  # Бюджет исчерпан; недождавшиеся проверки отменятся ниже
+                pending_checks = {task for task in pending_checks if not task.done()}
+        elif done_task.done():
+            logging.info("⚡ Свободных username достаточно — прерываем поток генерации.")
+            usernames, category = list(check_tasks), stream_category[0]
+        else:
+            logging.warning("⏰ Бюджет запроса исчерпан — прерываем поток генерации.")
+            run.deadline.record_timeout("llm")
+            usernames, category = list(check_tasks), stream_category[0]
+    finally:
+        for task in (stream_task, done_task, *check_tasks.values()):
+            if not task.done():
+                task.cancel()
+        await asyncio.gather(stream_task, done_task, *check_tasks.values(), return_exceptions=True)
+        await prechecker.close()
+        logging.info(f"🗄️ Пре-проверка потока: {len(check_tasks)} username в {prechecker.batches} запросах к БД")
+
+    check_results = {
+        username: task.result()
+        for username, task in check_tasks.items()
+        if task.done() and not task.cancelled() and task.exception() is None and task.result() is not None
+    }
+    return usernames, category, check_results
+
+
+# Фоновые записи статусов отменённых попыток (ссылки держим, чтобы задачи не собрал GC)
+background_saves: set[asyncio.Task] = set()
+
+
+async def run_generation_attempt(run: GenerationRun, attempt: int, max_attempts: int) -> str:
+    """
+    Одна попытка: запрос к LLM, проверка через Fragment, запись в БД.
+    Возвращает исход попытки: "ok", "empty", "rejected", "error" или "deadline".
+    """
+    logging.info(f"🔄 Попытка {attempt}/{max_attempts}")
+
+    if config.GEN_STREAMING:
+        return await run_streaming_attempt(run)
+
+    try:
+        batch_size, max_tokens = run.next_batch_size()
+        exclude, taken_patterns = run.prompt_feedback()
+        usernames, category = await generate_username_list(
+            run.context, run.style or "", n=batch_size, max_tokens=max_tokens, deadline=run.deadline,
+            exclude=exclude, taken_patterns=taken_patterns
+        )
+    except (asyncio.TimeoutError, APITimeoutError):
+        # Таймаут клиента LLM тоже ограничен остатком бюджета и может сработать раньше wait_for
+        logging.warning("⏰ LLM не ответила до истечения бюджета запроса.")
+        return "deadline"
+    except Exception as e:
+        logging.error(f"❌ Ошибка генерации username через OpenAI: {e}")
+        return "error"
+
+    # Проверка на этический отказ
+    if is_rejection_response(usernames):
+        logging.warning("❌ AI вернул текст отказа по этическим соображениям.")
+        return "rejected"
+
+    # Если AI не вернул username
+    if not usernames:
+        run.empty_responses += 1
+        logging.warning(f"⚠️ AI не дал username ({run.empty_responses}/{config.MAX_EMPTY_RESPONSES})")
+        return "empty"
+
+    run.total_generated += len(usernames)  # 📦 Учитываем общее количество сгенерированных username
+
+    # Общий для всех попыток набор: параллельные попытки и повторные раунды не проверяют одно имя дважды
+    valid_usernames = [u for u in usernames if is_valid_username(u) and run.claim(u)]
+
+    valid_usernames = await drop_known_taken(run, valid_usernames)
+
+    if not valid_usernames:
+        return "ok"
+
+    checked = {}
+
+    def on_result(username: str, result: str):
+        checked[username] = result
+        # Свободное имя засчитывается сразу, не дожидаясь самой медленной проверки пачки
+        if result == "Свободно":
+            run.add_available(username)
+        elif result != UNKNOWN_STATUS:
+            run.exclude([username])  # Статус окончательный, даже если пачку не дождёмся до конца бюджета
+
+    try:
+        check_results = await check_multiple_usernames(valid_usernames, deadline=run.deadline, on_result=on_result)
+    except asyncio.CancelledError:
+        # Попытку отменили (свободных уже достаточно): уже полученные статусы всё равно сохраняем, в фоне
+        if checked:
+            task = asyncio.create_task(save_check_results(run, checked, category))
+            background_saves.add(task)
+            task.add_done_callback(background_saves.discard)
+        raise
+    except Exception as e:
+        logging.error(f"❌ Ошибка при проверке username: {e}")
+        return "ok"
+
+    await save_check_results(run, check_results, category)
+    return "ok"
+
+
+async def run_streaming_attempt(run: GenerationRun) -> str:
+    """Потоковая попытка (GEN_STREAMING): генерация и проверки Fragment идут внахлёст."""
+    try:
+        usernames, category, check_results = await stream_and_check_usernames(run)
+    except APITimeoutError:
+        logging.warning("⏰ LLM не ответила до истечения бюджета запроса.")
+        return "deadline"
+    except Exception as e:
+        logging.error(f"❌ Ошибка потоковой генерации username через OpenAI: {e}")
+        return "error"
+
+    if is_rejection_response(usernames):
+        logging.warning("❌ AI вернул текст отказа по этическим соображениям.")
+        return "rejected"
+
+    if not usernames:
+        run.empty_responses += 1
+        logging.warning(f"⚠️ AI не дал username ({run.empty_responses}/{config.MAX_EMPTY_RESPONSES})")
+        return "empty"
+
+    run.total_generated += len(usernames)
+
+    await save_check_results(run, check_results, category)
+    return "ok"
+
+
+async def save_check_results(run: GenerationRun, check_results: dict, category: str):
+    """Сохраняет результаты проверки попытки в БД."""
+    for username, result in check_results.items():
+        remember_status(username, result)
+    run.add_taken([u for u, result in check_results.items() if result in config.TAKEN_STATUSES])
+    # Остальные окончательные статусы ("Доступно для покупки" и т.п.) тоже не проверяем повторно;
+    # свободные — только если показаны (add_available), "Невозможно определить" — можно проверить снова
+    run.exclude([u for u, result in check_results.items() if result not in ("Свободно", UNKNOWN_STATUS)])
+
+    tasks = [
+        save_username_to_db(username=username, status=result, category=category, context=run.db_context, style=run.style, llm=config.MODEL_NAME)
+        for username, result in check_results.items()
+    ]
+
+    if tasks:
+        saving = asyncio.gather(*tasks)
+        try:
+            # shield: ни отмена лишней спекулятивной попытки, ни конец бюджета не должны терять уже проверенные статусы —
+            # по дедлайну перестаём ждать только мы, запись дописывается в фоне
+            await run_with_deadline(run.deadline, "db", asyncio.shield(saving))
+            run.total_saved += len(tasks)  # 🗄️ Учитываем количество добавленных в БД
+        except asyncio.TimeoutError:
+            logging.warning(f"[TIMEOUT] ⏰ Запись {len(tasks)} статусов в БД не успела за бюджет, дописывается в фоне.")
+            saving.add_done_callback(log_background_save)
+        except Exception as e:
+            logging.error(f"❌ Ошибка при записи в БД: {e}")
 
-        tasks = []
-        for username, result in check_results.items():
-            if result == "Свободно" and len(available_usernames) < n:
-                available_usernames.add(username)
-                total_free += 1  # ✅ Учитываем количество свободных username
 
-            tasks.append(
-                save_username_to_db(username=username, status=result, category=category, context=context, style=style, llm=config.MODEL_NAME)
-            )
+def log_background_save(saving: asyncio.Future):
+    """Итог записи в БД, которую перестали ждать по дедлайну (иначе её ошибка потеряется)."""
+    if not saving.cancelled() and saving.exception() is not None:
+        logging.error(f"❌ Ошибка при фоновой записи в БД: {saving.exception()}")
 
-        if tasks:
-            try:
-                await asyncio.gather(*tasks)
-                total_saved += len(tasks)  # 🗄️ Учитываем количество добавленных в БД
-            except Exception as e:
-                logging.error(f"❌ Ошибка при записи в БД: {e}")
 
-        if len(available_usernames) >= n:
-            break
+async def gen_process_and_check(bot: Bot, context: str, style: str | None, n: int = config.AVAILABLE_USERNAME_COUNT,
+                                db_context: str | None = None, on_found=None,
+                                deadline: Deadline | None = None, excluded: list[str] | None = None) -> list[str]:
+    """
+    Ищет `n` свободных username.
+    `db_context` — как записать контекст в БД (по умолчанию сам контекст).
+    `on_found(username)` вызывается сразу после подтверждения каждого свободного имени.
+    `deadline` — общий бюджет запроса: по его истечении возвращаются уже проверенные свободные имена.
+    `excluded` — исключения сессии (casefold); пополняется именами этого запуска с окончательным статусом
+    и найденными свободными (непроверенные и отменённые туда не попадают).
+    При GEN_SPECULATIVE_FANOUT > 1 держит одновременно до K попыток генерации и отменяет
+    оставшиеся, как только найдено достаточно свободных имён. Общее число запросов к LLM
+    ограничено GEN_ATTEMPTS и GEN_MAX_LLM_CALLS.
+    """
+    fanout = max(1, config.GEN_SPECULATIVE_FANOUT)
+    max_attempts = min(config.GEN_ATTEMPTS, config.GEN_MAX_LLM_CALLS)
+    logging.info(f"🔎 Поиск {n} доступных username для контекста: '{context}' со стилем: '{style}' (параллельно: {fanout})")
+
+    run = GenerationRun(context, style, n, db_context=db_context, on_found=on_found, deadline=deadline,
+                        excluded=excluded)
+    if config.ADAPTIVE_BATCH_ENABLED:
+        try:
+            run.known_category = await run_with_deadline(deadline, "db", fetch_context_category(context))
+        except asyncio.TimeoutError:
+            pass  # Возьмём оценку по стилю
+        logging.info(
+            f"📈 Оценка доли свободных для '{run.known_category}' / '{style}': "
+            f"{estimate_free_rate(run.known_category, style):.0%}, размер запроса {run.next_batch_size()[0]}"
+        )
+    pending = set()
+    done_task = asyncio.create_task(run.done_event.wait())  # Свободных достаточно — остальные попытки не ждём
+    start_time = datetime.now()  # Засекаем время начала генерации
+
+    try:
+        while not run.is_done and run.stop_reason is None:
+            if deadline and deadline.expired:
+                logging.warning(f"⏰ Бюджет {deadline.budget:g} сек. исчерпан — отдаём найденные username.")
+                run.stop_reason = "deadline"
+                break
+
+            # Добираем попытки до K одновременно, не выходя за лимит запросов
+            while len(pending) < fanout and run.attempts < max_attempts:
+                run.attempts += 1
+                pending.add(asyncio.create_task(run_generation_attempt(run, run.attempts, max_attempts)))
+
+            if not pending:
+                break
+
+            done, _ = await asyncio.wait(
+                {*pending, done_task}, timeout=deadline.remaining if deadline else None, return_when=asyncio.FIRST_COMPLETED
+            )
+            done.discard(done_task)
+            pending -= done
+
+            for task in done:
+                outcome = task.result()
+                if outcome in ("error", "rejected", "deadline"):
+                    run.stop_reason = outcome
+                elif outcome == "empty" and run.empty_responses >= config.MAX_EMPTY_RESPONSES:
+                    logging.error("❌ AI отказывается генерировать username. Останавливаем процесс.")
+                    run.stop_reason = outcome
+    finally:
+        # Отменяем оставшиеся спекулятивные попытки (и при истечении бюджета или внешней отмене)
+        done_task.cancel()
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            logging.info(f"🛑 Отменено незавершённых попыток: {len(pending)}")
 
     duration = (datetime.now() - start_time).total_seconds()  # ⏱️ Общее время генерации
 
+    # Доля ответа LLM, дошедшая до Fragment (остальное отсеяно заранее и в статистику БД не попадает)
+    record_pass_rate(
+        style, run.total_generated, len(run.checked_usernames) - run.total_filter_skipped - run.total_db_skipped
+    )
+
     # 📊 Итоговый лог
     logging.info(
-        f"📊 Итог генерации: {attempts} попыток, "
-        f"{total_generated} сгенерировано, "
-        f"{total_free} свободных, "
-        f"{total_saved} добавлено в БД, "
-        f"{len(available_usernames)} отправлено пользователю. "
+        f"📊 Итог генерации: {run.attempts} попыток, "
+        f"{run.total_generated} сгенерировано, "
+        f"{run.total_free} свободных, "
+        f"{run.total_filter_skipped} отсеяно фильтром, "
+        f"{run.total_excluded} повторов из прошлых раундов, "
+        f"{run.total_db_skipped} отсеяно по БД, "
+        f"{run.total_saved} добавлено в БД, "
+        f"{len(run.available_usernames)} отправлено пользователю, "
+        f"{run.attempts / max(1, run.total_free):.1f} попыток на свободное имя"
+        f"{' (итеративный промпт)' if config.GEN_PROMPT_FEEDBACK else ''}. "
         f"⏱️ {duration:.2f} сек."
     )
+    if config.TAKEN_FILTER_ENABLED:
+        log_filter_stats()
+    if deadline:
+        deadline.log_stats()
+
+    # При ошибке отдаём уже проверенные свободные имена, как и по истечении бюджета
+    if run.stop_reason == "rejected":
+        return []
 
-    return list(available_usernames)
+    return list(run.available_usernames)
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+from collections import deque
+
+from database.database import fetch_top_categories, fetch_context_category
+from services.name_check import check_multiple_usernames, fragment_limiter, UNKNOWN_STATUS
+from services.deadline import Deadline, run_with_deadline
+from services.name_gen import gen_process_and_check
+
+import config
+
+# Запас заранее найденных и проверенных свободных username: (категория, стиль) -> очередь
+inventory: dict[tuple[str, str | None], deque] = {}
+stocked_categories: list[str] = []
+
+# Префикс контекста для записей инвентаря в БД (не учитываются при подсчёте частых категорий)
+INVENTORY_DB_CONTEXT = "[inventory] {category}"
+
+_worker_task = None
+
+# 📦 Метрики
+inventory_hits = 0
+inventory_misses = 0
+
+
+def inventory_styles() -> list[str | None]:
+    """Без стиля (кнопка "🎲 Приступить") и каждый стиль из STYLE_DESCRIPTIONS."""
+    return [None, *config.STYLE_DESCRIPTIONS]
+
+
+async def match_category(context: str, deadline: Deadline | None = None) -> str | None:
+    """
+    Подбирает категорию из инвентаря для контекста запроса: по истории этого же контекста в БД
+    или по вхождению названия категории в текст.
+    """
+    if not stocked_categories:
+        return None
+
+    try:
+        category = await run_with_deadline(deadline, "db", fetch_context_category(context))
+    except asyncio.TimeoutError:
+        category = None  # Не успели спросить БД — ищем по тексту
+    if category in stocked_categories:
+        return category
+
+    context_lower = context.lower()
+    for category in stocked_categories:
+        if category.lower() in context_lower:
+            return category
+    return None
+
+
+async def take_verified_from_inventory(context: str, style: str | None, n: int,
+                                       deadline: Deadline | None = None) -> list[str]:
+    """
+    Выдаёт до `n` username из инвентаря подходящей категории и стиля
+    после быстрой перепроверки (мимо кэша). Занятые за это время имена отбрасываются.
+    """
+    global inventory_hits, inventory_misses
+
+    category = await match_category(context, deadline)
+    bucket = inventory.get((category, style)) if category else None
+    if not bucket:
+        inventory_misses += 1
+        return []
+
+    candidates = [bucket.popleft() for _ in range(min(n, len(bucket)))]
+    results = await check_multiple_usernames(candidates, fresh=True, deadline=deadline)
+    usernames = [username for username in candidates if results.get(username) == "Свободно"]
+    # Не успевшие перепроверку имена возвращаются в запас
+    bucket.extendleft(reversed([u for u in candidates if results.get(u) == UNKNOWN_STATUS]))
+
+    inventory_hits += 1
+    logging.info(
+        f"🗃️ Инвентарь '{category}' / '{style}': выдано {len(usernames)} из {len(candidates)} "
+        f"(осталось {len(bucket)}, попаданий {inventory_hits}, промахов {inventory_misses})"
+    )
+    return usernames
+
+
+async def refresh_stocked_categories():
+    """Обновляет список частых категорий и создаёт для них очереди."""
+    global stocked_categories
+    categories = await fetch_top_categories(config.INVENTORY_TOP_CATEGORIES)
+    if categories:
+        stocked_categories = categories
+
+    for category in stocked_categories:
+        for style in inventory_styles():
+            inventory.setdefault((category, style), deque())
+
+
+def find_bucket_to_refill():
+    """Самая пустая очередь, в которой меньше INVENTORY_TARGET_SIZE имён."""
+    keys = [key for key in inventory if key[0] in stocked_categories and len(inventory[key]) < config.INVENTORY_TARGET_SIZE]
+    return min(keys, key=lambda key: len(inventory[key]), default=None)
+
+
+async def refill_bucket(category: str, style: str | None):
+    bucket = inventory[(category, style)]
+    deficit = config.INVENTORY_TARGET_SIZE - len(bucket)
+
+    usernames = await gen_process_and_check(
+        None, category, style, n=deficit, db_context=INVENTORY_DB_CONTEXT.format(category=category)
+    )
+    known = {username.casefold() for queue in inventory.values() for username in queue}
+    for username in usernames:
+        if username.casefold() not in known:
+            bucket.append(username)
+
+    logging.info(f"🗃️ Инвентарь '{category}' / '{style}': пополнен до {len(bucket)}")
+
+
+async def run_inventory_worker():
+    """
+    Фоновое пополнение инвентаря. Работает только в простое: пока ограничитель Fragment
+    занят запросами пользователей, пополнение откладывается.
+    """
+    logging.info("🗃️ Фоновое пополнение инвентаря username запущено.")
+    refreshed_at = None
+
+    while True:
+        try:
+            now = asyncio.get_running_loop().time()
+            if refreshed_at is None or now - refreshed_at >= config.INVENTORY_CATEGORY_REFRESH:
+                await refresh_stocked_categories()
+                refreshed_at = now
+
+            key = find_bucket_to_refill()
+            if key is not None and fragment_limiter.is_idle:
+                await refill_bucket(*key)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"❌ Ошибка пополнения инвентаря: {e}")
+
+        await asyncio.sleep(config.INVENTORY_REFILL_INTERVAL)
+
+
+def start_inventory_worker():
+    """Запускает фоновое пополнение инвентаря (из on_startup)."""
+    global _worker_task
+    if _worker_task is None:
+        _worker_task = asyncio.create_task(run_inventory_worker())
+
+
+async def stop_inventory_worker():
+    global _worker_task
+    if _worker_task is not None:
+        _worker_task.cancel()
+        await asyncio.gather(_worker_task, return_exceptions=True)
+        _worker_task = None
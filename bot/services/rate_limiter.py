@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+
+class AdaptiveRateLimiter:
+    """
+    Ограничитель исходящих запросов на весь процесс: token bucket + лимит одновременных запросов.
+    Скорость подстраивается по AIMD: после каждого успешного ответа растёт на `increase_step`
+    запросов/сек, а при 429/5xx или таймауте умножается на `decrease_factor`.
+    """
+
+    def __init__(self, name: str, rate: float, min_rate: float, max_rate: float, burst: int,
+                 max_concurrency: int, increase_step: float, decrease_factor: float,
+                 decrease_cooldown: float = 1.0):
+        self.name = name
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown  # Пачка одновременных 429 снижает скорость один раз
+
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._last_decrease_at = 0.0
+        self._lock = asyncio.Lock()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        # 📦 Метрики
+        self.waiting = 0  # Текущая глубина очереди
+        self.max_waiting = 0
+        self.in_flight = 0
+        self.acquired = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.throttled = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def _take_token(self):
+        async with self._lock:
+            while True:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    async def acquire(self):
+        """Ждёт свободный слот и токен. Время ожидания попадает в метрики."""
+        started_at = time.monotonic()
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            await self._semaphore.acquire()
+            try:
+                await self._take_token()
+            except BaseException:
+                self._semaphore.release()
+                raise
+        finally:
+            self.waiting -= 1
+
+        waited = time.monotonic() - started_at
+        self.in_flight += 1
+        self.acquired += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def on_success(self):
+        """Аддитивное увеличение скорости после успешного ответа."""
+        self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_throttle(self):
+        """Мультипликативное снижение скорости при 429/5xx или таймауте."""
+        self.throttled += 1
+        now = time.monotonic()
+        if now - self._last_decrease_at < self.decrease_cooldown:
+            return
+        self._last_decrease_at = now
+        self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+        logging.warning(f"🐢 {self.name}: признаки троттлинга, снижаем скорость до {self.rate:.1f} запр/сек")
+
+    @property
+    def is_idle(self) -> bool:
+        return self.waiting == 0 and self.in_flight == 0
+
+    @property
+    def avg_wait(self) -> float:
+        return self.total_wait / self.acquired if self.acquired else 0.0
+
+    def log_stats(self):
+        logging.info(
+            f"🚦 {self.name}: {self.rate:.1f} запр/сек, в очереди {self.waiting} (макс {self.max_waiting}), "
+            f"в работе {self.in_flight}, ожидание ср. {self.avg_wait:.3f} / макс {self.max_wait:.3f} сек, "
+            f"троттлинг {self.throttled}"
+        )
@@ -0,0 +1,47 @@
+import asyncio
+
+
+class SingleFlight:
+    """
+    Склеивает одновременные вызовы с одинаковым ключом: пока первый запрос выполняется,
+    остальные ждут его результат, а не запускают свой.
+    Отмена одного ожидающего не задевает остальных; запрос отменяется только тогда,
+    когда его перестали ждать все.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, list] = {}  # key -> [задача, число ожидающих]
+
+        # 📦 Метрики
+        self.started = 0  # Реально запущенные запросы
+        self.shared = 0  # Вызовы, получившие результат чужого запроса
+
+    async def run(self, key: str, coro_factory):
+        """Выполняет `coro_factory()` для ключа или присоединяется к уже идущему вызову."""
+        call = self._calls.get(key)
+        if call is None:
+            call = [asyncio.create_task(coro_factory()), 0]
+            self._calls[key] = call
+            call[0].add_done_callback(lambda _task: self._forget(key, call))
+            self.started += 1
+        else:
+            self.shared += 1
+
+        call[1] += 1
+        try:
+            # shield: отмена этого ожидающего не отменяет общую задачу
+            return await asyncio.shield(call[0])
+        finally:
+            call[1] -= 1
+            if call[1] == 0 and not call[0].done():
+                # Все ожидающие сдались — сам запрос больше никому не нужен
+                self._forget(key, call)
+                call[0].cancel()
+
+    def _forget(self, key: str, call: list):
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._calls)
@@ -0,0 +1,125 @@
+import asyncio
+import hashlib
+import logging
+import math
+
+from database.database import fetch_taken_usernames
+
+import config
+
+
+class BloomFilter:
+    """
+    Фильтр Блума: компактное множество с ложноположительными срабатываниями и без ложноотрицательных.
+    Размер битового массива и число хэшей подбираются под ожидаемую ёмкость и долю ошибок.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))  # Бит
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, key: str):
+        added = False
+        for position in self._positions(key):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                self.bits[byte] |= 1 << bit
+                added = True
+        if added:
+            self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position // 8] & (1 << (position % 8)) for position in self._positions(key))
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self.bits)
+
+    @property
+    def false_positive_rate(self) -> float:
+        """Оценка текущей доли ложных срабатываний: (1 - e^(-k*n/m))^k."""
+        return (1 - math.exp(-self.hash_count * self.count / self.size)) ** self.hash_count
+
+
+# Фильтр username со статусом "Занято"/"Продано" за последние TAKEN_FILTER_WINDOW_DAYS дней
+# (ключ — username в нижнем регистре). Из фильтра Блума нельзя удалять, поэтому устаревшие записи
+# уходят при перестроении раз в TAKEN_FILTER_REBUILD_INTERVAL: новый фильтр строится из БД и подменяет старый.
+taken_filter = BloomFilter(config.TAKEN_FILTER_CAPACITY, config.TAKEN_FILTER_ERROR_RATE)
+taken_filter_loaded = False
+_building_filter: BloomFilter | None = None  # Строящийся фильтр (получает и новые статусы, пока идёт загрузка)
+_load_task = None
+
+
+def remember_status(username: str, status: str):
+    """Добавляет username в фильтр (и в строящийся, если идёт перестроение), если он занят или продан."""
+    if status in config.TAKEN_STATUSES:
+        taken_filter.add(username.lower())
+        if _building_filter is not None:
+            _building_filter.add(username.lower())
+
+
+def is_likely_taken(username: str) -> bool:
+    return username.lower() in taken_filter
+
+
+def log_filter_stats():
+    logging.info(
+        f"🧮 Фильтр занятых username: {taken_filter.count} записей, "
+        f"{taken_filter.memory_bytes / 1024:.0f} КБ, хэшей {taken_filter.hash_count}, "
+        f"ложные срабатывания ≈ {taken_filter.false_positive_rate:.2%} "
+        f"({'загружен' if taken_filter_loaded else 'загружается'})"
+    )
+
+
+async def load_taken_filter():
+    """Строит новый фильтр из свежих занятых username в generated_usernames и подменяет им текущий."""
+    global taken_filter, taken_filter_loaded, _building_filter
+    _building_filter = BloomFilter(config.TAKEN_FILTER_CAPACITY, config.TAKEN_FILTER_ERROR_RATE)
+    loaded = 0
+    try:
+        async for username in fetch_taken_usernames(config.TAKEN_FILTER_WINDOW_DAYS):
+            _building_filter.add(username.lower())
+            loaded += 1
+            if loaded % 10000 == 0:
+                await asyncio.sleep(0)  # Не держим event loop на больших таблицах
+    except Exception as e:
+        logging.error(f"❌ Ошибка при загрузке фильтра занятых username: {e}")
+        return
+    finally:
+        new_filter, _building_filter = _building_filter, None
+
+    taken_filter = new_filter
+    taken_filter_loaded = True
+    log_filter_stats()
+
+
+async def run_taken_filter_rebuilder():
+    while True:
+        await load_taken_filter()
+        await asyncio.sleep(config.TAKEN_FILTER_REBUILD_INTERVAL)
+
+
+def start_taken_filter_loading():
+    """Запускает построение фильтра в фоне (из on_startup), не задерживая старт бота, и его перестроение."""
+    global _load_task
+    if _load_task is None:
+        _load_task = asyncio.create_task(run_taken_filter_rebuilder())
+
+
+async def stop_taken_filter_loading():
+    global _load_task
+    if _load_task is not None:
+        _load_task.cancel()
+        await asyncio.gather(_load_task, return_exceptions=True)
+        _load_task = None
@@ -0,0 +1,15 @@
+import os
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Модули бота импортируются и как bot.services.*, и как services.* (из папки bot)
+for path in (ROOT, ROOT / "bot"):
+    if str(path) not in sys.path:
+        sys.path.insert(0, str(path))
+
+# Обязательные переменные config.py, без которых он не импортируется
+os.environ.setdefault("GENERATED_USERNAME_COUNT", "10")
+os.environ.setdefault("GEN_ATTEMPTS", "3")
+os.environ.setdefault("GEN_TIMEOUT", "30")
@@ -0,0 +1,47 @@
+"""Синтетическая страница username Fragment для тестов и bench_fragment_parse.py."""
+
+
+# Синтетическая страница username в разметке Fragment: шапка со статусом и длинная таблица ставок после неё
+FRAGMENT_PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>@{username} – Fragment</title>
+<script>var ajInit = {{"version": 1, "apiUrl": "/api?hash=0"}};</script></head>
+<body class="emoji_image no-transition">
+<div class="tm-main">
+  <section class="tm-section">
+    <div class="tm-section-header">
+      <h1 class="tm-section-header-domain"><span class="subdomain">@{username}</span></h1>
+      <span class="tm-section-header-status tm-status-{css}">{status}</span>
+    </div>
+    <div class="tm-section-bid-info">
+      {bids}
+    </div>
+  </section>
+</div></body></html>
+"""
+BID_ROW = (
+    '<tr><td><div class="table-cell"><div class="table-cell-value tm-value icon-before icon-ton">{price}</div></div></td>'
+    '<td><div class="table-cell"><a href="/address/EQ{n:040d}" class="tm-wallet">EQ{n:040d}</a></div></td></tr>'
+)
+
+
+def fragment_page(username: str, css: str, status: str, bids: int = 300) -> bytes:
+    rows = "\n".join(BID_ROW.format(price=f"{1000 + n:,}", n=n) for n in range(bids))
+    return FRAGMENT_PAGE.format(username=username, css=css, status=status, bids=f"<table>{rows}</table>").encode()
+
+
+class FakeContent:
+    def __init__(self, body: bytes):
+        self.body = body
+        self.chunks_read = 0
+
+    async def iter_chunked(self, size: int):
+        for start in range(0, len(self.body), size):
+            self.chunks_read += 1
+            yield self.body[start:start + size]
+
+
+class FakeResponse:
+    charset = "utf-8"
+
+    def __init__(self, body: bytes):
+        self.content = FakeContent(body)
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from bot.services.brand_ask_ai import parse_ai_response
+
+
+@pytest.mark.parametrize("count", [3, 9, 12])
+def test_legacy_format_keeps_every_numbered_option(count):
+    lines = ["Комментарий: отличная идея"] + [f"{i}. 🚀 **Вариант {i}**: описание {i}" for i in range(1, count + 1)]
+
+    parsed = parse_ai_response("\n".join(lines))
+
+    assert parsed["answer"] == "отличная идея"
+    assert [option["short"] for option in parsed["options"]] == [f"🚀 Вариант {i}" for i in range(1, count + 1)]
+    assert parsed["options"][-1]["full"] == f"<b>🚀 Вариант {count}</b>: описание {count}"
+
+
+def test_new_format_keeps_every_numbered_option():
+    lines = ["Тэглайн: быстро и просто", "Описание: сервис доставки"] + [f"{i}. Проект {i} — описание {i}" for i in range(1, 13)]
+
+    parsed = parse_ai_response("\n".join(lines))
+
+    assert parsed["answer"] == "быстро и просто"
+    assert len(parsed["options"]) == 12
+
+
+def test_json_mode_applies_only_to_stage_requests(monkeypatch):
+    from types import SimpleNamespace
+
+    from bot import config
+    from bot.services import brand_ask_ai
+    from bot.services.brand_json import JSON_INSTRUCTION
+
+    requests = []
+
+    async def fake_completion(**kwargs):
+        requests.append(kwargs)
+        content = '{"answer": "идея", "description": "", "options": [{"title": "Вариант", "details": "описание"}]}'
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+    monkeypatch.setattr(config, "BRAND_JSON_OUTPUT", True)
+    monkeypatch.setattr(config, "BRAND_JSON_MODE", "json_object")
+    monkeypatch.setattr(brand_ask_ai, "chat_completion", fake_completion)
+
+    asyncio.run(brand_ask_ai.ask_ai("Придумай идею"))
+    parsed, _ = asyncio.run(brand_ask_ai.get_parsed_response_with_usage("Этап 1", stage="stage1"))
+
+    idea_request, stage_request = requests
+    assert JSON_INSTRUCTION not in idea_request["messages"][-1]["content"]
+    assert idea_request["response_format"] is None
+    assert stage_request["messages"][-1]["content"].endswith(JSON_INSTRUCTION)
+    assert stage_request["response_format"] == {"type": "json_object"}
+    assert parsed["options"][0]["short"] == "Вариант"
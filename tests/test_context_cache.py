@@ -0,0 +1,45 @@
+from services.context_cache import ContextSimilarityCache
+
+
+def make_cache() -> ContextSimilarityCache:
+    return ContextSimilarityCache(max_size=10, ttl=600, threshold=0.5, num_hashes=64, shingle_size=3)
+
+
+def test_lookup_similar_context_is_hit():
+    cache = make_cache()
+    cache.store("бот для медитации", None, ["zenmind", "calmora"])
+
+    usernames, similarity = cache.lookup("медитация бот", None)
+
+    assert usernames == ["zenmind", "calmora"]
+    assert similarity >= 0.5
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_lookup_with_everything_excluded_is_miss():
+    cache = make_cache()
+    cache.store("бот для медитации", None, ["zenmind", "calmora"])
+
+    usernames, _ = cache.lookup("бот для медитации", None, exclude=["ZenMind", "calmora"])
+
+    assert usernames == []
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+def test_lookup_skips_exhausted_entry_for_next_similar_one():
+    cache = make_cache()
+    cache.store("бот для медитации", None, ["zenmind"])
+    cache.store("бот для медитации и йоги", None, ["calmora"])
+
+    usernames, _ = cache.lookup("бот для медитации", None, exclude=["zenmind"])
+
+    assert usernames == ["calmora"]
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_lookup_other_style_is_miss():
+    cache = make_cache()
+    cache.store("бот для медитации", "деловой", ["zenmind"])
+
+    assert cache.lookup("бот для медитации", None) == ([], 0.0)
+    assert cache.misses == 1
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+import config
+from services import name_check
+
+from fragment_pages import FakeResponse, fragment_page
+
+STATUSES = [
+    ("taken", "Taken", "Занято"),
+    ("sold", "Sold", "Продано"),
+    ("avail", "Available", "Доступно для покупки"),
+    ("auction", "On&nbsp;auction", "Невозможно определить"),
+]
+
+
+def regex_status(body: bytes, username: str) -> tuple[str, int]:
+    response = FakeResponse(body)
+    status = asyncio.run(name_check.analyze_username_response(response, username))
+    return status, response.content.chunks_read
+
+
+def soup_status(body: bytes, username: str) -> str:
+    return asyncio.run(name_check.analyze_username_page(body.decode(), username))
+
+
+@pytest.mark.parametrize("chunk_size", [64, 1000, 8192])
+@pytest.mark.parametrize("css, text, expected", STATUSES)
+def test_regex_matches_beautifulsoup(monkeypatch, chunk_size, css, text, expected):
+    monkeypatch.setattr(config, "FRAGMENT_CHUNK_SIZE", chunk_size)  # Мелкие куски режут span статуса на границе
+    body = fragment_page("zenmind", css, text)
+
+    status, chunks_read = regex_status(body, "zenmind")
+
+    assert status == soup_status(body, "zenmind") == expected
+    assert chunks_read * chunk_size < len(body) // 2  # Таблица после шапки не дочитывается
+
+
+def test_page_without_status_falls_back_to_beautifulsoup(monkeypatch):
+    monkeypatch.setattr(config, "FRAGMENT_MAX_BODY_BYTES", 4096)
+    body = fragment_page("zenmind", "taken", "Taken").replace(b"tm-section-header-status", b"tm-section-header-label")
+
+    assert regex_status(body, "zenmind")[0] == soup_status(body, "zenmind") == "Невозможно определить"
+
+
+def test_status_found_without_beautifulsoup(monkeypatch):
+    def no_soup(*args, **kwargs):
+        raise AssertionError("BeautifulSoup не должен вызываться, если span статуса найден")
+
+    monkeypatch.setattr(name_check, "BeautifulSoup", no_soup)
+
+    assert regex_status(fragment_page("zenmind", "sold", "Sold"), "zenmind")[0] == "Продано"
@@ -0,0 +1,163 @@
+import asyncio
+import time
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+import config
+from services import name_check
+from services.availability_stub import FRAGMENT_PAGE, fragment_app, telegram_app
+
+SLOW_DELAY = 1.5
+
+
+async def start_stub() -> tuple[list[web.AppRunner], str, str]:
+    """Поднимает заглушки Fragment и t.me на свободных портах."""
+    runners, urls = [], []
+    for app in (fragment_app(SLOW_DELAY), telegram_app()):
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        runners.append(runner)
+        urls.append(f"http://127.0.0.1:{port}")
+    return runners, urls[0], urls[1]
+
+
+def backend_tasks() -> list[asyncio.Task]:
+    """Незавершённые запросы к бэкендам (после проверки их остаться не должно)."""
+    return [
+        task for task in asyncio.all_tasks()
+        if not task.done() and "timed_check" in task.get_coro().__qualname__
+    ]
+
+
+def run_hedged(monkeypatch, usernames: list[str]) -> tuple[dict, dict, list]:
+    """Проверяет имена через check_username_hedged против заглушки: (статусы, время, висящие задачи)."""
+    async def scenario():
+        runners, fragment_url, telegram_url = await start_stub()
+        monkeypatch.setattr(config, "FRAGMENT_BASE_URL", fragment_url)
+        monkeypatch.setattr(config, "TELEGRAM_BASE_URL", telegram_url)
+        statuses, elapsed = {}, {}
+        try:
+            async with aiohttp.ClientSession() as session:
+                for username in usernames:
+                    started_at = time.monotonic()
+                    statuses[username] = await name_check.check_username_hedged(session, username)
+                    elapsed[username] = time.monotonic() - started_at
+                leftover = backend_tasks()
+        finally:
+            for runner in runners:
+                await runner.cleanup()
+        return statuses, elapsed, leftover
+
+    monkeypatch.setattr(config, "AVAILABILITY_HEDGING", True)
+    monkeypatch.setattr(config, "HEDGE_DEFAULT_DELAY", 0.2)
+    monkeypatch.setattr(name_check, "availability_backends",
+                        [name_check.AVAILABLE_BACKENDS["fragment"], name_check.AVAILABLE_BACKENDS["telegram"]])
+    for backend in name_check.availability_backends:
+        monkeypatch.setattr(backend, "latencies", type(backend.latencies)(maxlen=backend.latencies.maxlen))
+    return asyncio.run(scenario())
+
+
+def test_hedge_statuses_from_primary(monkeypatch):
+    statuses, _, leftover = run_hedged(monkeypatch, ["freename", "soldname", "salename", "takenname"])
+
+    assert statuses == {
+        "freename": "Свободно",
+        "soldname": "Продано",
+        "salename": "Доступно для покупки",
+        "takenname": "Занято",
+    }
+    assert leftover == []
+
+
+def test_hedge_answers_from_secondary_when_primary_is_slow(monkeypatch):
+    statuses, elapsed, leftover = run_hedged(monkeypatch, ["slowname"])
+
+    assert statuses["slowname"] == "Занято"  # Ответ профиля t.me, не дожидаясь Fragment
+    assert elapsed["slowname"] < SLOW_DELAY
+    assert leftover == []  # Проигравший запрос к Fragment отменён и дождан
+
+
+def test_hedge_falls_back_to_secondary_on_throttle(monkeypatch):
+    statuses, _, leftover = run_hedged(monkeypatch, ["busyname"])
+
+    assert statuses["busyname"] == "Занято"
+    assert leftover == []
+
+
+def test_redirect_probe_takes_token_per_request(monkeypatch):
+    """Редирект не на поиск требует второго запроса — и второго токена ограничителя."""
+    async def username_page(request: web.Request) -> web.Response:
+        username = request.match_info["username"]
+        if username.startswith("free"):
+            raise web.HTTPFound(f"/?query={username}")
+        raise web.HTTPFound(f"/page/{username}")
+
+    async def target_page(request: web.Request) -> web.Response:
+        return web.Response(text=FRAGMENT_PAGE.format(css="sold", status="Sold"), content_type="text/html")
+
+    async def scenario() -> dict:
+        app = web.Application()
+        app.add_routes([web.get("/username/{username}", username_page), web.get("/page/{username}", target_page)])
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        monkeypatch.setattr(config, "FRAGMENT_BASE_URL", f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}")
+
+        tokens = {}
+        try:
+            async with aiohttp.ClientSession() as session:
+                for username in ("freename", "soldname"):
+                    acquired = name_check.fragment_limiter.acquired
+                    status = await name_check.check_username_via_fragment(session, username)
+                    tokens[username] = (status, name_check.fragment_limiter.acquired - acquired)
+        finally:
+            await runner.cleanup()
+        return tokens
+
+    monkeypatch.setattr(config, "FRAGMENT_REDIRECT_PROBE", True)
+    tokens = asyncio.run(scenario())
+
+    assert tokens == {"freename": ("Свободно", 1), "soldname": ("Продано", 2)}
+    assert name_check.fragment_limiter.in_flight == 0
+
+
+def test_telegram_profile_found_in_later_chunk(monkeypatch):
+    """Профиль, пришедший вторым куском тела, всё равно распознаётся как "Занято"."""
+    async def profile_page(request: web.Request) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/html"})
+        await response.prepare(request)
+        await response.write(b"<html><head>" + b"<meta name=\"x\">" * 200 + b"</head>")
+        await asyncio.sleep(0.05)
+        await response.write(f'<body><div class="tgme_page_title">{request.match_info["username"]}</div></body></html>'.encode())
+        await response.write_eof()
+        return response
+
+    async def scenario() -> str:
+        app = web.Application()
+        app.add_routes([web.get("/{username}", profile_page)])
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        monkeypatch.setattr(config, "TELEGRAM_BASE_URL", f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}")
+        try:
+            async with aiohttp.ClientSession() as session:
+                return await name_check.AVAILABLE_BACKENDS["telegram"].check(session, "takenname")
+        finally:
+            await runner.cleanup()
+
+    assert asyncio.run(scenario()) == "Занято"
+
+
+def test_backend_requires_check():
+    class Incomplete(name_check.AvailabilityBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
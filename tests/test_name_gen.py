@@ -0,0 +1,235 @@
+import asyncio
+
+import httpx
+import pytest
+from openai import APITimeoutError
+
+from services import name_gen
+from services.name_check import is_valid_username
+from services.name_gen import parse_username_response
+
+
+FORMAT_SAMPLES = [
+    ("Бизнес\nzenmind, calmora, brightpath", "Бизнес", ["zenmind", "calmora", "brightpath"]),
+    ("Категория: Бизнес\n1. zenmind\n2) calmora\n3. brightpath", "Бизнес", ["zenmind", "calmora", "brightpath"]),
+    ("Бизнес\n- zenmind\n* calmora\n• brightpath", "Бизнес", ["zenmind", "calmora", "brightpath"]),
+    ("Бизнес\n@zenmind, @calmora, @brightpath", "Бизнес", ["zenmind", "calmora", "brightpath"]),
+    ("Бизнес\n```\nzenmind\ncalmora\nbrightpath\n```", "Бизнес", ["zenmind", "calmora", "brightpath"]),
+    ("**Категория:** бизнес, финансы\nzenmind, calmora", "бизнес, финансы", ["zenmind", "calmora"]),
+    ("zenmind, calmora, brightpath", "Неизвестно", ["zenmind", "calmora", "brightpath"]),
+    ("Бизнес\n1. zenmind — спокойный\n2. calmora — мягкий", "Бизнес", ["zenmind", "calmora"]),
+    ("Бизнес\nzenmind, ZenMind, calmora", "Бизнес", ["zenmind", "calmora"]),
+]
+
+
+@pytest.mark.parametrize("text, category, usernames", FORMAT_SAMPLES)
+def test_parse_username_response_formats(text, category, usernames):
+    parsed_category, parsed_usernames, _ = parse_username_response(text)
+
+    assert parsed_category == category
+    assert parsed_usernames == usernames
+
+
+def test_parse_username_response_drops_truncated_tail():
+    text = "Бизнес\nzenmind, calmora, brightp"
+
+    assert parse_username_response(text, truncated=True)[1] == ["zenmind", "calmora"]
+    assert parse_username_response(text + ",", truncated=True)[1] == ["zenmind", "calmora", "brightp"]
+    assert parse_username_response(text)[1] == ["zenmind", "calmora", "brightp"]
+
+
+def legacy_parse(text: str) -> list[str]:
+    """Прежний разбор generate_username_list: строка 0 — категория, строка 1 — список через запятую."""
+    lines = [line.strip() for line in text.strip().split("\n") if line.strip()]
+    raw = lines[0] if len(lines) < 2 else lines[1]
+    return [username for username in (u.strip() for u in raw.split(",")) if is_valid_username(username)]
+
+
+def test_parser_yield_is_not_lower_than_legacy():
+    legacy_total = new_total = 0
+    for text, _, _ in FORMAT_SAMPLES:
+        # Уникальные имена: повтор с другим регистром — не лишнее свободное имя
+        legacy_yield = len({username.casefold() for username in legacy_parse(text)})
+        new_yield = len(parse_username_response(text)[1])
+        assert new_yield >= legacy_yield, text
+        legacy_total += legacy_yield
+        new_total += new_yield
+
+    assert new_total >= 2 * legacy_total  # Нумерованные, маркированные и построчные списки раньше терялись
+
+
+def stream_usernames(monkeypatch, chunks: list[str], finish_reason: str = "stop") -> tuple[list[str], str, list[str]]:
+    """Прогоняет stream_username_list по заданным кускам ответа: (username, категория, имена по мере потока)."""
+    async def fake_stream(on_finish=None, **kwargs):
+        for chunk in chunks:
+            yield chunk
+        on_finish(finish_reason)
+
+    monkeypatch.setattr(name_gen, "stream_chat_completion", fake_stream)
+    streamed = []
+    usernames, category = asyncio.run(name_gen.stream_username_list("кофейня", None, streamed.append))
+    return usernames, category, streamed
+
+
+@pytest.mark.parametrize("text", [
+    "Бизнес\nzenmind, calmora, brightpath",
+    "Категория: бизнес, финансы\nzenmind, calmora, brightpath",
+    "```\nКатегория: бизнес, финансы\n1. zenmind\n2. calmora\n3. brightpath\n```",
+    "zenmind, calmora, brightpath",
+])
+def test_stream_matches_batch_parser(monkeypatch, text):
+    category, expected, _ = parse_username_response(text)
+    chunks = [text[i:i + 3] for i in range(0, len(text), 3)]
+
+    usernames, stream_category, streamed = stream_usernames(monkeypatch, chunks)
+
+    assert stream_category == category
+    assert usernames == expected
+    assert streamed == expected
+
+
+def test_stream_drops_tail_cut_by_max_tokens(monkeypatch):
+    chunks = ["Бизнес\nzenmind, ", "calmora, brightp"]
+
+    assert stream_usernames(monkeypatch, chunks, finish_reason="length")[0] == ["zenmind", "calmora"]
+    assert stream_usernames(monkeypatch, chunks)[0] == ["zenmind", "calmora", "brightp"]
+
+
+def test_stream_category_with_commas_is_not_a_list(monkeypatch):
+    usernames, category, _ = stream_usernames(monkeypatch, ["Категория: бизнес,", " финансы\nzen", "mind, calmora"])
+
+    assert category == "бизнес, финансы"
+    assert usernames == ["zenmind", "calmora"]
+
+
+def test_taken_prefix_pattern_needs_share_of_taken():
+    common = ["zenamind", "zenaflow", "zenapath"]
+    others = [f"brand{i}name" for i in range(7)] + [f"other{i}tag" for i in range(7)]
+
+    assert "имена, начинающиеся на 'zena'" in name_gen.describe_taken_patterns(common, [])
+    assert not any("начинающиеся" in pattern for pattern in name_gen.describe_taken_patterns(common + others, []))
+
+
+def test_taken_pattern_must_be_rarer_among_free_names():
+    taken = ["zenmind", "calmora", "brightly", "lumora"]
+
+    # Свободные имена того же вида: признак не отличает занятые от свободных
+    assert name_gen.describe_taken_patterns(taken, ["novaly", "quietly", "solaris", "mintly"]) == []
+    # Свободные — с цифрами и подчёркиваниями: "простые слова" действительно чаще занимают
+    assert "простые слова без цифр и подчёркиваний" in name_gen.describe_taken_patterns(
+        taken, ["zen_mind", "calm2go", "bright_ly1", "lumo_ra"]
+    )
+
+
+def test_save_check_results_stops_waiting_at_deadline(monkeypatch):
+    saved = []
+
+    async def slow_save(username: str, **kwargs):
+        await asyncio.sleep(0.3)
+        saved.append(username)
+
+    async def scenario() -> tuple[float, list, list]:
+        run = name_gen.GenerationRun("кофейня", None, 3, deadline=name_gen.Deadline(0.05))
+        started_at = asyncio.get_running_loop().time()
+        await name_gen.save_check_results(run, {"zenmind": "Занято", "calmora": "Свободно"}, "Бизнес")
+        waited = asyncio.get_running_loop().time() - started_at
+        saved_in_time = list(saved)
+        await asyncio.sleep(0.4)  # Запись дописывается в фоне
+        return waited, saved_in_time, run.deadline.stage_timeouts["db"]
+
+    monkeypatch.setattr(name_gen, "save_username_to_db", slow_save)
+    monkeypatch.setattr(name_gen, "remember_status", lambda username, status: None)
+    waited, saved_in_time, db_timeouts = asyncio.run(scenario())
+
+    assert waited < 0.3
+    assert saved_in_time == []
+    assert sorted(saved) == ["calmora", "zenmind"]
+    assert db_timeouts == 1
+
+
+def test_run_returns_once_enough_free_names_are_confirmed(monkeypatch):
+    saved = []
+
+    async def fake_generate(*args, **kwargs):
+        return ["freeone", "freetwo", "freethree", "slowname"], "Бизнес"
+
+    async def fake_check(usernames, deadline=None, on_result=None, **kwargs):
+        async def check_one(username: str) -> str:
+            await asyncio.sleep(5 if username.startswith("slow") else 0.1)
+            on_result(username, "Свободно")
+            return "Свободно"
+        return dict(zip(usernames, await asyncio.gather(*(check_one(username) for username in usernames))))
+
+    async def fake_statuses(usernames, freshness_days):
+        return {}
+
+    async def fake_save(username: str, **kwargs):
+        saved.append(username)
+
+    async def scenario() -> tuple[list[str], float]:
+        started_at = asyncio.get_running_loop().time()
+        usernames = await name_gen.gen_process_and_check(None, "кофейня", None, n=3)
+        elapsed = asyncio.get_running_loop().time() - started_at
+        await asyncio.sleep(0.05)  # Фоновая запись статусов отменённой попытки
+        return usernames, elapsed
+
+    monkeypatch.setattr(name_gen.config, "GEN_STREAMING", False)
+    monkeypatch.setattr(name_gen.config, "GEN_SPECULATIVE_FANOUT", 1)
+    monkeypatch.setattr(name_gen, "generate_username_list", fake_generate)
+    monkeypatch.setattr(name_gen, "check_multiple_usernames", fake_check)
+    monkeypatch.setattr(name_gen, "fetch_username_statuses", fake_statuses)
+    monkeypatch.setattr(name_gen, "save_username_to_db", fake_save)
+    monkeypatch.setattr(name_gen, "remember_status", lambda username, status: None)
+    monkeypatch.setattr(name_gen, "is_likely_taken", lambda username: False)
+    usernames, elapsed = asyncio.run(scenario())
+
+    assert usernames == ["freeone", "freetwo", "freethree"]
+    assert elapsed < 1
+    assert sorted(saved) == ["freeone", "freethree", "freetwo"]  # Статусы отменённой попытки не потерялись
+
+
+@pytest.mark.parametrize("failure, stop_reason", [
+    (RuntimeError("provider down"), "error"),
+    (APITimeoutError(request=httpx.Request("POST", "https://llm.local")), "deadline"),
+])
+def test_run_keeps_found_names_when_later_attempt_fails(monkeypatch, failure, stop_reason):
+    calls = []
+
+    async def fake_generate(*args, **kwargs):
+        calls.append(1)
+        if len(calls) > 1:
+            raise failure
+        return ["freeone", "takenone"], "Бизнес"
+
+    async def fake_check(usernames, deadline=None, on_result=None, **kwargs):
+        results = {username: "Свободно" if username.startswith("free") else "Занято" for username in usernames}
+        for username, status in results.items():
+            on_result(username, status)
+        return results
+
+    async def fake_statuses(usernames, freshness_days):
+        return {}
+
+    async def fake_save(username: str, **kwargs):
+        pass
+
+    stop_reasons = []
+    original_attempt = name_gen.run_generation_attempt
+
+    async def recording_attempt(run, attempt, max_attempts):
+        outcome = await original_attempt(run, attempt, max_attempts)
+        stop_reasons.append(outcome)
+        return outcome
+
+    monkeypatch.setattr(name_gen.config, "GEN_STREAMING", False)
+    monkeypatch.setattr(name_gen.config, "GEN_SPECULATIVE_FANOUT", 1)
+    monkeypatch.setattr(name_gen, "generate_username_list", fake_generate)
+    monkeypatch.setattr(name_gen, "check_multiple_usernames", fake_check)
+    monkeypatch.setattr(name_gen, "fetch_username_statuses", fake_statuses)
+    monkeypatch.setattr(name_gen, "save_username_to_db", fake_save)
+    monkeypatch.setattr(name_gen, "remember_status", lambda username, status: None)
+    monkeypatch.setattr(name_gen, "is_likely_taken", lambda username: False)
+    monkeypatch.setattr(name_gen, "run_generation_attempt", recording_attempt)
+
+    assert asyncio.run(name_gen.gen_process_and_check(None, "кофейня", None, n=3)) == ["freeone"]
+    assert stop_reasons == ["ok", stop_reason]